@@ -8,8 +8,15 @@ from fastapi.staticfiles import StaticFiles
 
 from routes import recognition, users, logs, config
 from database import init_database, SessionLocal
+from core.access_log_sink import get_access_log_sink
+from core.batcher import get_recognition_batcher
+from core.enrolment import get_bulk_enroller
 from core.face_engine import get_face_engine
+from core.inference_pool import get_inference_pool
 from core.model_downloader import ModelDownloader
+from core.motion import MotionGate
+from core.retention import get_retention_job
+from core.snapshot_writer import get_snapshot_writer
 from utils.file_utils import ensure_directories
 from utils.logger import setup_logger, get_logger
 
@@ -83,15 +90,22 @@ async def startup_event():
         logger.info("🤖 Initializing face recognition engine...")
         engine = get_face_engine()
 
-        # Step 5: Load face database into memory
+        # Step 5: Start inference worker pool
+        pool = get_inference_pool()
+        logger.info(f"✓ Inference pool ready ({pool.workers} workers)")
+
+        # Step 6: Load face database into memory
         logger.info("💾 Loading face database into memory...")
         db = SessionLocal()
         try:
             engine.load_face_database(db)
-            logger.info(f"✓ Loaded {len(engine.face_database)} user features")
+            logger.info(f"✓ Loaded {len(engine.gallery)} user features")
         finally:
             db.close()
 
+        # Step 7: Start access log retention
+        get_retention_job().start()
+
         logger.info("=" * 60)
         logger.info("✅ System ready! Access API at http://localhost:8000")
         logger.info("📖 API docs available at http://localhost:8000/docs")
@@ -102,6 +116,18 @@ async def startup_event():
         raise
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release background resources on application shutdown."""
+    await get_recognition_batcher().close()
+    # Before the pool: a running job finishes its chunk on the pool workers
+    get_bulk_enroller().close()
+    get_inference_pool().shutdown()
+    get_snapshot_writer().close()
+    get_access_log_sink().close()
+    get_retention_job().close()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
@@ -122,7 +148,17 @@ async def health_check():
             "ulfd": engine.ulfd_session is not None,
             "arcface": engine.arcface_session is not None
         },
-        "users_in_database": len(engine.face_database)
+        "sessions": engine.session_info,
+        "users_in_database": engine.gallery.identity_count,
+        "templates_in_database": len(engine.gallery),
+        "gallery_generation": engine.gallery_generation,
+        "inference_pool": get_inference_pool().stats(),
+        "batcher": get_recognition_batcher().stats(),
+        "snapshots": get_snapshot_writer().stats(),
+        "access_log": get_access_log_sink().stats(),
+        "motion": MotionGate.totals(),
+        "retention": get_retention_job().stats(),
+        "enrolment": get_bulk_enroller().stats()
     }
 
 
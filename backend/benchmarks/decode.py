@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of frame decoding for detection.
+
+Compares a full-resolution decode followed by the ULFD resize with the
+reduced-resolution JPEG path of ``FrameImage`` (DCT-domain scaling for
+detection, a second reduced decode for the face crop).
+
+Usage (from the backend directory):
+
+    python -m benchmarks.decode --frames 20
+"""
+import argparse
+import io
+import time
+from typing import Callable, Tuple
+import numpy as np
+from PIL import Image
+
+from core import preprocess
+from utils.image_utils import FrameImage
+
+SIZES = {"720p": (1280, 720), "1080p": (1920, 1080), "4K": (3840, 2160)}
+
+
+def synthetic_jpeg(size: Tuple[int, int], quality: int = 90) -> bytes:
+    """A smooth synthetic scene (noise compresses unrealistically badly)."""
+    width, height = size
+    x = np.linspace(0, 8 * np.pi, width, dtype=np.float32)
+    y = np.linspace(0, 6 * np.pi, height, dtype=np.float32)[:, None]
+    pixels = np.stack([np.sin(x + y), np.cos(x * 0.5 - y), np.sin(x * y / 40)], axis=2)
+    buffer = io.BytesIO()
+    Image.fromarray(((pixels + 1) * 127.5).astype(np.uint8)).save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def best_ms(fn: Callable, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark frame decoding")
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--face", type=int, default=300,
+                        help="Face width in pixels at 1080p (scaled with the frame)")
+    args = parser.parse_args()
+
+    print(f"decode + ULFD input + one face crop per frame ({args.face} px face at 1080p)")
+    for name, size in SIZES.items():
+        data = synthetic_jpeg(size)
+        width, height = size
+        side = args.face * width / 1920
+        box = [width * 0.45, height * 0.3, side, side * 1.2]
+
+        def full():
+            image = Image.open(io.BytesIO(data)).convert("RGB")
+            preprocess.prepare_batch([image], preprocess.ULFD_INPUT, reuse=False)
+            preprocess.crop(image, box).resize((112, 112), Image.BILINEAR)
+
+        def reduced():
+            frame = FrameImage(data)
+            preprocess.prepare_batch([frame], preprocess.ULFD_INPUT, reuse=False)
+            preprocess.crop(frame, box).resize((112, 112), Image.BILINEAR)
+
+        # Decodes the reduced path actually made
+        frame = FrameImage(data)
+        preprocess.prepare_batch([frame], preprocess.ULFD_INPUT, reuse=False)
+        preprocess.crop(frame, box)
+        decodes = list(frame._decoded)
+        full_mb = width * height * 3 / 1e6
+        reduced_mb = sum(w * h for w, h in decodes) * 3 / 1e6
+
+        print(f"  {name:5s} ({len(data) / 1e3:6.0f} KB JPEG)")
+        print(f"    full decode     {best_ms(full, args.frames):8.2f} ms/frame  "
+              f"{full_mb:6.2f} MB decoded")
+        print(f"    reduced decode  {best_ms(reduced, args.frames):8.2f} ms/frame  "
+              f"{reduced_mb:6.2f} MB decoded  ({', '.join(f'{w}x{h}' for w, h in decodes)})")
+
+
+if __name__ == "__main__":
+    main()
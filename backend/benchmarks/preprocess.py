@@ -0,0 +1,96 @@
+"""
+Micro-benchmark of model input preprocessing.
+
+Compares the original per-frame pipeline (resize, float32 copy, subtract,
+divide, transpose, expand_dims, astype) with ``core.preprocess``, reporting
+time per frame and the memory allocated per frame (traced peak).
+
+Usage (from the backend directory):
+
+    python -m benchmarks.preprocess --frames 200 --width 1280 --height 720
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable, Dict
+import numpy as np
+from PIL import Image
+
+from core import preprocess
+
+
+def legacy_ulfd(image: Image.Image) -> np.ndarray:
+    resized = image.resize((320, 240), Image.BILINEAR)
+    img_array = np.array(resized, dtype=np.float32)
+    normalized = (img_array - 127.0) / 128.0
+    img_chw = np.transpose(normalized, (2, 0, 1))
+    return np.expand_dims(img_chw, axis=0).astype(np.float32)
+
+
+def legacy_arcface(image: Image.Image) -> np.ndarray:
+    resized = image.resize((112, 112), Image.BILINEAR)
+    img_array = np.array(resized, dtype=np.float32)
+    normalized = (img_array - 127.5) / 127.5
+    return np.expand_dims(normalized, axis=0).astype(np.float32)
+
+
+def legacy_frame(frame: Image.Image, box) -> None:
+    legacy_ulfd(frame)
+    x, y, w, h = box
+    legacy_arcface(frame.crop((int(x), int(y), int(x + w), int(y + h))))
+
+
+def pipeline_frame(frame: np.ndarray, box) -> None:
+    preprocess.prepare_batch([frame], preprocess.ULFD_INPUT)
+    preprocess.prepare_batch([preprocess.crop(frame, box)], preprocess.ARCFACE_INPUT)
+
+
+def measure(fn: Callable, frame, box, frames: int) -> Dict[str, float]:
+    """Best time per frame and traced allocation peak of one frame."""
+    fn(frame, box)  # warm up (allocates the reusable buffers once)
+
+    # Best of several rounds, to keep scheduler noise out of the comparison
+    elapsed = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(frames):
+            fn(frame, box)
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(frame, box)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ms_per_frame": elapsed / frames * 1000, "peak_kb_per_frame": peak / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model input preprocessing")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, size=(args.height, args.width, 3), dtype=np.uint8)
+    box = [args.width * 0.4, args.height * 0.3, args.width * 0.2, args.height * 0.35]
+
+    # Both pipelines must produce the same tensors
+    ulfd = preprocess.prepare_batch([pixels], preprocess.ULFD_INPUT, reuse=False)
+    assert np.allclose(ulfd, legacy_ulfd(Image.fromarray(pixels)), atol=1e-6)
+
+    results = {
+        "legacy (PIL frame)": measure(legacy_frame, Image.fromarray(pixels), box, args.frames),
+        "preprocess (PIL frame)": measure(pipeline_frame, Image.fromarray(pixels), box, args.frames),
+        "preprocess (uint8 frame)": measure(pipeline_frame, pixels, box, args.frames),
+    }
+
+    print(f"{args.width}x{args.height} frame, ULFD + one ArcFace crop, {args.frames} frames")
+    for name, result in results.items():
+        print(f"  {name:26s} {result['ms_per_frame']:7.3f} ms/frame   "
+              f"{result['peak_kb_per_frame']:9.1f} KiB allocated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Write-behind buffer for access log entries.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from core import access_stats
+from core.settings import Settings
+from database import AccessLog, SessionLocal
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AccessLogSink:
+    """
+    Collects access log entries in memory and inserts them in bulk.
+
+    A background thread flushes the buffer in one transaction (one SQLite
+    fsync) whenever ``flush_size`` entries are pending or the oldest pending
+    entry is ``flush_interval_ms`` old. Entries become visible to
+    ``/api/logs`` once their batch is committed; the hourly statistics
+    rollups are updated in the same transaction.
+
+    A batch that fails because the database is unavailable (locked, disk
+    full) is kept for the next flush, which waits ``flush_interval_ms`` and
+    then twice as long after each further failure, up to
+    ``MAX_RETRY_DELAY`` seconds. Any other failure is blamed on the
+    entries: the batch is retried in halves so the valid entries are
+    written, and entries that fail on their own are logged and dropped.
+    """
+
+    # Longest wait between flush attempts while the database is unavailable
+    MAX_RETRY_DELAY = 30.0
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 flush_size: int = 100, flush_interval_ms: int = 1000, max_pending: int = 10000):
+        """
+        Args:
+            session_factory: Creates the database sessions used for flushing
+            flush_size: Pending entries that trigger an immediate flush
+            flush_interval_ms: Longest time an entry waits before being flushed
+            max_pending: Entries kept while the database is unavailable;
+                beyond that the oldest are discarded
+        """
+        self.session_factory = session_factory
+        self.flush_size = flush_size
+        self.flush_interval_ms = flush_interval_ms
+        self.max_pending = max_pending
+        self._pending: Deque[Dict] = deque()
+        self._oldest: Optional[float] = None
+        self._cond = threading.Condition()
+        # Serializes flushes between the background thread and flush()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+        self._flushed = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._discarded = 0
+        self._rejected = 0
+        self._last_flush_ms = 0.0
+        # Backoff after a failed flush: current delay and earliest retry
+        self._retry_delay = 0.0
+        self._retry_at = 0.0
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name="access-log-sink", daemon=True)
+            self._thread.start()
+
+    def add(self, entries: List[Dict]):
+        """
+        Buffer access log entries.
+
+        Args:
+            entries: Column values of ``AccessLog`` rows
+        """
+        if not entries:
+            return
+        with self._cond:
+            self._ensure_started()
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._pending.extend(entries)
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                for _ in range(overflow):
+                    self._pending.popleft()
+                self._discarded += overflow
+                logger.warning(f"Access log buffer full; discarded {overflow} oldest entries")
+            if len(self._pending) >= self.flush_size:
+                self._cond.notify()
+
+    def _take(self) -> List[Dict]:
+        """Remove and return the pending entries (caller holds the condition)."""
+        batch = list(self._pending)
+        self._pending.clear()
+        self._oldest = None
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closing:
+                    backoff = self._retry_at - time.monotonic()
+                    if backoff > 0:
+                        self._cond.wait(backoff)
+                        continue
+                    if len(self._pending) >= self.flush_size:
+                        break
+                    if self._oldest is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self.flush_interval_ms / 1000 - (time.monotonic() - self._oldest)
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                closing = self._closing
+            self.flush()
+            if closing:
+                return
+
+    def flush(self) -> int:
+        """
+        Write all pending entries now, in one transaction.
+
+        Returns:
+            Number of entries written
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = self._take()
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            written = 0
+            rejected = 0
+            failed = False
+            # Batches still to write, in order; a failing batch is replaced
+            # by its two halves until the offending entries are isolated
+            parts: Deque[List[Dict]] = deque([batch])
+            while parts:
+                part = parts.popleft()
+                try:
+                    self._commit(part)
+                    written += len(part)
+                except OperationalError as e:
+                    logger.error(f"Failed to flush {len(part)} access log entries: {e}")
+                    with self._cond:
+                        # Keep them for the next flush, ahead of newer entries
+                        unwritten = part + [entry for rest in parts for entry in rest]
+                        self._pending.extendleft(reversed(unwritten))
+                        if self._oldest is None:
+                            self._oldest = time.monotonic()
+                        self._failed_batches += 1
+                        self._retry_delay = min(
+                            2 * self._retry_delay or max(self.flush_interval_ms / 1000, 0.1),
+                            self.MAX_RETRY_DELAY,
+                        )
+                        self._retry_at = time.monotonic() + self._retry_delay
+                    failed = True
+                    break
+                except Exception as e:
+                    if len(part) > 1:
+                        half = len(part) // 2
+                        parts.extendleft([part[half:], part[:half]])
+                    else:
+                        logger.error(f"Dropping invalid access log entry {part[0]!r}: {e}")
+                        rejected += 1
+
+            with self._cond:
+                if not failed:
+                    self._retry_delay = 0.0
+                    self._retry_at = 0.0
+                self._flushed += written
+                self._rejected += rejected
+                if written:
+                    self._batches += 1
+                    self._last_flush_ms = (time.monotonic() - started) * 1000
+            return written
+
+    def _commit(self, batch: List[Dict]):
+        """Write one batch in its own transaction, rolling back on failure."""
+        db = self.session_factory()
+        try:
+            self._write(db, batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write(self, db: Session, batch: List[Dict]):
+        """Insert one batch and count it into the rollups, inside the flush transaction."""
+        db.execute(insert(AccessLog), batch)
+        access_stats.upsert_rollups(db, batch)
+
+    def stats(self) -> Dict:
+        """Queue depth and flush counters."""
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "flushed": self._flushed,
+                "batches": self._batches,
+                "failed_batches": self._failed_batches,
+                "discarded": self._discarded,
+                "rejected": self._rejected,
+                "last_flush_ms": round(self._last_flush_ms, 2),
+            }
+
+    def close(self, timeout: float = 10.0):
+        """Flush the pending entries and stop the flusher thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Entries added after the thread's last flush
+        self.flush()
+
+
+# Global access log sink instance
+access_log_sink: Optional[AccessLogSink] = None
+
+
+def get_access_log_sink() -> AccessLogSink:
+    """Get the global access log sink instance."""
+    global access_log_sink
+    if access_log_sink is None:
+        access_log_sink = AccessLogSink(
+            flush_size=Settings.LOG_FLUSH_SIZE,
+            flush_interval_ms=Settings.LOG_FLUSH_INTERVAL_MS,
+            max_pending=Settings.LOG_MAX_PENDING,
+        )
+    return access_log_sink
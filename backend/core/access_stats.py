@@ -0,0 +1,132 @@
+"""
+Hourly access statistics rolled up from the access log.
+
+The access log sink updates ``access_stats_hourly`` in the same transaction
+that inserts the log entries, so the rollups always agree with the log.
+Per-day and per-user figures are sums over the hourly rows.
+
+Backfill from existing logs (from the backend directory):
+
+    python -m core.access_stats backfill
+    python -m core.access_stats backfill --since 2026-01-01T00:00:00
+
+Backfill recounts every hour from ``--since`` (default: the oldest log entry)
+onwards, so rollups of hours whose logs were already purged are kept.
+"""
+import argparse
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from database import AccessLog, AccessStatsHourly, SessionLocal, init_database
+from utils.logger import get_logger, setup_logger
+
+logger = get_logger(__name__)
+
+# Hour bucket in SQLAlchemy's SQLite DATETIME text format, so rows written by
+# the backfill and by the sink share primary keys
+SQL_HOUR_FORMAT = "%Y-%m-%d %H:00:00.000000"
+
+
+def hour_of(timestamp: datetime) -> datetime:
+    """Truncate a timestamp to its hour bucket."""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_rows(entries: List[Dict]) -> List[Dict]:
+    """
+    Count access log entries per (hour, user, status).
+
+    Args:
+        entries: Column values of ``AccessLog`` rows
+
+    Returns:
+        ``AccessStatsHourly`` column values
+    """
+    now = datetime.utcnow()
+    counts = Counter(
+        (hour_of(entry.get("timestamp") or now), entry.get("user_id") or 0, entry["status"])
+        for entry in entries
+    )
+    return [
+        {"hour": hour, "user_id": user_id, "status": status, "count": count}
+        for (hour, user_id, status), count in counts.items()
+    ]
+
+
+def upsert_rollups(db: Session, entries: List[Dict]):
+    """
+    Add a batch of access log entries to the hourly rollups.
+
+    Runs inside the caller's transaction.
+
+    Args:
+        db: Database session
+        entries: Column values of the ``AccessLog`` rows being inserted
+    """
+    rows = rollup_rows(entries)
+    if not rows:
+        return
+    statement = insert(AccessStatsHourly)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["hour", "user_id", "status"],
+            set_={"count": AccessStatsHourly.count + statement.excluded.count},
+        ),
+        rows,
+    )
+
+
+def backfill(db: Session, since: Optional[datetime] = None) -> int:
+    """
+    Recount the rollups from the access log.
+
+    Args:
+        db: Database session
+        since: First hour to recount (default: hour of the oldest log entry)
+
+    Returns:
+        Number of rollup rows written
+    """
+    if since is None:
+        since = db.scalar(select(func.min(AccessLog.timestamp)))
+        if since is None:
+            return 0
+    since = hour_of(since)
+
+    db.execute(delete(AccessStatsHourly).where(AccessStatsHourly.hour >= since))
+    result = db.execute(text(
+        "INSERT INTO access_stats_hourly (hour, user_id, status, count) "
+        f"SELECT strftime('{SQL_HOUR_FORMAT}', timestamp), COALESCE(user_id, 0), status, COUNT(*) "
+        "FROM access_logs WHERE timestamp >= :since "
+        "GROUP BY 1, 2, 3"
+    ), {"since": since.strftime("%Y-%m-%d %H:%M:%S.%f")})
+    db.commit()
+    return result.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the access statistics rollups")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser("backfill", help="Recount rollups from the access log")
+    backfill_parser.add_argument("--since", type=datetime.fromisoformat, default=None,
+                                 help="First hour to recount (UTC, default: oldest log entry)")
+
+    args = parser.parse_args()
+    setup_logger(log_file=None)
+    init_database()  # Creates the rollup table on databases from older versions
+    db = SessionLocal()
+    try:
+        rows = backfill(db, since=args.since)
+    finally:
+        db.close()
+    logger.info(f"Backfilled {rows} hourly rollup rows")
+
+
+if __name__ == "__main__":
+    main()
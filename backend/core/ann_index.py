@@ -0,0 +1,389 @@
+"""
+Approximate nearest-neighbour (ANN) indexes for large face galleries.
+
+The exact :class:`~core.gallery.FaceGallery` stays the source of truth for
+vectors; an index only narrows the search down to a short candidate list,
+which the engine can re-rank exactly against the gallery.
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from core.gallery import FaceGallery
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class VectorIndex(ABC):
+    """Interface implemented by all ANN index backends."""
+
+    name = "base"
+
+    # Below this gallery size the engine uses exact search instead
+    MIN_SIZE = 4096
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    @property
+    @abstractmethod
+    def ready(self) -> bool:
+        """Whether the index has been built and can answer queries."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of indexed vectors."""
+
+    @abstractmethod
+    def build(self, user_ids: np.ndarray, vectors: np.ndarray):
+        """Build the index from scratch over normalized vectors."""
+
+    @abstractmethod
+    def add(self, user_id: int, vector: np.ndarray):
+        """Insert or replace a single normalized vector."""
+
+    @abstractmethod
+    def remove(self, user_id: int):
+        """Delete a vector by user ID (no-op if absent)."""
+
+    @abstractmethod
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Return up to ``k`` (user_id, approximate similarity) pairs."""
+
+    @abstractmethod
+    def save(self, path: Path):
+        """Persist the index to ``path``."""
+
+    @abstractmethod
+    def load(self, path: Path, gallery: FaceGallery) -> bool:
+        """
+        Restore a persisted index.
+
+        Args:
+            path: Index file written by :meth:`save`
+            gallery: Gallery holding the current vectors
+
+        Returns:
+            True if the file existed and matches the gallery contents
+        """
+
+    @staticmethod
+    def _same_ids(stored: np.ndarray, gallery: FaceGallery) -> bool:
+        """Check that a persisted index covers exactly the gallery's users."""
+        if len(stored) != len(gallery):
+            return False
+        return bool(np.array_equal(np.sort(stored), np.sort(gallery.ids)))
+
+
+class IVFFlatIndex(VectorIndex):
+    """
+    Inverted-file index with flat (uncompressed) lists, in pure NumPy.
+
+    Vectors are partitioned by spherical k-means into ``nlist`` cells; a query
+    only scans the ``nprobe`` cells whose centroids are closest to it.
+    Each cell is a :class:`FaceGallery`, so inserts append and deletes
+    swap-delete exactly like the main gallery.
+    """
+
+    name = "ivf"
+
+    def __init__(self, dim: int = 512, nlist: int = 0, nprobe: int = 8,
+                 kmeans_iters: int = 10):
+        """
+        Args:
+            dim: Vector dimension
+            nlist: Number of cells (0 = about sqrt(N) at build time)
+            nprobe: Number of cells scanned per query
+            kmeans_iters: Number of k-means refinement iterations
+        """
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.kmeans_iters = kmeans_iters
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[FaceGallery] = []
+        # user_id -> cell index
+        self._cell_of: Dict[int, int] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def _assign(self, vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        """Nearest-centroid assignment, chunked to bound the score matrix."""
+        cells = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk):
+            scores = vectors[start:start + chunk] @ self.centroids.T
+            cells[start:start + chunk] = np.argmax(scores, axis=1)
+        return cells
+
+    def _train(self, vectors: np.ndarray, nlist: int):
+        """Spherical k-means over normalized vectors."""
+        rng = np.random.default_rng(0)
+        seeds = rng.choice(len(vectors), size=nlist, replace=False)
+        self.centroids = vectors[seeds].copy()
+        for _ in range(self.kmeans_iters):
+            cells = self._assign(vectors)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, cells, vectors)
+            counts = np.bincount(cells, minlength=nlist)
+            # Re-seed empty cells from random vectors
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                sums[empty] = vectors[rng.choice(len(vectors), size=len(empty))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            self.centroids = (sums / (norms + 1e-8)).astype(np.float32)
+
+    def _fill(self, user_ids: np.ndarray, vectors: np.ndarray, cells: np.ndarray):
+        """Populate cells from a precomputed assignment."""
+        self._lists = [FaceGallery(dim=self.dim, initial_capacity=16)
+                       for _ in range(len(self.centroids))]
+        self._cell_of = {}
+        order = np.argsort(cells, kind="stable")
+        bounds = np.searchsorted(cells[order], np.arange(len(self.centroids) + 1))
+        for cell in range(len(self.centroids)):
+            rows = order[bounds[cell]:bounds[cell + 1]]
+            if len(rows):
+                self._lists[cell].load(user_ids[rows], vectors[rows])
+        self._cell_of = {int(uid): int(cell) for uid, cell in zip(user_ids, cells)}
+
+    def build(self, user_ids: np.ndarray, vectors: np.ndarray):
+        if len(vectors) == 0:
+            return
+        nlist = self.nlist or int(np.sqrt(len(vectors)))
+        nlist = max(1, min(nlist, len(vectors)))
+        self._train(vectors, nlist)
+        self._fill(np.asarray(user_ids, dtype=np.int64), vectors, self._assign(vectors))
+        logger.info(f"IVF index built: {len(self)} vectors in {nlist} cells")
+
+    def add(self, user_id: int, vector: np.ndarray):
+        if not self.ready:
+            return
+        self.remove(user_id)
+        cell = int(np.argmax(self.centroids @ vector))
+        self._lists[cell].add(user_id, vector)
+        self._cell_of[user_id] = cell
+
+    def remove(self, user_id: int):
+        cell = self._cell_of.pop(user_id, None)
+        if cell is not None:
+            self._lists[cell].remove(user_id)
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if not self.ready or not self._cell_of:
+            return []
+        nprobe = min(self.nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        ids = [self._lists[c].ids for c in probe if len(self._lists[c])]
+        if not ids:
+            return []
+        ids = np.concatenate(ids)
+        scores = np.concatenate([self._lists[c].matrix @ query
+                                 for c in probe if len(self._lists[c])])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def save(self, path: Path):
+        if not self.ready:
+            return
+        user_ids = np.fromiter(self._cell_of.keys(), dtype=np.int64, count=len(self._cell_of))
+        cells = np.fromiter(self._cell_of.values(), dtype=np.int64, count=len(self._cell_of))
+        # Only centroids and the assignment are stored: vectors come from the
+        # gallery on load, so the file stays small and restarts skip k-means.
+        tmp_path = _tmp_path(path)
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, user_ids=user_ids, cells=cells)
+        os.replace(tmp_path, path)
+
+    def load(self, path: Path, gallery: FaceGallery) -> bool:
+        if not Path(path).exists():
+            return False
+        try:
+            with np.load(path) as data:
+                centroids = data["centroids"]
+                user_ids = data["user_ids"]
+                cells = data["cells"]
+        except Exception as e:
+            logger.warning(f"Failed to read IVF index {path}: {e}")
+            return False
+        if centroids.shape[1] != self.dim or not self._same_ids(user_ids, gallery):
+            return False
+        self.centroids = centroids.astype(np.float32)
+        vectors = np.stack([gallery.get(int(uid)) for uid in user_ids])
+        self._fill(user_ids, vectors, cells)
+        logger.info(f"IVF index loaded: {len(self)} vectors in {len(centroids)} cells")
+        return True
+
+
+class HNSWIndex(VectorIndex):
+    """
+    HNSW graph index backed by the optional ``hnswlib`` package.
+
+    hnswlib labels are unsigned, while gallery keys can be negative (extra
+    templates), so every key is stored under a sequential label and mapped
+    back on search.
+    """
+
+    name = "hnsw"
+
+    def __init__(self, dim: int = 512, m: int = 16, ef_construction: int = 200,
+                 ef_search: int = 64):
+        """
+        Args:
+            dim: Vector dimension
+            m: Graph out-degree
+            ef_construction: Candidate list size while inserting
+            ef_search: Candidate list size while querying
+        """
+        import hnswlib  # Optional dependency; ImportError handled by create_index
+
+        super().__init__(dim)
+        self._hnswlib = hnswlib
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._index = None
+        # Gallery key -> hnswlib label, and back
+        self._labels: Dict[int, int] = {}
+        self._keys: Dict[int, int] = {}
+        self._next_label = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def _new_index(self, capacity: int):
+        index = self._hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(max_elements=max(capacity, 1024), M=self.m,
+                         ef_construction=self.ef_construction,
+                         allow_replace_deleted=True)
+        index.set_ef(self.ef_search)
+        return index
+
+    def _set_labels(self, user_ids: np.ndarray, labels: np.ndarray):
+        self._labels = {int(uid): int(label) for uid, label in zip(user_ids, labels)}
+        self._keys = {label: uid for uid, label in self._labels.items()}
+        self._next_label = max(self._keys, default=-1) + 1
+
+    def build(self, user_ids: np.ndarray, vectors: np.ndarray):
+        if len(vectors) == 0:
+            return
+        labels = np.arange(len(vectors), dtype=np.int64)
+        self._index = self._new_index(2 * len(vectors))
+        self._index.add_items(vectors, labels)
+        self._set_labels(user_ids, labels)
+        logger.info(f"HNSW index built: {len(self)} vectors")
+
+    def add(self, user_id: int, vector: np.ndarray):
+        if not self.ready:
+            return
+        if self._index.get_current_count() >= self._index.get_max_elements():
+            self._index.resize_index(2 * self._index.get_max_elements())
+        self.remove(user_id)
+        label = self._next_label
+        self._next_label += 1
+        self._index.add_items(vector[None, :], np.array([label]), replace_deleted=True)
+        self._labels[user_id] = label
+        self._keys[label] = user_id
+
+    def remove(self, user_id: int):
+        label = self._labels.pop(user_id, None)
+        if label is not None:
+            self._index.mark_deleted(label)
+            del self._keys[label]
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if not self.ready or not self._labels:
+            return []
+        k = min(k, len(self._labels))
+        labels, distances = self._index.knn_query(query[None, :], k=k)
+        # "ip" space reports 1 - dot product
+        return [(self._keys[int(label)], float(1.0 - dist))
+                for label, dist in zip(labels[0], distances[0])]
+
+    def save(self, path: Path):
+        if not self.ready:
+            return
+        tmp_path = _tmp_path(path)
+        ids_tmp_path = _tmp_path(Path(f"{path}.ids.npy"))
+        self._index.save_index(str(tmp_path))
+        # (key, label) rows
+        mapping = np.array(list(self._labels.items()), dtype=np.int64).reshape(-1, 2)
+        with open(ids_tmp_path, "wb") as f:
+            np.save(f, mapping)
+        # Always the mapping first, then the graph; callers hold the index
+        # file lock so readers never see a pair from two different saves
+        os.replace(ids_tmp_path, f"{path}.ids.npy")
+        os.replace(tmp_path, path)
+
+    def load(self, path: Path, gallery: FaceGallery) -> bool:
+        ids_path = Path(f"{path}.ids.npy")
+        if not Path(path).exists() or not ids_path.exists():
+            return False
+        try:
+            mapping = np.load(ids_path)
+            if mapping.ndim == 1:
+                # Older files stored the keys themselves as labels
+                if (mapping < 0).any():
+                    return False
+                mapping = np.stack([mapping, mapping], axis=1)
+            user_ids, labels = mapping[:, 0], mapping[:, 1]
+            if not self._same_ids(user_ids, gallery):
+                return False
+            index = self._hnswlib.Index(space="ip", dim=self.dim)
+            index.load_index(str(path), max_elements=max(2 * len(user_ids), 1024),
+                             allow_replace_deleted=True)
+            index.set_ef(self.ef_search)
+        except Exception as e:
+            logger.warning(f"Failed to read HNSW index {path}: {e}")
+            return False
+        self._index = index
+        self._set_labels(user_ids, labels)
+        logger.info(f"HNSW index loaded: {len(self)} vectors")
+        return True
+
+
+def _tmp_path(path: Path) -> Path:
+    """Private temporary name next to ``path``, so concurrent savers never share one."""
+    path = Path(path)
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+INDEX_BACKENDS = ("exact", "ivf", "hnsw")
+
+
+def create_index(backend: str, dim: int = 512, nprobe: int = 8) -> Optional[VectorIndex]:
+    """
+    Create an ANN index for the configured backend.
+
+    Args:
+        backend: One of ``INDEX_BACKENDS``
+        dim: Vector dimension
+        nprobe: Cells scanned per query (IVF) / search breadth (HNSW)
+
+    Returns:
+        Index instance, or None for exact search
+    """
+    if backend == "ivf":
+        return IVFFlatIndex(dim=dim, nprobe=nprobe)
+    if backend == "hnsw":
+        try:
+            return HNSWIndex(dim=dim, ef_search=max(nprobe * 8, 16))
+        except ImportError:
+            logger.warning("hnswlib is not installed, falling back to IVF index")
+            return IVFFlatIndex(dim=dim, nprobe=nprobe)
+    if backend != "exact":
+        logger.warning(f"Unknown index backend '{backend}', using exact search")
+    return None
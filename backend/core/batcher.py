@@ -0,0 +1,187 @@
+"""
+Dynamic micro-batching of concurrent recognition requests.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+import numpy as np
+
+from core.face_engine import FaceEngine, get_face_engine
+from core.inference_pool import InferencePool, PoolSaturatedError, get_inference_pool
+from core.preprocess import ImageLike
+from core.settings import Settings
+from core.tracker import FaceTracker
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class RecognitionBatcher:
+    """
+    Collects frames arriving within a short window and recognizes them as one
+    batch, so ULFD and ArcFace run with batch sizes above 1.
+
+    The first queued frame opens a window of ``window_ms``; the batch is
+    dispatched when the window closes or ``max_batch`` frames are collected.
+    Batches run on the inference pool, so several may be in flight at once.
+    """
+
+    # Number of recent batches kept for latency/size statistics
+    STATS_WINDOW = 1000
+
+    def __init__(self, engine: FaceEngine, pool: InferencePool,
+                 window_ms: float = 5.0, max_batch: int = 16):
+        """
+        Args:
+            engine: Face engine that runs the batches
+            pool: Inference pool the batches are executed on
+            window_ms: Collection window opened by the first queued frame
+            max_batch: Maximum frames per batch
+        """
+        self.engine = engine
+        self.pool = pool
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        # Frames allowed to wait in the batcher before new ones get 503
+        self.max_pending = max_batch * (pool.workers + pool.queue_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Strong references to running batch tasks
+        self._running: Set[asyncio.Task] = set()
+        self._pending = 0
+        # (batch size, mean queue wait ms, execution ms) per recent batch
+        self._history: Deque[Tuple[int, float, float]] = deque(maxlen=self.STATS_WINDOW)
+        self._frames = 0
+        self._batches = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._collect())
+
+    async def submit(self, image: ImageLike, threshold: float, multi: bool = False,
+                     tracker: Optional[FaceTracker] = None) -> List[Dict]:
+        """
+        Queue a frame and wait for its recognition results.
+
+        Args:
+            image: PIL Image or encoded frame to recognize
+            threshold: Similarity threshold
+            multi: Recognize every face instead of only the largest
+            tracker: Face tracker of the frame's stream, if any
+
+        Returns:
+            List of per-face results, as from ``FaceEngine.recognize_batch``
+
+        Raises:
+            PoolSaturatedError: If too many frames are already waiting
+        """
+        if self._pending >= self.max_pending:
+            raise PoolSaturatedError("Recognition batcher is saturated")
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._pending += 1
+        try:
+            self._queue.put_nowait((image, threshold, multi, future, time.monotonic(), tracker))
+            return await future
+        finally:
+            self._pending -= 1
+
+    async def _collect(self):
+        """Form batches from the queue and dispatch them."""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.window_ms / 1000
+            while len(batch) < self.max_batch:
+                # Frames already queued join without waiting
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.get_running_loop().create_task(self._execute(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, batch: list):
+        """Run one batch on the pool and resolve each waiting request."""
+        images = [item[0] for item in batch]
+        thresholds = [item[1] for item in batch]
+        multi = [item[2] for item in batch]
+        trackers = [item[5] for item in batch]
+        started = time.monotonic()
+        wait_ms = float(np.mean([(started - item[4]) * 1000 for item in batch]))
+        try:
+            results = await self.pool.run(
+                self.engine.recognize_batch, images, thresholds, multi, trackers, drop_stale=True
+            )
+        except Exception as e:
+            for item in batch:
+                if not item[3].done():
+                    item[3].set_exception(e)
+            return
+        exec_ms = (time.monotonic() - started) * 1000
+
+        self._frames += len(batch)
+        self._batches += 1
+        self._history.append((len(batch), wait_ms, exec_ms))
+
+        for item, frame_results in zip(batch, results):
+            if not item[3].done():
+                item[3].set_result(frame_results)
+
+    def stats(self) -> Dict:
+        """Batch-size and latency statistics over recent batches."""
+        stats = {
+            "window_ms": self.window_ms,
+            "max_batch": self.max_batch,
+            "pending": self._pending,
+            "frames": self._frames,
+            "batches": self._batches,
+        }
+        if self._history:
+            sizes, waits, execs = (np.array(column) for column in zip(*self._history))
+            stats.update({
+                "batch_size_mean": round(float(sizes.mean()), 2),
+                "batch_size_max": int(sizes.max()),
+                "batch_size_histogram": {
+                    int(size): int(count) for size, count in zip(*np.unique(sizes, return_counts=True))
+                },
+                "queue_wait_ms_p50": round(float(np.percentile(waits, 50)), 2),
+                "queue_wait_ms_p95": round(float(np.percentile(waits, 95)), 2),
+                "exec_ms_p50": round(float(np.percentile(execs, 50)), 2),
+                "exec_ms_p95": round(float(np.percentile(execs, 95)), 2),
+            })
+        return stats
+
+    async def close(self):
+        """Stop collecting batches."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# Global batcher instance
+recognition_batcher: Optional[RecognitionBatcher] = None
+
+
+def get_recognition_batcher() -> RecognitionBatcher:
+    """Get the global recognition batcher instance."""
+    global recognition_batcher
+    if recognition_batcher is None:
+        recognition_batcher = RecognitionBatcher(
+            get_face_engine(),
+            get_inference_pool(),
+            window_ms=Settings.BATCH_WINDOW_MS,
+            max_batch=Settings.BATCH_MAX_SIZE,
+        )
+    return recognition_batcher
@@ -1,16 +1,143 @@
 """
 Configuration manager for system settings.
 """
-from typing import Dict, Any
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 from sqlalchemy.orm import Session
 from database import SystemConfig
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+ConfigListener = Callable[[Dict[str, Any], Set[str]], None]
 
 
 class ConfigManager:
-    """Manage system configuration stored in database."""
-    
+    """
+    Manage system configuration stored in database.
+
+    Reads are served from a typed in-process cache. ``update_config``
+    refreshes it and touches a version file; other workers notice the file
+    change (checked at most every ``CHECK_INTERVAL`` seconds) and reload.
+    Listeners registered with :meth:`add_listener` are told which keys
+    changed, whichever worker made the change. They run one at a time on a
+    background thread, since they may do slow work (rebuilding an index)
+    and reads happen on the request path.
+    """
+
+    # Seconds between checks of the cross-worker version file
+    CHECK_INTERVAL = 1.0
+    # Rewritten on every update so other workers reload their cache
+    VERSION_FILE = Path("data/config.version")
+
+    _cache: Optional[Dict[str, Any]] = None
+    _signature: Optional[Tuple[int, int, int]] = None
+    _last_check = 0.0
+    _listeners: List[ConfigListener] = []
+    _notifier: Optional[ThreadPoolExecutor] = None
+    _lock = threading.RLock()
+
+    # Value types of known keys; unknown keys are returned as strings
+    VALUE_TYPES = {
+        "frame_interval_ms": int,
+        "recognition_threshold": float,
+        "index_backend": str,
+        "index_nprobe": int,
+        "index_rerank": int,
+        "detection_confidence_threshold": float,
+        "nms_iou_threshold": float,
+        "nms_top_k": int,
+    }
+
     @staticmethod
-    def get_config(db: Session) -> Dict[str, Any]:
+    def _convert(key: str, value: str) -> Any:
+        """Convert a stored string value to the key's type."""
+        return ConfigManager.VALUE_TYPES.get(key, str)(value)
+
+    @classmethod
+    def _version_signature(cls) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(cls.VERSION_FILE)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def _bump_version(cls):
+        """Signal a configuration change to the other workers."""
+        try:
+            cls.VERSION_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cls.VERSION_FILE.with_name(f"{cls.VERSION_FILE.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(str(time.time_ns()))
+            os.replace(tmp_path, cls.VERSION_FILE)
+        except OSError as e:
+            logger.warning(f"Could not signal configuration change: {e}")
+
+    @classmethod
+    def _cached(cls, db: Session, force: bool = False) -> Dict[str, Any]:
+        """Typed configuration, reloaded when the version file changed."""
+        with cls._lock:
+            now = time.monotonic()
+            if not force and cls._cache is not None and now - cls._last_check < cls.CHECK_INTERVAL:
+                return cls._cache
+            cls._last_check = now
+            signature = cls._version_signature()
+            if not force and cls._cache is not None and signature == cls._signature:
+                return cls._cache
+
+            previous = cls._cache
+            cls._cache = {
+                config.key: cls._convert(config.key, config.value)
+                for config in db.query(SystemConfig).all()
+            }
+            cls._signature = signature
+            current = cls._cache
+
+        if previous is not None:
+            changed = {
+                key for key in previous.keys() | current.keys()
+                if previous.get(key) != current.get(key)
+            }
+            if changed:
+                with cls._lock:
+                    if cls._notifier is None:
+                        cls._notifier = ThreadPoolExecutor(max_workers=1,
+                                                           thread_name_prefix="config-listeners")
+                    # A single thread keeps the changes in order
+                    cls._notifier.submit(cls._notify, dict(current), changed)
+        return current
+
+    @classmethod
+    def _notify(cls, config: Dict[str, Any], changed: Set[str]):
+        for listener in list(cls._listeners):
+            try:
+                listener(config, changed)
+            except Exception as e:
+                logger.error(f"Configuration listener failed: {e}")
+
+    @classmethod
+    def add_listener(cls, listener: ConfigListener):
+        """
+        Register a callback for configuration changes.
+
+        Args:
+            listener: Called with the new configuration and the set of
+                changed keys
+        """
+        cls._listeners.append(listener)
+
+    @classmethod
+    def invalidate(cls):
+        """Drop the cache; the next read loads from the database."""
+        with cls._lock:
+            cls._cache = None
+    
+    @classmethod
+    def get_config(cls, db: Session) -> Dict[str, Any]:
         """
         Get all configuration as a dictionary.
         
@@ -20,22 +147,10 @@ class ConfigManager:
         Returns:
             Dictionary of configuration key-value pairs with proper types
         """
-        configs = db.query(SystemConfig).all()
-        result = {}
-        
-        for config in configs:
-            # Convert values to appropriate types
-            if config.key == "frame_interval_ms":
-                result[config.key] = int(config.value)
-            elif config.key == "recognition_threshold":
-                result[config.key] = float(config.value)
-            else:
-                result[config.key] = config.value
-        
-        return result
+        return dict(cls._cached(db))
     
-    @staticmethod
-    def update_config(db: Session, updates: Dict[str, Any]) -> None:
+    @classmethod
+    def update_config(cls, db: Session, updates: Dict[str, Any]) -> None:
         """
         Update configuration values.
         
@@ -55,9 +170,13 @@ class ConfigManager:
                 db.add(new_config)
         
         db.commit()
+
+        # Refresh this worker now, the others through the version file
+        cls._bump_version()
+        cls._cached(db, force=True)
     
-    @staticmethod
-    def get_value(db: Session, key: str, default: Any = None) -> Any:
+    @classmethod
+    def get_value(cls, db: Session, key: str, default: Any = None) -> Any:
         """
         Get a single configuration value.
         
@@ -69,15 +188,4 @@ class ConfigManager:
         Returns:
             Configuration value with appropriate type
         """
-        config = db.query(SystemConfig).filter(SystemConfig.key == key).first()
-        
-        if not config:
-            return default
-        
-        # Convert to appropriate type
-        if key == "frame_interval_ms":
-            return int(config.value)
-        elif key == "recognition_threshold":
-            return float(config.value)
-        else:
-            return config.value
+        return cls._cached(db).get(key, default)
@@ -0,0 +1,477 @@
+"""
+Bulk enrolment of users from a photo archive or directory.
+
+A job enrols one user per row of a ``filename,name`` CSV. Photos are decoded
+on a thread pool, detection and ArcFace batches run on the shared inference
+pool (within the same thread budget as live recognition), users
+are inserted one chunk per transaction, and the in-memory gallery is updated
+(and its snapshot published) once at the end. Progress and per-photo errors
+are written to a status file, so every worker can report on a job.
+"""
+import csv
+import io
+import json
+import math
+import os
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+from sqlalchemy.orm import Session
+
+from core.face_engine import FaceEngine, Identity, get_face_engine
+from core.inference_pool import InferencePool, get_inference_pool, resolve_thread_budget
+from core.settings import Settings
+from database import SessionLocal, User
+from utils.feature_codec import feature_columns
+from utils.file_utils import generate_unique_filename
+from utils.image_utils import FrameImage, save_image
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Names CSV looked up in the archive or directory when none is uploaded
+DEFAULT_NAMES_FILE = "names.csv"
+
+FINISHED_STATES = ("completed", "cancelled", "failed")
+
+
+def parse_names(data: bytes) -> List[Tuple[str, str]]:
+    """
+    Parse an enrolment CSV.
+
+    Args:
+        data: CSV whose header has ``filename`` and ``name`` columns
+
+    Returns:
+        (filename, name) per row, in file order; incomplete rows are kept
+        and reported as errors by the job
+
+    Raises:
+        ValueError: If the CSV cannot be decoded or lacks a column
+    """
+    try:
+        reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+        columns = {field.strip().lower(): field for field in reader.fieldnames or []}
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ValueError(f"Invalid CSV: {e}")
+    if "filename" not in columns or "name" not in columns:
+        raise ValueError("CSV needs 'filename' and 'name' columns")
+    return [
+        ((row.get(columns["filename"]) or "").strip(), (row.get(columns["name"]) or "").strip())
+        for row in reader
+    ]
+
+
+class ArchiveSource:
+    """Photos inside a zip archive."""
+
+    def __init__(self, path: Path, delete: bool = False, max_members: int = 0):
+        """
+        Args:
+            path: Zip archive
+            delete: Delete the archive when the job is done (uploads)
+            max_members: Most files the archive may hold (0 = unlimited)
+
+        Raises:
+            ValueError: If the file is not a zip archive or has too many files
+        """
+        self.path = path
+        self.delete = delete
+        try:
+            self._zip = zipfile.ZipFile(path)
+        except (zipfile.BadZipFile, OSError) as e:
+            self._remove()
+            raise ValueError(f"Invalid zip archive: {e}")
+        members = len(self._zip.infolist())
+        if max_members > 0 and members > max_members:
+            self.close()
+            raise ValueError(f"Archive holds {members} files, the limit is {max_members}")
+        self.name = path.name
+
+    def read(self, filename: str) -> bytes:
+        """Read a member; safe to call from several threads."""
+        return self._zip.read(filename)
+
+    def _remove(self):
+        if self.delete:
+            self.path.unlink(missing_ok=True)
+
+    def close(self):
+        self._zip.close()
+        self._remove()
+
+
+class DirectorySource:
+    """Photos in a server-side directory under ``FACEGUARD_ENROL_IMPORT_DIR``."""
+
+    def __init__(self, root: Union[str, Path], directory: str):
+        """
+        Args:
+            root: Directory import directories must lie under
+            directory: Import directory, relative to ``root``
+
+        Raises:
+            ValueError: If the directory is outside ``root`` or missing
+        """
+        root = Path(root).resolve()
+        self.path = (root / directory).resolve()
+        if not self.path.is_relative_to(root) or not self.path.is_dir():
+            raise ValueError(f"Import directory not found: {directory}")
+        self.name = directory
+
+    def read(self, filename: str) -> bytes:
+        path = (self.path / filename).resolve()
+        if not path.is_relative_to(self.path):
+            raise KeyError(filename)
+        return path.read_bytes()
+
+    def close(self):
+        pass
+
+
+EnrolmentSource = Union[ArchiveSource, DirectorySource]
+
+
+class EnrolmentJob:
+    """Progress of one bulk enrolment."""
+
+    def __init__(self, job_id: str, source: str, rows: List[Tuple[str, str]]):
+        self.job_id = job_id
+        self.source = source
+        self.rows = rows
+        self.state = "queued"
+        self.processed = 0
+        self.enrolled = 0
+        # One entry per photo that was not enrolled
+        self.errors: List[Dict[str, str]] = []
+        # Reason a job failed as a whole
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    def fail(self, filename: str, name: str, error: str):
+        self.errors.append({"filename": filename, "name": name, "error": error})
+
+    def status(self) -> Dict:
+        errors = list(self.errors)
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "source": self.source,
+            "total": len(self.rows),
+            "processed": self.processed,
+            "enrolled": self.enrolled,
+            "failed": len(errors),
+            "errors": errors,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class BulkEnroller:
+    """
+    Runs bulk enrolment jobs one after another on a background thread.
+
+    Decoding and avatar writes run on ``workers`` threads. Detection and
+    extraction are submitted to the inference pool, which runs them only on
+    workers that live recognition leaves idle; inserts run on the job
+    thread, ``chunk_size`` photos at a time.
+    """
+
+    # Jobs kept in memory; older ones are served from their status files
+    MAX_JOBS = 20
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 workers: int = 2, chunk_size: int = 64, job_dir: str = "data/enrolment",
+                 avatar_dir: str = "static/avatars", avatar_max_side: int = 512,
+                 max_upload_bytes: int = 0, max_archive_files: int = 0,
+                 pool: Optional[InferencePool] = None):
+        """
+        Args:
+            session_factory: Creates the database sessions used by jobs
+            workers: Threads decoding photos
+            chunk_size: Photos per ArcFace batch and per insert transaction
+            job_dir: Directory of job status files and uploaded archives
+            avatar_dir: Directory avatars are written to
+            avatar_max_side: Longest avatar side (0 = full resolution)
+            max_upload_bytes: Largest accepted archive upload (0 = unlimited)
+            max_archive_files: Most files an archive may hold (0 = unlimited)
+            pool: Inference pool running detection and extraction
+                (default: the global pool)
+        """
+        self.session_factory = session_factory
+        self.workers = workers
+        self.max_upload_bytes = max_upload_bytes
+        self.max_archive_files = max_archive_files
+        self._pool = pool
+        self.chunk_size = chunk_size
+        self.job_dir = Path(job_dir)
+        self.avatar_dir = avatar_dir
+        self.avatar_max_side = avatar_max_side
+        self._jobs: "OrderedDict[str, EnrolmentJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="enrolment")
+        self._decoders = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrolment-decode")
+
+    def save_upload(self, fileobj: BinaryIO) -> ArchiveSource:
+        """
+        Store an uploaded archive until its job is done (blocking I/O).
+
+        Raises:
+            ValueError: If the upload is too large, not a zip archive or
+                holds too many files
+        """
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        path = self.job_dir / f"upload_{uuid.uuid4().hex}.zip"
+        size = 0
+        with open(path, "wb") as out:
+            while chunk := fileobj.read(1 << 20):
+                size += len(chunk)
+                if 0 < self.max_upload_bytes < size:
+                    out.close()
+                    path.unlink(missing_ok=True)
+                    raise ValueError(f"Archive exceeds the upload limit of "
+                                     f"{self.max_upload_bytes / (1 << 20):g} MB")
+                out.write(chunk)
+        return ArchiveSource(path, delete=True, max_members=self.max_archive_files)
+
+    def submit(self, source: EnrolmentSource, rows: List[Tuple[str, str]]) -> EnrolmentJob:
+        """
+        Queue a job.
+
+        Args:
+            source: Archive or directory holding the photos (closed by the job)
+            rows: (filename, name) per user to enrol
+
+        Returns:
+            The queued job
+        """
+        job = EnrolmentJob(uuid.uuid4().hex[:12], source.name, rows)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            finished = [jid for jid, j in self._jobs.items() if j.state in FINISHED_STATES]
+            for jid in finished[:max(0, len(self._jobs) - self.MAX_JOBS)]:
+                del self._jobs[jid]
+        self._save(job)
+        self._runner.submit(self._run, job, source)
+        logger.info(f"Bulk enrolment {job.job_id} queued: {len(rows)} photos from {source.name}")
+        return job
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """Status of a job of this or another worker, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.status()
+        if not job_id.isalnum():
+            return None
+        try:
+            return json.loads(self._status_path(job_id).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _status_path(self, job_id: str) -> Path:
+        return self.job_dir / f"{job_id}.json"
+
+    def _save(self, job: EnrolmentJob):
+        """Atomically write the job's status file."""
+        try:
+            self.job_dir.mkdir(parents=True, exist_ok=True)
+            path = self._status_path(job.job_id)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(job.status()))
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error(f"Failed to write enrolment status {job.job_id}: {e}")
+
+    def _run(self, job: EnrolmentJob, source: EnrolmentSource):
+        engine = get_face_engine()
+        enrolled: List[Tuple[int, np.ndarray, Identity]] = []
+        job.state = "running"
+        job.started_at = datetime.utcnow()
+        self._save(job)
+        try:
+            for start in range(0, len(job.rows), self.chunk_size):
+                if self._stop.is_set():
+                    job.state = "cancelled"
+                    break
+                chunk = job.rows[start:start + self.chunk_size]
+                enrolled.extend(self._enrol_chunk(engine, job, source, chunk))
+                job.processed += len(chunk)
+                self._save(job)
+            else:
+                job.state = "completed"
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+            logger.error(f"Bulk enrolment {job.job_id} failed: {e}")
+        finally:
+            source.close()
+            # Users inserted so far become recognizable even if the job stopped early
+            try:
+                engine.add_users_to_database(enrolled)
+            except Exception as e:
+                job.state = "failed"
+                job.error = f"Gallery update failed: {e}"
+                logger.error(f"Bulk enrolment {job.job_id}: {job.error}")
+            job.finished_at = datetime.utcnow()
+            self._save(job)
+        logger.info(f"Bulk enrolment {job.job_id} {job.state}: {job.enrolled} enrolled, "
+                    f"{len(job.errors)} failed")
+
+    def _enrol_chunk(self, engine: FaceEngine, job: EnrolmentJob, source: EnrolmentSource,
+                     chunk: List[Tuple[str, str]]) -> List[Tuple[int, np.ndarray, Identity]]:
+        """
+        Enrol one chunk of photos.
+
+        Returns:
+            (user_id, feature_vector, identity) of each inserted user
+        """
+        outcomes = list(self._decoders.map(lambda row: self._prepare(engine, source, *row), chunk))
+        faces = []
+        for (filename, name), outcome in zip(chunk, outcomes):
+            if isinstance(outcome, str):
+                job.fail(filename, name, outcome)
+            else:
+                faces.append((filename, name) + outcome)
+        if not faces:
+            return []
+
+        try:
+            vectors = self.pool.call(engine.extract_features_batch, [crop for _, _, crop, _ in faces])
+        except Exception as e:
+            self._discard(job, faces, f"Feature extraction failed: {e}")
+            return []
+
+        now = datetime.utcnow()
+        users = [
+            User(name=name, **feature_columns(vector), avatar_path=avatar_path, created_at=now)
+            for (_, name, _, avatar_path), vector in zip(faces, vectors)
+        ]
+        db = self.session_factory()
+        try:
+            db.add_all(users)
+            db.flush()
+            user_ids = [user.id for user in users]
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self._discard(job, faces, f"Database error: {e}")
+            return []
+        finally:
+            db.close()
+
+        job.enrolled += len(user_ids)
+        return [
+            (user_id, vector, Identity(name, avatar_path))
+            for user_id, vector, (_, name, _, avatar_path) in zip(user_ids, vectors, faces)
+        ]
+
+    def _prepare(self, engine: FaceEngine, source: EnrolmentSource, filename: str,
+                 name: str) -> Union[str, Tuple[Image.Image, str]]:
+        """
+        Decode one photo, detect it on the inference pool and write its avatar (decode threads).
+
+        Returns:
+            (face crop, avatar path), or an error message
+        """
+        if not filename or not name:
+            return "Missing filename or name"
+        try:
+            frame = FrameImage(source.read(filename))
+        except (KeyError, FileNotFoundError):
+            return "File not found"
+        except Exception as e:
+            return f"Invalid image: {e}"
+
+        try:
+            boxes = self.pool.call(engine.detect_faces_batch, [frame])[0]
+        except Exception as e:
+            return f"Face detection failed: {e}"
+        if not boxes:
+            return "No face detected in photo"
+        crop = frame.crop(max(boxes, key=lambda b: b[2] * b[3]))
+
+        # Names come from an uploaded CSV; keep them out of the path
+        avatar_path = f"{self.avatar_dir}/{generate_unique_filename(prefix='user', extension='jpg')}"
+        try:
+            save_image(self._avatar(frame), avatar_path)
+        except Exception as e:
+            return f"Failed to save avatar: {e}"
+        return crop, avatar_path
+
+    def _avatar(self, frame: FrameImage) -> Image.Image:
+        """The photo reduced to ``avatar_max_side``, decoded at the smallest sufficient scale."""
+        longest = max(frame.size)
+        if self.avatar_max_side <= 0 or longest <= self.avatar_max_side:
+            return frame.to_image()
+        scale = self.avatar_max_side / longest
+        size = (math.ceil(frame.width * scale), math.ceil(frame.height * scale))
+        image = frame.decode(size)
+        return image if image.size == size else image.resize(size, Image.BILINEAR)
+
+    @staticmethod
+    def _discard(job: EnrolmentJob, faces: List[Tuple], error: str):
+        """Report a chunk's faces as failed and remove their avatars."""
+        for filename, name, _, avatar_path in faces:
+            job.fail(filename, name, error)
+            try:
+                os.remove(avatar_path)
+            except OSError:
+                pass
+
+    @property
+    def pool(self) -> InferencePool:
+        if self._pool is None:
+            self._pool = get_inference_pool()
+        return self._pool
+
+    def stats(self) -> Dict:
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "chunk_size": self.chunk_size,
+            "queued": states.count("queued"),
+            "running": states.count("running"),
+        }
+
+    def close(self):
+        """Cancel queued and running jobs (the current chunk finishes first)."""
+        self._stop.set()
+        self._runner.shutdown(wait=True)
+        self._decoders.shutdown(wait=True)
+
+
+# Global bulk enroller instance
+bulk_enroller: Optional[BulkEnroller] = None
+
+
+def get_bulk_enroller() -> BulkEnroller:
+    """Get the global bulk enroller instance."""
+    global bulk_enroller
+    if bulk_enroller is None:
+        workers = Settings.ENROL_WORKERS or resolve_thread_budget(
+            Settings.INFERENCE_WORKERS, Settings.ORT_INTRA_OP_THREADS
+        )[0]
+        bulk_enroller = BulkEnroller(
+            workers=workers,
+            chunk_size=Settings.ENROL_CHUNK_SIZE,
+            job_dir=Settings.ENROL_JOB_DIR,
+            avatar_max_side=Settings.ENROL_AVATAR_MAX_SIDE,
+            max_upload_bytes=Settings.ENROL_MAX_UPLOAD_MB * (1 << 20),
+            max_archive_files=Settings.ENROL_MAX_ARCHIVE_FILES,
+        )
+    return bulk_enroller
@@ -2,15 +2,55 @@
 Face recognition engine using ULFD for detection and ArcFace for feature extraction.
 """
 import os
-import json
-from typing import Dict, List, Optional, Tuple
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 import numpy as np
 from PIL import Image
 import onnxruntime as ort
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from database import User
-from utils.image_utils import pil_to_numpy, crop_face
+from database import User, UserTemplate
+from core.ann_index import VectorIndex, create_index
+from core.config_manager import ConfigManager
+from core import nms, preprocess
+from core.inference_pool import resolve_thread_budget
+from core.model_downloader import ModelDownloader
+from core.settings import Settings
+from core.tracker import FaceTracker
+from core.gallery import FaceGallery
+from core.gallery_snapshot import (
+    GallerySnapshot, file_signature, open_snapshot, snapshot_lock, write_snapshot
+)
+from utils.feature_codec import FEATURE_MODEL_VERSION, SUPPORTED_DTYPES, decode_features
+from utils.image_utils import pil_to_numpy
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Configuration keys handled by FaceEngine.apply_config
+INDEX_CONFIG_KEYS = {"index_backend", "index_nprobe", "index_rerank"}
+DETECTION_CONFIG_KEYS = {"detection_confidence_threshold", "nms_iou_threshold", "nms_top_k"}
+
+
+def template_key(template_id: int) -> int:
+    """
+    Gallery key of a ``user_templates`` row.
+
+    A user's enrolment vector is keyed by the user ID; extra templates use
+    negated template IDs so both share one key space.
+    """
+    return -template_id
+
+
+class Identity(NamedTuple):
+    """Identity metadata kept next to a gallery vector."""
+    name: str
+    avatar_path: str
+    enabled: bool = True
 
 
 class FaceEngine:
@@ -19,39 +59,173 @@ class FaceEngine:
     Uses ULFD for detection and ArcFace for feature extraction.
     """
 
+    # Seconds between checks for a gallery snapshot published by another worker
+    SNAPSHOT_CHECK_INTERVAL = 1.0
+
     def __init__(self, ulfd_model_path: str = "models/ulfd.onnx",
-                 arcface_model_path: str = "models/arcface.onnx"):
+                 arcface_model_path: str = "models/arcface.onnx",
+                 index_dir: str = "data"):
         """
         Initialize face recognition engine.
 
         Args:
             ulfd_model_path: Path to ULFD ONNX model
             arcface_model_path: Path to ArcFace ONNX model
+            index_dir: Directory where ANN indexes and the gallery snapshot are persisted
         """
         self.ulfd_model_path = ulfd_model_path
         self.arcface_model_path = arcface_model_path
+        self.index_dir = Path(index_dir)
+
+        # In-memory face gallery: pre-normalized (N, 512) template matrix +
+        # template keys and owning user IDs, normally backed by a
+        # memory-mapped snapshot shared across workers
+        self.gallery = FaceGallery(dim=512, use_centroids=Settings.GALLERY_CENTROIDS)
+        self.snapshot_path = self.index_dir / "gallery.snap"
+        self._snapshot: Optional[GallerySnapshot] = None
+        self._last_snapshot_check = 0.0
+        # Gallery changes and snapshot swaps run on worker threads; the file
+        # lock alone does not serialize threads where fcntl is unavailable.
+        # Reentrant: writers refresh the gallery while holding it
+        self._write_lock = threading.RLock()
+        # user_id -> Identity for every gallery owner, so a match is resolved
+        # to a name without a database query
+        self.identities: Dict[int, Identity] = {}
+
+        # Optional ANN index in front of the gallery (None = exact search).
+        # Rebuilt or reloaded into a fresh object and swapped in whole, so
+        # searches never see an index half-way through a build
+        self.index: Optional[VectorIndex] = None
+        self.index_backend = "exact"
+        self.index_nprobe = 8
+        self.index_rerank = 32
 
-        # In-memory face database: {user_id: feature_vector}
-        self.face_database: Dict[int, np.ndarray] = {}
+        # Detection post-processing, updated from system config
+        self.confidence_threshold = 0.7
+        self.nms_iou_threshold = 0.3
+        self.nms_top_k = nms.DEFAULT_TOP_K
 
         # Initialize models (will be loaded when models are available)
         self.ulfd_session = None
         self.arcface_session = None
+        # Effective onnxruntime settings per session, reported on /health
+        self.session_info: Dict[str, Dict] = {}
 
         self._load_models()
     
+    GRAPH_OPTIMIZATION_LEVELS = {
+        "disabled": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+
+    EXECUTION_MODES = {
+        "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+        "parallel": ort.ExecutionMode.ORT_PARALLEL,
+    }
+
+    @staticmethod
+    def _providers() -> Optional[List[str]]:
+        """Configured execution providers that are available in this build."""
+        if not Settings.ORT_PROVIDERS:
+            return None  # onnxruntime default
+        available = ort.get_available_providers()
+        providers = []
+        for provider in (p.strip() for p in Settings.ORT_PROVIDERS.split(",")):
+            if provider in available:
+                providers.append(provider)
+            elif provider:
+                logger.warning(f"Execution provider {provider} is not available, skipping")
+        return providers or ["CPUExecutionProvider"]
+
+    def _create_session(self, name: str, model_path: str) -> ort.InferenceSession:
+        """
+        Create an inference session from the ``FACEGUARD_ORT_*`` settings.
+
+        Intra-op threads default to this process's share of the cores, since
+        every inference pool worker runs its own session call. With a cache
+        directory configured, the optimized graph is saved on first load and
+        reused (without re-optimizing) while it is newer than the source model.
+
+        Args:
+            name: Session name used in the cache and in :attr:`session_info`
+            model_path: Path to the ONNX model
+
+        Returns:
+            Configured inference session
+        """
+        _, intra_op_threads = resolve_thread_budget(
+            Settings.INFERENCE_WORKERS, Settings.ORT_INTRA_OP_THREADS
+        )
+        level_name = Settings.ORT_GRAPH_OPTIMIZATION.lower()
+        mode_name = Settings.ORT_EXECUTION_MODE.lower()
+        if level_name not in self.GRAPH_OPTIMIZATION_LEVELS:
+            logger.warning(f"Unknown graph optimization level '{level_name}', using 'all'")
+            level_name = "all"
+        if mode_name not in self.EXECUTION_MODES:
+            logger.warning(f"Unknown execution mode '{mode_name}', using 'sequential'")
+            mode_name = "sequential"
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = Settings.ORT_INTER_OP_THREADS
+        options.execution_mode = self.EXECUTION_MODES[mode_name]
+        options.enable_cpu_mem_arena = Settings.ORT_CPU_MEM_ARENA
+        options.graph_optimization_level = self.GRAPH_OPTIMIZATION_LEVELS[level_name]
+
+        load_path = model_path
+        cached_path = None
+        temp_path = None
+        if Settings.ORT_OPTIMIZED_MODEL_DIR and level_name != "disabled":
+            cache_dir = Path(Settings.ORT_OPTIMIZED_MODEL_DIR)
+            cached_path = cache_dir / f"{Path(model_path).stem}.{level_name}.onnx"
+            if cached_path.exists() and cached_path.stat().st_mtime >= os.path.getmtime(model_path):
+                # Already optimized: skip the optimization passes at load time
+                load_path = str(cached_path)
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            else:
+                # Written under a private name and moved into place once
+                # complete, so other workers never load a partial file
+                cache_dir.mkdir(parents=True, exist_ok=True)
+                temp_path = cache_dir / f"{cached_path.stem}.{os.getpid()}.tmp.onnx"
+                options.optimized_model_filepath = str(temp_path)
+
+        try:
+            session = ort.InferenceSession(load_path, options, providers=self._providers())
+        except Exception:
+            if temp_path is not None:
+                temp_path.unlink(missing_ok=True)
+            raise
+        if temp_path is not None:
+            try:
+                os.replace(temp_path, cached_path)
+            except OSError as e:
+                logger.warning(f"Error caching optimized model {cached_path}: {e}")
+        self.session_info[name] = {
+            "model_path": load_path,
+            "providers": session.get_providers(),
+            "intra_op_threads": intra_op_threads,
+            "inter_op_threads": Settings.ORT_INTER_OP_THREADS,
+            "graph_optimization": level_name,
+            "execution_mode": mode_name,
+            "cpu_mem_arena": Settings.ORT_CPU_MEM_ARENA,
+            "optimized_cache": str(cached_path) if cached_path else None,
+        }
+        return session
+
     def _load_models(self):
         """Load ONNX models if they exist."""
         try:
             if os.path.exists(self.ulfd_model_path):
-                self.ulfd_session = ort.InferenceSession(self.ulfd_model_path)
+                self.ulfd_session = self._create_session("ulfd", self.ulfd_model_path)
                 print(f"✓ ULFD model loaded from {self.ulfd_model_path}")
             else:
                 print(f"⚠ ULFD model not found at {self.ulfd_model_path}")
                 print("  Face detection will not work until model is provided.")
 
             if os.path.exists(self.arcface_model_path):
-                self.arcface_session = ort.InferenceSession(self.arcface_model_path)
+                self.arcface_session = self._create_session("arcface", self.arcface_model_path)
                 print(f"✓ ArcFace model loaded from {self.arcface_model_path}")
             else:
                 print(f"⚠ ArcFace model not found at {self.arcface_model_path}")
@@ -69,66 +243,74 @@ class FaceEngine:
         Returns:
             List of bounding boxes [[x, y, width, height], ...]
         """
-        if self.ulfd_session is None:
-            raise RuntimeError("ULFD model not loaded. Please provide model file.")
+        return self.detect_faces_batch([image])[0]
 
-        # Save original dimensions
-        orig_w, orig_h = image.size
-
-        # Step 1: Resize to model input size (320x240)
-        resized = image.resize((320, 240), Image.BILINEAR)
+    def detect_faces_batch(self, images: List[preprocess.ImageLike]) -> List[List[List[float]]]:
+        """
+        Detect faces in several images with one ULFD run.
 
-        # Step 2: Convert to numpy array and normalize
-        # Normalization: (image - mean) / std
-        img_array = np.array(resized, dtype=np.float32)
-        normalized = (img_array - 127.0) / 128.0
+        Args:
+            images: PIL Images, uint8 RGB arrays (H, W, 3) or encoded frames
 
-        # Step 3: Transpose HWC to CHW
-        img_chw = np.transpose(normalized, (2, 0, 1))
+        Returns:
+            One list of bounding boxes [[x, y, width, height], ...] per image
+        """
+        if self.ulfd_session is None:
+            raise RuntimeError("ULFD model not loaded. Please provide model file.")
 
-        # Step 4: Add batch dimension (1, 3, 240, 320)
-        input_blob = np.expand_dims(img_chw, axis=0).astype(np.float32)
+        if not images:
+            return []
 
-        # Step 5: Run ONNX inference
-        input_name = self.ulfd_session.get_inputs()[0].name
-        outputs = self.ulfd_session.run(None, {input_name: input_blob})
+        # Step 1-4: Resize each image to model input size (320x240), normalize
+        # with (image - mean) / std and transpose HWC to CHW into this
+        # thread's (N, 3, 240, 320) input buffer
+        input_blob = preprocess.prepare_batch(images, preprocess.ULFD_INPUT)
 
-        # Step 6: Parse outputs
-        # outputs[0]: confidences (1, num_boxes, 2)
-        # outputs[1]: boxes (1, num_boxes, 4)
-        confidences = outputs[0][0]  # Remove batch dimension
-        boxes = outputs[1][0]        # Remove batch dimension
+        # Step 5: Run ONNX inference (one image at a time if the model has a
+        # fixed batch size of 1, as the stock ULFD exports do)
+        input_meta = self.ulfd_session.get_inputs()[0]
+        if input_meta.shape[0] == 1 and len(images) > 1:
+            runs = [self.ulfd_session.run(None, {input_meta.name: input_blob[i:i + 1]})
+                    for i in range(len(images))]
+            outputs = [np.concatenate([run[j] for run in runs]) for j in range(2)]
+        else:
+            outputs = self.ulfd_session.run(None, {input_meta.name: input_blob})
 
-        # Step 7: Filter by confidence threshold
-        confidence_threshold = 0.7
-        valid_idx = confidences[:, 1] > confidence_threshold  # Class 1 = face
+        # outputs[0]: confidences (N, num_boxes, 2)
+        # outputs[1]: boxes (N, num_boxes, 4)
+        # Step 6-8: Filter by confidence, keep the top-k anchors and apply NMS
+        # to all frames at once (class 1 = face)
+        detections = nms.batched_nms(
+            outputs[0][:, :, 1], outputs[1],
+            confidence_threshold=self.confidence_threshold,
+            iou_threshold=self.nms_iou_threshold,
+            top_k=self.nms_top_k,
+        )
+        return [
+            self._to_image_boxes(kept, preprocess.image_size(image))
+            for (kept, _), image in zip(detections, images)
+        ]
 
-        if not np.any(valid_idx):
-            return []
+    @staticmethod
+    def _to_image_boxes(boxes: np.ndarray, image_size: Tuple[int, int]) -> List[List[float]]:
+        """
+        Convert normalized [x_min, y_min, x_max, y_max] boxes to image coordinates.
 
-        filtered_boxes = boxes[valid_idx]
-        filtered_scores = confidences[valid_idx, 1]
+        Args:
+            boxes: Normalized boxes of shape (M, 4)
+            image_size: Original (width, height)
 
-        # Step 8: Apply NMS (Non-Maximum Suppression)
-        nms_boxes = self._apply_nms(filtered_boxes, filtered_scores, iou_threshold=0.3)
+        Returns:
+            List of bounding boxes [[x, y, width, height], ...]
+        """
+        orig_w, orig_h = image_size
 
         # Step 9: Convert normalized coordinates to original image scale
-        result = []
-        for box in nms_boxes:
-            # box format: [x_min, y_min, x_max, y_max] (normalized 0-1)
-            x_min = box[0] * orig_w
-            y_min = box[1] * orig_h
-            x_max = box[2] * orig_w
-            y_max = box[3] * orig_h
-
-            # Convert to [x, y, width, height]
-            width = x_max - x_min
-            height = y_max - y_min
+        scaled = boxes * np.array((orig_w, orig_h, orig_w, orig_h), dtype=boxes.dtype)
+        # Convert to [x, y, width, height]
+        scaled[:, 2:] -= scaled[:, :2]
+        return scaled.tolist()
 
-            result.append([float(x_min), float(y_min), float(width), float(height)])
-
-        return result
-    
     def extract_features(self, face_image: Image.Image) -> np.ndarray:
         """
         Extract 512-dimensional feature vector from face image using ArcFace.
@@ -139,85 +321,58 @@ class FaceEngine:
         Returns:
             512-dimensional feature vector as numpy array
         """
-        if self.arcface_session is None:
-            raise RuntimeError("ArcFace model not loaded. Please provide model file.")
-
-        # Step 1: Resize to model input size (112x112)
-        resized = face_image.resize((112, 112), Image.BILINEAR)
-
-        # Step 2: Convert to numpy array and normalize
-        # Normalization: (image - 127.5) / 127.5
-        img_array = np.array(resized, dtype=np.float32)
-        normalized = (img_array - 127.5) / 127.5
-
-        # Step 3: Add batch dimension (1, 112, 112, 3) - HWC format
-        # Note: garavv/arcface-onnx expects HWC format, not CHW
-        input_blob = np.expand_dims(normalized, axis=0).astype(np.float32)
-
-        # Step 4: Run ONNX inference
-        input_name = self.arcface_session.get_inputs()[0].name
-        outputs = self.arcface_session.run(None, {input_name: input_blob})
+        return self.extract_features_batch([face_image])[0]
 
-        # Step 5: Extract feature vector
-        feature = outputs[0][0]  # Remove batch dimension
-
-        # Step 6: L2 normalization (important for cosine similarity)
-        norm = np.linalg.norm(feature)
-        if norm > 0:
-            feature = feature / norm
-
-        return feature.astype(np.float32)
-
-    @staticmethod
-    def _apply_nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float = 0.3) -> np.ndarray:
+    def extract_features_batch(self, face_images: List[preprocess.ImageLike]) -> np.ndarray:
         """
-        Apply Non-Maximum Suppression (NMS) to filter overlapping boxes.
+        Extract feature vectors for several faces in one ArcFace run.
 
         Args:
-            boxes: Array of shape (N, 4) with format [x_min, y_min, x_max, y_max]
-            scores: Array of shape (N,) with confidence scores
-            iou_threshold: IoU threshold for suppression
+            face_images: Cropped faces as PIL Images or uint8 RGB arrays
 
         Returns:
-            Filtered boxes after NMS
+            Array of shape (N, 512) with L2-normalized feature vectors
         """
-        if len(boxes) == 0:
-            return np.array([])
-
-        # Sort by score (descending)
-        order = scores.argsort()[::-1]
+        if self.arcface_session is None:
+            raise RuntimeError("ArcFace model not loaded. Please provide model file.")
 
-        keep = []
-        while order.size > 0:
-            # Pick the box with highest score
-            i = order[0]
-            keep.append(i)
+        if not face_images:
+            return np.zeros((0, 512), dtype=np.float32)
 
-            if order.size == 1:
-                break
+        # Step 1-2: Resize and normalize into this thread's input buffer
+        input_blob = preprocess.prepare_batch(face_images, preprocess.ARCFACE_INPUT)
 
-            # Calculate IoU with remaining boxes
-            xx1 = np.maximum(boxes[i, 0], boxes[order[1:], 0])
-            yy1 = np.maximum(boxes[i, 1], boxes[order[1:], 1])
-            xx2 = np.minimum(boxes[i, 2], boxes[order[1:], 2])
-            yy2 = np.minimum(boxes[i, 3], boxes[order[1:], 3])
+        # Step 3: Run ONNX inference (one face at a time if the model has a
+        # fixed batch size of 1)
+        input_meta = self.arcface_session.get_inputs()[0]
+        if input_meta.shape[0] == 1 and len(face_images) > 1:
+            features = np.concatenate([
+                self.arcface_session.run(None, {input_meta.name: input_blob[i:i + 1]})[0]
+                for i in range(len(face_images))
+            ])
+        else:
+            features = self.arcface_session.run(None, {input_meta.name: input_blob})[0]
 
-            w = np.maximum(0.0, xx2 - xx1)
-            h = np.maximum(0.0, yy2 - yy1)
-            intersection = w * h
+        # Step 4: L2 normalization (important for cosine similarity)
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        features /= np.where(norms > 0, norms, 1.0)
 
-            area_i = (boxes[i, 2] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 1])
-            area_others = (boxes[order[1:], 2] - boxes[order[1:], 0]) * \
-                          (boxes[order[1:], 3] - boxes[order[1:], 1])
-            union = area_i + area_others - intersection
+        return features.astype(np.float32, copy=False)
 
-            iou = intersection / (union + 1e-8)
+    @staticmethod
+    def prepare_arcface_input(face_images: List[Image.Image]) -> np.ndarray:
+        """
+        Build the ArcFace input tensor for a list of face crops.
 
-            # Keep boxes with IoU < threshold
-            inds = np.where(iou <= iou_threshold)[0]
-            order = order[inds + 1]
+        Args:
+            face_images: PIL Images of cropped faces
 
-        return boxes[keep]
+        Returns:
+            float32 array of shape (N, 112, 112, 3)
+        """
+        # (N, 112, 112, 3) - HWC format
+        # Note: garavv/arcface-onnx expects HWC format, not CHW
+        return preprocess.prepare_batch(face_images, preprocess.ARCFACE_INPUT, reuse=False)
 
     @staticmethod
     def cosine_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
@@ -259,74 +414,171 @@ class FaceEngine:
                 "box": [x, y, w, h] or None
             }
         """
+        return self.recognize_batch([image], [threshold])[0][0]
+
+    def recognize_all(self, image: Image.Image, threshold: float = 0.5) -> List[Dict]:
+        """
+        Multi-face recognition: every detected face is recognized.
+
+        All faces are cropped and run through ArcFace as one batched tensor,
+        then matched against the gallery with one matrix product.
+
+        Args:
+            image: PIL Image to recognize
+            threshold: Similarity threshold for recognition
+
+        Returns:
+            List of per-face result dictionaries (same shape as
+            :meth:`recognize`), largest face first. A frame without faces
+            yields a single NO_FACE result.
+        """
+        return self.recognize_batch([image], [threshold], [True])[0]
+
+    def recognize_batch(self, images: List[preprocess.ImageLike], thresholds: List[float],
+                        multi: Optional[List[bool]] = None,
+                        trackers: Optional[List[Optional[FaceTracker]]] = None) -> List[List[Dict]]:
+        """
+        Recognize several frames together.
+
+        Detection runs over all frames as one batch, the selected faces of
+        all frames go through ArcFace as one batch, and every embedding is
+        matched against the gallery with one matrix product.
+
+        Faces of a frame with a tracker are associated with the stream's
+        tracks first; a confirmed identity is reused without extraction, and
+        each result carries ``track_id``, ``reused`` and ``log`` (False for
+        a decision already logged during the same visit).
+
+        Args:
+            images: PIL Images, uint8 RGB arrays or encoded frames
+                (``FrameImage``) to recognize
+            thresholds: Similarity threshold per image
+            multi: Per image, whether to recognize every face (True) or only
+                the largest one (False, default)
+            trackers: Per image, the face tracker of its stream (or None)
+
+        Returns:
+            Per image, a list of per-face results, largest face first. A
+            frame without faces yields a single NO_FACE result.
+        """
+        if multi is None:
+            multi = [False] * len(images)
+        if trackers is None:
+            trackers = [None] * len(images)
+
+        # Pick up gallery changes published by other workers
+        self.refresh_gallery()
+
+        results: List[List[Dict]] = [[] for _ in images]
+
+        # Step 0: Decode encoded frames at detection resolution; a frame that
+        # fails to decode gets an error result instead of failing the batch
+        decoded = []
+        for i, image in enumerate(images):
+            try:
+                preprocess.decode(image, preprocess.ULFD_INPUT.size)
+            except (OSError, ValueError) as e:
+                results[i].append(self._no_face(error=f"Invalid image: {e}"))
+            else:
+                decoded.append(i)
+
         # Step 1: Detect faces
         try:
-            boxes = self.detect_faces(image)
+            all_boxes = self.detect_faces_batch([images[i] for i in decoded])
         except RuntimeError as e:
             # Model not loaded
-            return {
-                "status": "NO_FACE",
-                "user_id": None,
-                "name": None,
-                "confidence": None,
-                "box": None,
-                "error": str(e)
-            }
-        
-        if not boxes:
-            return {
-                "status": "NO_FACE",
-                "user_id": None,
-                "name": None,
-                "confidence": None,
-                "box": None
-            }
-        
-        # Step 2: Process the largest face (assume it's the main subject)
-        largest_box = max(boxes, key=lambda b: b[2] * b[3])  # max by area
-        
-        # Step 3: Extract features
-        try:
-            face_img = crop_face(image, largest_box)
-            current_vector = self.extract_features(face_img)
-        except RuntimeError as e:
-            return {
-                "status": "NO_FACE",
-                "user_id": None,
-                "name": None,
-                "confidence": None,
-                "box": largest_box,
-                "error": str(e)
-            }
-        
-        # Step 4: Match against database
-        if not self.face_database:
+            return [[self._no_face(error=str(e))] for _ in images]
+
+        # Step 2: Select faces, largest first (only the largest one, assumed
+        # to be the main subject, unless multi-face mode is on)
+        faces: List[Tuple[int, List[float]]] = []
+        tracks = []
+        for i, boxes in zip(decoded, all_boxes):
+            boxes = sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)  # by area
+            if not multi[i]:
+                boxes = boxes[:1]
+            faces.extend((i, box) for box in boxes)
+            tracks.extend(trackers[i].associate(boxes) if trackers[i] else [None] * len(boxes))
+
+        # Step 2b: Reuse confirmed identities of tracked faces
+        face_results: List[Optional[Dict]] = [
+            trackers[i].reusable(track, thresholds[i]) if track is not None else None
+            for (i, _), track in zip(faces, tracks)
+        ]
+        pending = [n for n, result in enumerate(face_results) if result is None]
+
+        if pending:
+            # Step 3: Extract features
+            try:
+                vectors = self.extract_features_batch(
+                    [preprocess.crop(images[faces[n][0]], faces[n][1]) for n in pending]
+                )
+            except RuntimeError as e:
+                for n in pending:
+                    face_results[n] = self._no_face(box=faces[n][1], error=str(e))
+            else:
+                # Step 4-5: Match against gallery and apply threshold decision
+                for n, matches in zip(pending, self.match_batch(vectors, k=1)):
+                    i, box = faces[n]
+                    face_results[n] = self._decide(matches, thresholds[i], box)
+                    if tracks[n] is not None:
+                        trackers[i].update(tracks[n], face_results[n])
+
+        for (i, _), track, result in zip(faces, tracks, face_results):
+            if track is not None:
+                result["log"] = trackers[i].should_log(track, result)
+            results[i].append(result)
+
+        output = []
+        for tracker, frame_results in zip(trackers, results):
+            if not frame_results:
+                frame_results = [self._no_face()]
+                if tracker is not None:
+                    frame_results[0]["log"] = tracker.should_log_empty()
+            output.append(frame_results)
+        return output
+
+    @staticmethod
+    def _no_face(box: Optional[List[float]] = None, error: Optional[str] = None) -> Dict:
+        result = {
+            "status": "NO_FACE",
+            "user_id": None,
+            "name": None,
+            "confidence": None,
+            "box": box
+        }
+        if error is not None:
+            result["error"] = error
+        return result
+
+    def _decide(self, matches: List[Tuple[int, float]], threshold: float, box: List[float]) -> Dict:
+        """
+        Turn the best gallery match for one face into a PASS/REJECT result.
+
+        A match on a disabled identity is rejected but keeps its user ID and
+        name, so the attempt is logged against that user.
+        """
+        if not matches:
             # No registered users
             return {
                 "status": "REJECT",
                 "user_id": None,
                 "name": "Unknown",
                 "confidence": 0.0,
-                "box": largest_box
+                "box": box
             }
-        
-        best_match_id = None
-        max_score = 0.0
-        
-        for user_id, registered_vector in self.face_database.items():
-            score = self.cosine_similarity(current_vector, registered_vector)
-            if score > max_score:
-                max_score = score
-                best_match_id = user_id
-        
-        # Step 5: Threshold decision
+
+        best_match_id, max_score = matches[0]
+
         if max_score >= threshold:
+            identity = self.identities.get(best_match_id)
             return {
-                "status": "PASS",
+                "status": "PASS" if identity is None or identity.enabled else "REJECT",
                 "user_id": best_match_id,
-                "name": None,  # Will be filled by caller from DB
+                # None only while an identity is missing from the metadata
+                "name": identity.name if identity is not None else None,
                 "confidence": max_score,
-                "box": largest_box
+                "box": box
             }
         else:
             return {
@@ -334,48 +586,480 @@ class FaceEngine:
                 "user_id": None,
                 "name": "Unknown",
                 "confidence": max_score,
-                "box": largest_box
+                "box": box
             }
     
+    def match(self, vector: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        """
+        Find the best matching users for a feature vector.
+
+        Uses the ANN index when one is configured and the gallery is large
+        enough, re-ranking its candidate templates exactly against the
+        gallery; otherwise scans the whole gallery with one matrix-vector
+        product. Either way a user scores as their best template.
+
+        Args:
+            vector: Normalized 512-dim feature vector
+            k: Number of matches to return
+
+        Returns:
+            List of (user_id, similarity) sorted by descending similarity
+        """
+        index = self.index
+        if index is not None and index.ready and len(self.gallery) >= index.MIN_SIZE:
+            candidates = index.search(vector, max(k, self.index_rerank))
+            if candidates:
+                if self.index_rerank > 0:
+                    return self.gallery.rerank([key for key, _ in candidates], vector, k)
+                return self.gallery.identity_matches(candidates, k)
+        return self.gallery.search(vector, k)
+
+    def match_batch(self, vectors: np.ndarray, k: int = 1) -> List[List[Tuple[int, float]]]:
+        """
+        Match several feature vectors at once.
+
+        Exact search scores all of them with a single (N, 512) x (512, G)
+        matrix product; with an ANN index each vector is looked up in turn.
+
+        Args:
+            vectors: Normalized feature vectors of shape (N, 512)
+            k: Number of matches per vector
+
+        Returns:
+            One list of (user_id, similarity) per input vector
+        """
+        index = self.index
+        if index is not None and index.ready and len(self.gallery) >= index.MIN_SIZE:
+            return [self.match(vector, k) for vector in vectors]
+        return self.gallery.search_batch(vectors, k)
+
+    def configure_index(self, backend: str, nprobe: int = 8, rerank: int = 32):
+        """
+        Select the ANN index backend used in front of the gallery.
+
+        A persisted index is reused when it matches the gallery; otherwise
+        the index is rebuilt once the gallery reaches the backend's minimum
+        size.
+
+        Args:
+            backend: "exact", "ivf" or "hnsw"
+            nprobe: Cells scanned per query (search breadth for HNSW)
+            rerank: Number of ANN candidates re-ranked exactly (0 = off)
+        """
+        with self._write_lock:
+            self.index_backend = backend
+            self.index_nprobe = nprobe
+            self.index_rerank = rerank
+            self._sync_index()
+
+    def configure_detection(self, confidence_threshold: float = 0.7,
+                            iou_threshold: float = 0.3, top_k: int = nms.DEFAULT_TOP_K):
+        """
+        Set the ULFD post-processing thresholds.
+
+        Args:
+            confidence_threshold: Minimum face score of a detection
+            iou_threshold: IoU above which NMS drops the weaker of two boxes
+            top_k: Highest-scoring anchors per frame kept before NMS
+        """
+        self.confidence_threshold = confidence_threshold
+        self.nms_iou_threshold = iou_threshold
+        self.nms_top_k = top_k
+
+    def apply_config(self, config: Dict, changed: Optional[set] = None):
+        """
+        Apply system configuration to the index and detection settings.
+
+        Registered as a ``ConfigManager`` listener, so updates made by any
+        worker reach this engine without a restart.
+
+        Args:
+            config: Typed configuration values
+            changed: Keys that changed (None = apply everything)
+        """
+        if changed is None or changed & INDEX_CONFIG_KEYS:
+            self.configure_index(
+                config.get("index_backend", "exact"),
+                nprobe=config.get("index_nprobe", 8),
+                rerank=config.get("index_rerank", 32),
+            )
+        if changed is None or changed & DETECTION_CONFIG_KEYS:
+            self.configure_detection(
+                config.get("detection_confidence_threshold", 0.7),
+                iou_threshold=config.get("nms_iou_threshold", 0.3),
+                top_k=config.get("nms_top_k", nms.DEFAULT_TOP_K),
+            )
+
+    def _index_path(self, index: VectorIndex) -> Path:
+        return self.index_dir / f"gallery_{index.name}.idx"
+
+    def _sync_index(self):
+        """
+        Load the persisted index or rebuild it from the gallery (caller holds ``_write_lock``).
+
+        The new index is prepared on its own and published with a single
+        assignment; until it is ready, searches keep using the previous
+        index or exact matching.
+        """
+        index = create_index(self.index_backend, dim=self.gallery.dim, nprobe=self.index_nprobe)
+        if index is not None and not self._load_index(index):
+            if len(self.gallery) >= index.MIN_SIZE:
+                index.build(self.gallery.ids.copy(), self.gallery.matrix)
+                self._save_index(index)
+        self.index = index
+
+    def _load_index(self, index: VectorIndex) -> bool:
+        path = self._index_path(index)
+        # Workers save the index at the same time after a config change
+        with snapshot_lock(path):
+            return index.load(path, self.gallery)
+
+    def _save_index(self, index: Optional[VectorIndex] = None):
+        index = index if index is not None else self.index
+        try:
+            path = self._index_path(index)
+            with snapshot_lock(path):
+                index.save(path)
+        except Exception as e:
+            logger.warning(f"Error saving ANN index: {e}")
+
+    @property
+    def gallery_generation(self) -> int:
+        """Generation of the currently mapped snapshot (0 if none)."""
+        return self._snapshot.generation if self._snapshot is not None else 0
+
+    def _attach_snapshot(self, snapshot: GallerySnapshot):
+        """Swap the gallery to a mapped snapshot (single reference assignment)."""
+        rows = snapshot.metadata.get("identities", {})
+        self.identities = {int(uid): Identity(*row) for uid, row in rows.items()}
+        self.gallery = FaceGallery.from_arrays(snapshot.ids, snapshot.matrix, snapshot.owners,
+                                               use_centroids=self.gallery.use_centroids)
+        self._snapshot = snapshot
+
+    @contextmanager
+    def _gallery_write(self) -> Iterator[None]:
+        """Serialize gallery read-modify-write across threads and workers."""
+        with self._write_lock, snapshot_lock(self.snapshot_path):
+            yield
+
+    def _snapshot_model(self) -> Dict[str, str]:
+        """Model that produced the gallery vectors, recorded in the snapshot."""
+        return {"version": FEATURE_MODEL_VERSION, "arcface": Path(self.arcface_model_path).name}
+
+    def _snapshot_compatible(self, snapshot: GallerySnapshot) -> bool:
+        """Whether a snapshot was built for this engine's dimension and model."""
+        return (snapshot.dim == self.gallery.dim
+                and snapshot.metadata.get("model") == self._snapshot_model())
+
+    def _publish_snapshot(self):
+        """Atomically write the current gallery as a new snapshot and map it."""
+        try:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            current = open_snapshot(self.snapshot_path)
+            generation = max(self.gallery_generation,
+                             current.generation if current is not None else 0) + 1
+            # Identity metadata of every user owning a template
+            identities = {
+                str(uid): list(self.identities.get(uid) or Identity("", ""))
+                for uid in np.unique(self.gallery.owners).tolist()
+            }
+            write_snapshot(self.snapshot_path, self.gallery.ids, self.gallery.matrix, generation,
+                           metadata={"identities": identities, "model": self._snapshot_model()},
+                           owners=self.gallery.owners)
+            logger.info(f"Published gallery snapshot generation {generation} "
+                        f"({len(self.gallery)} templates)")
+            previous = self.gallery
+            snapshot = open_snapshot(self.snapshot_path)
+            if snapshot is not None:
+                self._attach_snapshot(snapshot)
+                # Same rows in the same order: keep the running means
+                self.gallery.inherit_segments(previous)
+        except OSError as e:
+            # Keep serving from private memory; other workers stay on the old snapshot
+            logger.warning(f"Error writing gallery snapshot: {e}")
+
+    def refresh_gallery(self, force: bool = False):
+        """
+        Swap to a newer snapshot if another worker published one.
+
+        The check is a single ``os.stat`` and runs at most once per
+        ``SNAPSHOT_CHECK_INTERVAL`` unless ``force`` is set.
+
+        Args:
+            force: Check immediately, ignoring the interval
+        """
+        now = time.monotonic()
+        if not force and now - self._last_snapshot_check < self.SNAPSHOT_CHECK_INTERVAL:
+            return
+        self._last_snapshot_check = now
+        if not self._snapshot_changed():
+            return
+        # One thread swaps; inference threads finding the lock taken keep
+        # serving the current gallery instead of waiting for the rebuild
+        if not self._write_lock.acquire(blocking=force):
+            return
+        try:
+            if not self._snapshot_changed():
+                return  # Another thread swapped while we waited
+            snapshot = open_snapshot(self.snapshot_path)
+            if snapshot is None or not self._snapshot_compatible(snapshot):
+                return
+            self._attach_snapshot(snapshot)
+            if self.index is not None:
+                self._sync_index()
+        finally:
+            self._write_lock.release()
+        logger.info(f"Switched to gallery snapshot generation {snapshot.generation} "
+                    f"({snapshot.count} templates)")
+
+    def _snapshot_changed(self) -> bool:
+        """Whether the snapshot file differs from the mapped one."""
+        signature = file_signature(self.snapshot_path)
+        return signature is not None and (self._snapshot is None or signature != self._snapshot.signature)
+
     def load_face_database(self, db: Session):
         """
-        Load all user face features from database into memory.
+        Load all user face features into memory.
+
+        If the shared snapshot file matches the users and user_templates
+        tables (template keys and identity metadata) and was built with the
+        same ArcFace model, it is mapped directly;
+        otherwise the features are decoded from the database and a fresh
+        snapshot is published for the other workers.
         
         Args:
             db: Database session
         """
-        users = db.query(User).all()
-        self.face_database.clear()
-        
-        for user in users:
-            try:
-                # Deserialize feature vector from JSON
-                feature_vector = np.array(json.loads(user.feature_vector), dtype=np.float32)
-                self.face_database[user.id] = feature_vector
-            except Exception as e:
-                print(f"⚠ Error loading features for user {user.id}: {e}")
-        
-        print(f"✓ Loaded {len(self.face_database)} face features into memory")
+        valid = (User.model_version == FEATURE_MODEL_VERSION) & (User.feature_dim == self.gallery.dim)
+        count, id_sum = db.query(func.count(User.id), func.coalesce(func.sum(User.id), 0)) \
+            .filter(valid).one()
+        # Extra templates of those users, keyed by negated template IDs
+        templates, template_sum = db.query(
+            func.count(UserTemplate.id), func.coalesce(func.sum(UserTemplate.id), 0)
+        ).join(User, User.id == UserTemplate.user_id).filter(
+            valid & (UserTemplate.model_version == FEATURE_MODEL_VERSION)
+            & (UserTemplate.feature_dim == self.gallery.dim)
+        ).one()
+        count += templates
+        id_sum -= template_sum
+
+        snapshot = open_snapshot(self.snapshot_path)
+        if (snapshot is not None and self._snapshot_compatible(snapshot)
+                and snapshot.count == count and snapshot.id_sum == id_sum
+                and self._snapshot_identities_current(db, snapshot, valid)):
+            self._attach_snapshot(snapshot)
+            logger.info(f"Mapped {len(self.gallery)} face features from snapshot "
+                        f"generation {snapshot.generation}")
+        else:
+            self._load_from_rows(db)
+            with self._gallery_write():
+                self._publish_snapshot()
+            print(f"✓ Loaded {len(self.gallery)} face features into memory")
+
+        self.apply_config(ConfigManager.get_config(db))
+
+    @staticmethod
+    def _snapshot_identities_current(db: Session, snapshot: GallerySnapshot, valid) -> bool:
+        """Whether the snapshot's identity metadata matches the users table."""
+        rows = snapshot.metadata.get("identities", {})
+        stored = {int(uid): Identity(*row) for uid, row in rows.items()}
+        current = {
+            uid: Identity(name, avatar_path, bool(enabled))
+            for uid, name, avatar_path, enabled in
+            db.query(User.id, User.name, User.avatar_path, User.enabled).filter(valid)
+        }
+        return stored == current
+
+    def _load_from_rows(self, db: Session):
+        """Decode all user features and templates from the database into a private gallery."""
+        users = db.query(
+            User.id, User.feature_vector, User.feature_dim, User.feature_dtype, User.model_version,
+            User.name, User.avatar_path, User.enabled
+        ).all()
+        templates = db.query(
+            UserTemplate.id, UserTemplate.user_id, UserTemplate.feature_vector,
+            UserTemplate.feature_dim, UserTemplate.feature_dtype, UserTemplate.model_version
+        ).all()
+
+        # Group rows by storage layout so each group decodes in one frombuffer pass
+        groups: Dict[Tuple[int, str], Tuple[List[int], List[int], List[bytes]]] = {}
+        identities: Dict[int, Identity] = {}
+
+        def add_row(label: str, key: int, owner: int, blob: bytes, dim: int, dtype: str,
+                    model_version: str) -> bool:
+            if model_version != FEATURE_MODEL_VERSION or dim != self.gallery.dim:
+                logger.warning(f"Skipping features for {label}: "
+                               f"model={model_version}, dim={dim}")
+                return False
+            if dtype not in SUPPORTED_DTYPES or len(blob) != dim * np.dtype(dtype).itemsize:
+                logger.warning(f"Error loading features for {label}: invalid {dtype} blob")
+                return False
+            keys, owners, blobs = groups.setdefault((dim, dtype), ([], [], []))
+            keys.append(key)
+            owners.append(owner)
+            blobs.append(blob)
+            return True
+
+        for user_id, blob, dim, dtype, model_version, name, avatar_path, enabled in users:
+            if add_row(f"user {user_id}", user_id, user_id, blob, dim, dtype, model_version):
+                identities[user_id] = Identity(name, avatar_path, bool(enabled))
+        # Templates count only for users whose enrolment vector loaded
+        for template_id, user_id, blob, dim, dtype, model_version in templates:
+            if user_id in identities:
+                add_row(f"template {template_id}", template_key(template_id), user_id,
+                        blob, dim, dtype, model_version)
+
+        gallery = FaceGallery(dim=self.gallery.dim, use_centroids=self.gallery.use_centroids)
+        keys = [key for group_keys, _, _ in groups.values() for key in group_keys]
+        if keys:
+            owners = [owner for _, group_owners, _ in groups.values() for owner in group_owners]
+            vectors = np.concatenate([
+                decode_features(blobs, dim, dtype)
+                for (dim, dtype), (_, _, blobs) in groups.items()
+            ])
+            gallery.load(keys, vectors, owners)
+        self.identities = identities
+        self.gallery = gallery
+        self._snapshot = None
     
-    def add_user_to_database(self, user_id: int, feature_vector: np.ndarray):
+    def add_user_to_database(self, user_id: int, feature_vector: np.ndarray,
+                             name: str = "", avatar_path: str = "", enabled: bool = True):
         """
         Add a user's feature vector to in-memory database.
+
+        The vector is appended to the gallery matrix without rebuilding it,
+        then a new snapshot is published for the other workers.
         
         Args:
             user_id: User ID
             feature_vector: 512-dim feature vector
+            name: User's name, returned on a match
+            avatar_path: Path of the user's avatar
+            enabled: Whether a match grants access
         """
-        self.face_database[user_id] = feature_vector
-    
+        with self._gallery_write():
+            self.refresh_gallery(force=True)
+            self.identities[user_id] = Identity(name, avatar_path, enabled)
+            self.gallery.add(user_id, feature_vector)
+            self._update_index(user_id)
+            self._publish_snapshot()
+
+    def add_users_to_database(self, users: List[Tuple[int, np.ndarray, Identity]]):
+        """
+        Add many users' feature vectors at once (bulk enrolment).
+
+        The index is updated and persisted, and a snapshot published, once
+        for the whole batch instead of once per user.
+
+        Args:
+            users: (user_id, feature_vector, identity) per user
+        """
+        if not users:
+            return
+        with self._gallery_write():
+            self.refresh_gallery(force=True)
+            for user_id, feature_vector, identity in users:
+                self.identities[user_id] = identity
+                self.gallery.add(user_id, feature_vector)
+            if self.index is not None:
+                if self.index.ready:
+                    for user_id, _, _ in users:
+                        self.index.add(user_id, self.gallery.get(user_id))
+                    self._save_index()
+                else:
+                    self._sync_index()
+            self._publish_snapshot()
+
     def remove_user_from_database(self, user_id: int):
         """
         Remove a user from in-memory database.
+
+        The last gallery row is swapped into the freed slot, then a new
+        snapshot is published for the other workers.
         
         Args:
             user_id: User ID to remove
         """
-        if user_id in self.face_database:
-            del self.face_database[user_id]
+        with self._gallery_write():
+            self.refresh_gallery(force=True)
+            self._update_index(*self.gallery.remove_owner(user_id))
+            self.identities.pop(user_id, None)
+            self._publish_snapshot()
+
+    def add_template(self, user_id: int, template_id: int, feature_vector: np.ndarray):
+        """
+        Add an extra template to an enrolled user.
+
+        A user matches with the best of their templates, so photos with
+        glasses, other lighting or a later age raise recall without
+        enrolling duplicate users.
+
+        Args:
+            user_id: User ID
+            template_id: ID of the ``user_templates`` row
+            feature_vector: 512-dim feature vector
+        """
+        with self._gallery_write():
+            self.refresh_gallery(force=True)
+            if user_id not in self.identities:
+                return
+            key = template_key(template_id)
+            self.gallery.add(key, feature_vector, owner=user_id)
+            self._update_index(key)
+            self._publish_snapshot()
+
+    def remove_template(self, template_id: int):
+        """
+        Remove an extra template of a user.
+
+        Args:
+            template_id: ID of the ``user_templates`` row
+        """
+        with self._gallery_write():
+            self.refresh_gallery(force=True)
+            key = template_key(template_id)
+            if self.gallery.remove(key):
+                self._update_index(key)
+                self._publish_snapshot()
+
+    def update_identity(self, user_id: int, name: Optional[str] = None,
+                        avatar_path: Optional[str] = None, enabled: Optional[bool] = None):
+        """
+        Update a user's identity metadata and publish it to the other workers.
+
+        Args:
+            user_id: User ID
+            name: New name (None = unchanged)
+            avatar_path: New avatar path (None = unchanged)
+            enabled: New enabled flag (None = unchanged)
+        """
+        with self._gallery_write():
+            self.refresh_gallery(force=True)
+            identity = self.identities.get(user_id)
+            if identity is None:
+                return
+            self.identities[user_id] = identity._replace(**{
+                field: value for field, value in
+                (("name", name), ("avatar_path", avatar_path), ("enabled", enabled))
+                if value is not None
+            })
+            self._publish_snapshot()
+
+    def _update_index(self, *keys: int):
+        """Mirror gallery inserts/deletes (by template key) into the ANN index and persist it once."""
+        if self.index is None or not keys:
+            return
+        if not self.index.ready:
+            # Build lazily once the gallery grows past the exact-search range
+            self._sync_index()
+            return
+        for key in keys:
+            vector = self.gallery.get(key)
+            if vector is None:
+                self.index.remove(key)
+            else:
+                self.index.add(key, vector)
+        self._save_index()
 
 
 # Global face engine instance
@@ -386,5 +1070,15 @@ def get_face_engine() -> FaceEngine:
     """Get the global face engine instance."""
     global face_engine
     if face_engine is None:
-        face_engine = FaceEngine()
+        try:
+            arcface_path = ModelDownloader.arcface_profile_path(Settings.ENGINE_PROFILE)
+        except ValueError as e:
+            logger.warning(str(e))
+            arcface_path = ModelDownloader.ARCFACE_PATH
+        if not arcface_path.exists():
+            logger.warning(f"ArcFace profile '{Settings.ENGINE_PROFILE}' not found at {arcface_path}, "
+                           f"using {ModelDownloader.ARCFACE_PATH}")
+            arcface_path = ModelDownloader.ARCFACE_PATH
+        face_engine = FaceEngine(arcface_model_path=str(arcface_path))
+        ConfigManager.add_listener(face_engine.apply_config)
     return face_engine
@@ -0,0 +1,420 @@
+"""
+In-memory face gallery backed by a contiguous, pre-normalized feature matrix.
+"""
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+
+
+class _Segments(NamedTuple):
+    """Gallery rows grouped by identity, for the per-identity max reduction."""
+    owners: np.ndarray  # (U,) sorted identity IDs
+    order: np.ndarray  # Row indices sorted by identity
+    starts: np.ndarray  # (U,) first position of each identity in ``order``
+    counts: np.ndarray  # (U,) templates per identity
+    multi: np.ndarray  # Segments of identities with several templates
+    means: Optional[np.ndarray]  # (len(multi), dim) running mean of their templates
+    centroids: Optional[np.ndarray]  # ``means``, L2-normalized
+
+
+class FaceGallery:
+    """
+    Contiguous gallery of L2-normalized feature vectors (templates).
+
+    Rows ``[0, size)`` of ``matrix`` hold the enrolled templates, ``ids``
+    their keys and ``owners`` the identity (user) each belongs to; an
+    identity may own several rows. Matching is a single matrix product over
+    all rows followed by a segment max per identity, enrolment appends in
+    amortized O(1) and deletion swaps the last row into the freed slot, so
+    the matrix is never rebuilt.
+
+    With ``use_centroids`` an identity with several templates is also scored
+    against the running mean of its templates.
+
+    A gallery can also wrap read-only arrays (e.g. a memory-mapped snapshot),
+    in which case the first mutation copies them into private memory.
+    """
+
+    def __init__(self, dim: int = 512, initial_capacity: int = 1024, use_centroids: bool = False):
+        """
+        Initialize an empty gallery.
+
+        Args:
+            dim: Feature vector dimension
+            initial_capacity: Number of rows to preallocate
+            use_centroids: Also match against per-identity template means
+        """
+        self.dim = dim
+        self.use_centroids = use_centroids
+        self._matrix = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self._ids = np.zeros(initial_capacity, dtype=np.int64)
+        self._owners = np.zeros(initial_capacity, dtype=np.int64)
+        self._size = 0
+        # key -> row index, kept in sync on swap-delete (built lazily)
+        self._row_map: Optional[Dict[int, int]] = {}
+        # Identity segments (built lazily, dropped on most mutations)
+        self._segment_cache: Optional[_Segments] = None
+
+    @classmethod
+    def from_arrays(cls, ids: np.ndarray, matrix: np.ndarray, owners: Optional[np.ndarray] = None,
+                    use_centroids: bool = False) -> "FaceGallery":
+        """
+        Wrap existing normalized arrays without copying them.
+
+        Args:
+            ids: Template keys, shape (N,)
+            matrix: L2-normalized vectors, shape (N, dim)
+            owners: Identity of each row, shape (N,) (default: ``ids``)
+            use_centroids: Also match against per-identity template means
+
+        Returns:
+            Gallery backed by the given arrays
+        """
+        gallery = cls(dim=matrix.shape[1], initial_capacity=0, use_centroids=use_centroids)
+        gallery._matrix = matrix
+        gallery._ids = ids
+        gallery._owners = ids if owners is None else owners
+        gallery._size = len(ids)
+        gallery._row_map = None
+        return gallery
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._rows
+
+    @property
+    def _rows(self) -> Dict[int, int]:
+        if self._row_map is None:
+            self._row_map = {int(uid): row for row, uid in enumerate(self._ids[:self._size])}
+        return self._row_map
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the active rows, shape (size, dim)."""
+        return self._matrix[:self._size]
+
+    @property
+    def ids(self) -> np.ndarray:
+        """View of the active template keys, shape (size,)."""
+        return self._ids[:self._size]
+
+    @property
+    def owners(self) -> np.ndarray:
+        """View of the identity of each active row, shape (size,)."""
+        return self._owners[:self._size]
+
+    @property
+    def identity_count(self) -> int:
+        """Number of distinct identities."""
+        return len(self._segments.owners)
+
+    @property
+    def _segments(self) -> _Segments:
+        if self._segment_cache is None:
+            order = np.argsort(self.owners, kind="stable")
+            owners, starts, counts = np.unique(
+                self.owners[order], return_index=True, return_counts=True
+            )
+            multi = np.flatnonzero(counts > 1)
+            means = centroids = None
+            if self.use_centroids and len(multi):
+                sums = np.add.reduceat(self.matrix[order], starts, axis=0)[multi]
+                means = sums / counts[multi, None]
+                centroids = self._normalize(means)
+            self._segment_cache = _Segments(owners, order, starts, counts, multi, means, centroids)
+        return self._segment_cache
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """L2-normalize vectors along the last axis."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / (norms + 1e-8)
+
+    def _reserve(self, capacity: int):
+        """Grow the backing arrays to hold at least ``capacity`` rows."""
+        writable = self._matrix.flags.writeable and self._ids.flags.writeable
+        if capacity <= len(self._ids) and writable:
+            return
+        # Writable arrays grow geometrically; read-only (mapped) arrays are
+        # copied into private memory on first mutation
+        growth = 2 * len(self._ids) if writable else len(self._ids)
+        new_capacity = max(capacity, growth, 16)
+        matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        ids = np.zeros(new_capacity, dtype=np.int64)
+        owners = np.zeros(new_capacity, dtype=np.int64)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids[:self._size] = self._ids[:self._size]
+        owners[:self._size] = self._owners[:self._size]
+        self._matrix = matrix
+        self._ids = ids
+        self._owners = owners
+
+    def clear(self):
+        """Remove all vectors, keeping the allocated capacity."""
+        self._size = 0
+        self._row_map = {}
+        self._segment_cache = None
+
+    def load(self, keys: Sequence[int], vectors: np.ndarray, owners: Optional[Sequence[int]] = None):
+        """
+        Replace the gallery contents in one bulk copy.
+
+        Args:
+            keys: Template keys, one per row of ``vectors``
+            vectors: Feature vectors of shape (N, dim)
+            owners: Identity of each row (default: ``keys``)
+        """
+        self.clear()
+        if len(keys) == 0:
+            return
+        self._reserve(len(keys))
+        self._matrix[:len(keys)] = self._normalize(vectors)
+        self._ids[:len(keys)] = keys
+        self._owners[:len(keys)] = keys if owners is None else owners
+        self._size = len(keys)
+        self._row_map = None
+
+    def add(self, key: int, vector: np.ndarray, owner: Optional[int] = None):
+        """
+        Add or replace a template.
+
+        Args:
+            key: Template key
+            vector: Feature vector of shape (dim,)
+            owner: Identity the template belongs to (default: ``key``)
+        """
+        owner = key if owner is None else owner
+        row = self._rows.get(key)
+        self._reserve(self._size + 1 if row is None else self._size)
+        if row is None:
+            row = self._size
+            self._size += 1
+            self._rows[key] = row
+            self._ids[row] = key
+            self._owners[row] = owner
+            self._matrix[row] = self._normalize(vector)
+            self._extend_segment(row, owner)
+        else:
+            self._owners[row] = owner
+            self._matrix[row] = self._normalize(vector)
+            self._segment_cache = None
+
+    def _extend_segment(self, row: int, owner: int):
+        """
+        Add a new row to the segments of an existing identity.
+
+        The identity's centroid is updated as a running mean; any other
+        change (a new identity, a second template) rebuilds the segments on
+        the next search. Searches may still hold the old segments, so they
+        are copied rather than modified.
+        """
+        segments = self._segment_cache
+        self._segment_cache = None
+        if segments is None:
+            return
+        s = int(np.searchsorted(segments.owners, owner))
+        if s == len(segments.owners) or segments.owners[s] != owner:
+            return
+        count = int(segments.counts[s])
+        if count == 1 and self.use_centroids:
+            return
+
+        starts = segments.starts.copy()
+        starts[s + 1:] += 1
+        counts = segments.counts.copy()
+        counts[s] += 1
+        means, centroids = segments.means, segments.centroids
+        if means is not None:
+            m = int(np.searchsorted(segments.multi, s))
+            means, centroids = means.copy(), centroids.copy()
+            means[m] += (self._matrix[row] - means[m]) / (count + 1)
+            centroids[m] = self._normalize(means[m])
+        self._segment_cache = segments._replace(
+            order=np.insert(segments.order, segments.starts[s] + count, row),
+            starts=starts,
+            counts=counts,
+            multi=segments.multi if count > 1 else np.flatnonzero(counts > 1),
+            means=means,
+            centroids=centroids,
+        )
+
+    def inherit_segments(self, other: "FaceGallery"):
+        """
+        Reuse another gallery's identity segments (and running means).
+
+        Only valid when both hold the same rows in the same order, as after
+        publishing a gallery as a snapshot and mapping it back.
+        """
+        if other._size == self._size and other.use_centroids == self.use_centroids:
+            self._segment_cache = other._segment_cache
+
+    def remove(self, key: int) -> bool:
+        """
+        Remove a template by moving the last row into its slot.
+
+        Args:
+            key: Template key to remove
+
+        Returns:
+            True if the template was present
+        """
+        if key not in self._rows:
+            return False
+        self._reserve(self._size)
+        row = self._rows.pop(key)
+        last = self._size - 1
+        if row != last:
+            moved_key = int(self._ids[last])
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved_key
+            self._owners[row] = self._owners[last]
+            self._rows[moved_key] = row
+        self._size = last
+        self._segment_cache = None
+        return True
+
+    def remove_owner(self, owner: int) -> List[int]:
+        """
+        Remove every template of an identity.
+
+        Args:
+            owner: Identity to remove
+
+        Returns:
+            Keys of the removed templates
+        """
+        keys = self.ids[self.owners == owner].tolist()
+        for key in keys:
+            self.remove(key)
+        return keys
+
+    def get(self, key: int) -> Optional[np.ndarray]:
+        """Return the stored (normalized) vector of a template, if any."""
+        row = self._rows.get(key)
+        return None if row is None else self._matrix[row]
+
+    def _identity_scores(self, queries: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reduce per-template scores to per-identity scores.
+
+        Args:
+            queries: Normalized queries of shape (N, dim)
+            scores: Template similarities of shape (N, size)
+
+        Returns:
+            Tuple of (identity IDs (U,), similarities (N, U))
+        """
+        segments = self._segments
+        if len(segments.owners) == self._size:
+            # One template per identity: nothing to reduce
+            return self.owners, scores
+        best = np.maximum.reduceat(scores[:, segments.order], segments.starts, axis=1)
+        if segments.centroids is not None:
+            best[:, segments.multi] = np.maximum(
+                best[:, segments.multi], queries @ segments.centroids.T
+            )
+        return segments.owners, best
+
+    def search(self, query: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        """
+        Find the ``k`` most similar identities to a query vector.
+
+        Args:
+            query: Feature vector of shape (dim,)
+            k: Number of results to return
+
+        Returns:
+            List of (identity, similarity) sorted by descending similarity,
+            similarities clipped to [0, 1]
+        """
+        return self.search_batch(np.asarray(query)[None, :], k)[0]
+
+    def search_batch(self, queries: np.ndarray, k: int = 1) -> List[List[Tuple[int, float]]]:
+        """
+        Find the ``k`` most similar identities for each of several queries.
+
+        All queries are scored with one (N, dim) x (dim, size) matrix product,
+        then reduced to the best template (or centroid) of each identity.
+
+        Args:
+            queries: Feature vectors of shape (N, dim)
+            k: Number of results per query
+
+        Returns:
+            One list of (identity, similarity) per query, as in :meth:`search`
+        """
+        if self._size == 0:
+            return [[] for _ in range(len(queries))]
+        queries = self._normalize(queries)
+        owners, scores = self._identity_scores(queries, queries @ self.matrix.T)
+        k = min(k, len(owners))
+        if k == 1:
+            top = np.argmax(scores, axis=1)[:, None]
+        else:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.clip(np.take_along_axis(scores, top, axis=1), 0.0, 1.0)
+        ids = owners[top]
+        return [
+            [(int(uid), float(score)) for uid, score in zip(row_ids, row_scores)]
+            for row_ids, row_scores in zip(ids, top_scores)
+        ]
+
+    @staticmethod
+    def _top_identities(owners: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Best score per identity over scattered candidates, top ``k`` first."""
+        identities, inverse = np.unique(owners, return_inverse=True)
+        best = np.full(len(identities), -np.inf, dtype=np.float32)
+        np.maximum.at(best, inverse, scores)
+        order = np.argsort(-best)[:k]
+        return [(int(identities[i]), float(np.clip(best[i], 0.0, 1.0))) for i in order]
+
+    def rerank(self, keys: List[int], query: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        """
+        Exactly re-score a candidate subset of templates against a query.
+
+        Args:
+            keys: Candidate template keys (unknown keys are ignored)
+            query: Feature vector of shape (dim,)
+            k: Number of results to return
+
+        Returns:
+            List of (identity, similarity) sorted by descending similarity
+        """
+        rows = np.array([self._rows[key] for key in keys if key in self._rows], dtype=np.int64)
+        if len(rows) == 0:
+            return []
+        query = self._normalize(query)
+        owners = self._owners[rows]
+        scores = self._matrix[rows] @ query
+        segments = self._segments
+        if segments.centroids is not None:
+            # Centroids of the candidate identities that have one
+            with_centroid = segments.owners[segments.multi]
+            positions = np.searchsorted(with_centroid, owners)
+            hit = positions < len(with_centroid)
+            hit[hit] = with_centroid[positions[hit]] == owners[hit]
+            if hit.any():
+                owners = np.concatenate([owners, owners[hit]])
+                scores = np.concatenate([scores, segments.centroids[positions[hit]] @ query])
+        return self._top_identities(owners, scores, k)
+
+    def identity_matches(self, candidates: List[Tuple[int, float]], k: int = 1) -> List[Tuple[int, float]]:
+        """
+        Reduce (template key, similarity) candidates to their best identities.
+
+        Args:
+            candidates: Approximate template matches (unknown keys are ignored)
+            k: Number of results to return
+
+        Returns:
+            List of (identity, similarity) sorted by descending similarity
+        """
+        known = [(self._rows[key], score) for key, score in candidates if key in self._rows]
+        if not known:
+            return []
+        rows, scores = zip(*known)
+        return self._top_identities(self._owners[list(rows)], np.array(scores, dtype=np.float32), k)
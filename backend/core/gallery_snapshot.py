@@ -0,0 +1,174 @@
+"""
+Memory-mapped gallery snapshot shared by all worker processes.
+
+File layout (little-endian)::
+
+    header   128 bytes  magic, version, dim, count, generation, id_sum,
+                        ids_offset, matrix_offset, metadata_offset,
+                        owners_offset
+    ids      count * int64           template keys
+    owners   count * int64           identity of each row
+    matrix   count * dim * float32   (64-byte aligned)
+    metadata UTF-8 JSON up to the end of the file (e.g. identity metadata
+             by owner)
+
+Workers map the file read-only, so every process shares the same physical
+pages. Writers build a new file next to the old one and ``os.replace`` it,
+which readers detect through a changed inode/mtime.
+"""
+import json
+import os
+import struct
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single worker only
+    fcntl = None
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+MAGIC = b"FGSNAP01"
+FORMAT_VERSION = 3
+HEADER = struct.Struct("<8sIIQQqQQQQ")
+HEADER_SIZE = 128
+ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def id_checksum(ids: np.ndarray) -> int:
+    """Order-independent checksum of a template key set (wrapping int64 sum)."""
+    return int(np.sum(ids, dtype=np.int64))
+
+
+class GallerySnapshot:
+    """A read-only, memory-mapped view of a snapshot file."""
+
+    def __init__(self, path: Path):
+        """
+        Map a snapshot file.
+
+        Args:
+            path: Snapshot file path
+
+        Raises:
+            ValueError: If the file is not a valid snapshot
+        """
+        self.path = Path(path)
+        stat = os.stat(self.path)
+        self.signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        with open(self.path, "rb") as f:
+            raw = f.read(HEADER_SIZE)
+        if len(raw) < HEADER_SIZE:
+            raise ValueError("truncated snapshot header")
+        (magic, version, self.dim, self.count, self.generation, self.id_sum,
+         ids_offset, matrix_offset, metadata_offset, owners_offset) = HEADER.unpack_from(raw)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot format {magic!r} v{version}")
+        if stat.st_size < metadata_offset or metadata_offset < matrix_offset + self.count * self.dim * 4:
+            raise ValueError("truncated snapshot data")
+
+        with open(self.path, "rb") as f:
+            f.seek(metadata_offset)
+            raw_metadata = f.read()
+        try:
+            self.metadata: Dict[str, Any] = json.loads(raw_metadata) if raw_metadata else {}
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid snapshot metadata: {e}")
+
+        if self.count:
+            self.ids = np.memmap(self.path, dtype="<i8", mode="r",
+                                 offset=ids_offset, shape=(self.count,))
+            self.owners = np.memmap(self.path, dtype="<i8", mode="r",
+                                    offset=owners_offset, shape=(self.count,))
+            self.matrix = np.memmap(self.path, dtype="<f4", mode="r",
+                                    offset=matrix_offset, shape=(self.count, self.dim))
+        else:
+            self.ids = np.zeros(0, dtype=np.int64)
+            self.owners = np.zeros(0, dtype=np.int64)
+            self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+
+
+def open_snapshot(path: Path) -> Optional[GallerySnapshot]:
+    """Map a snapshot file, returning None if it is missing or invalid."""
+    if not Path(path).exists():
+        return None
+    try:
+        return GallerySnapshot(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring gallery snapshot {path}: {e}")
+        return None
+
+
+def file_signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    """Cheap identity of the current snapshot file, used to detect swaps."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def write_snapshot(path: Path, ids: np.ndarray, matrix: np.ndarray, generation: int,
+                   metadata: Optional[Dict[str, Any]] = None, owners: Optional[np.ndarray] = None):
+    """
+    Atomically write a snapshot file.
+
+    Args:
+        path: Destination path
+        ids: Template keys, shape (N,)
+        matrix: Normalized vectors, shape (N, dim)
+        generation: Monotonic snapshot version
+        metadata: JSON-serializable data stored after the matrix
+        owners: Identity of each row, shape (N,) (default: ``ids``)
+    """
+    path = Path(path)
+    count, dim = matrix.shape
+    ids_offset = HEADER_SIZE
+    owners_offset = ids_offset + count * 8
+    matrix_offset = _align(owners_offset + count * 8)
+    metadata_offset = matrix_offset + count * dim * 4
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, dim, count, generation, id_checksum(ids),
+                         ids_offset, matrix_offset, metadata_offset, owners_offset)
+
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.write(np.ascontiguousarray(ids, dtype="<i8").tobytes())
+        f.write(np.ascontiguousarray(ids if owners is None else owners, dtype="<i8").tobytes())
+        f.write(b"\0" * (matrix_offset - owners_offset - count * 8))
+        f.write(np.ascontiguousarray(matrix, dtype="<f4").tobytes())
+        if metadata:
+            f.write(json.dumps(metadata, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def snapshot_lock(path: Path) -> Iterator[None]:
+    """
+    Exclusive cross-process lock serializing snapshot read-modify-write.
+
+    Without it two workers enrolling at once could each publish a snapshot
+    missing the other's change.
+    """
+    if fcntl is None:
+        yield
+        return
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
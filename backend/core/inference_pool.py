@@ -0,0 +1,191 @@
+"""
+Bounded worker pool that keeps ONNX inference off the asyncio event loop.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from core.settings import Settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when all workers are busy and the wait queue is full."""
+
+
+class StaleFrameError(PoolSaturatedError):
+    """Raised when a frame waited in the queue longer than allowed."""
+
+
+def resolve_thread_budget(workers: int = 0, intra_op_threads: int = 0,
+                          cpu_count: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Split the CPU cores between pool workers and onnxruntime intra-op threads.
+
+    Each worker runs one session call at a time, so ``workers *
+    intra_op_threads`` should not exceed the core count.
+
+    Args:
+        workers: Requested worker count (0 = derive)
+        intra_op_threads: Requested intra-op threads per session (0 = derive)
+        cpu_count: Available cores (defaults to ``os.cpu_count()``)
+
+    Returns:
+        Tuple of (workers, intra_op_threads)
+    """
+    cpus = cpu_count or os.cpu_count() or 1
+    if workers <= 0 and intra_op_threads <= 0:
+        intra_op_threads = min(4, cpus)
+    if workers <= 0:
+        workers = max(1, cpus // intra_op_threads)
+    if intra_op_threads <= 0:
+        intra_op_threads = max(1, cpus // workers)
+    return workers, intra_op_threads
+
+
+class InferencePool:
+    """
+    Thread pool with a bounded queue and backpressure.
+
+    onnxruntime releases the GIL while a session runs, so threads scale
+    across cores without the model and gallery copies a process pool needs.
+    At most ``workers + queue_size`` calls may be in flight; beyond that
+    :meth:`run` fails fast with :class:`PoolSaturatedError`.
+
+    Background jobs (bulk enrolment) submit through :meth:`call` and share
+    the same workers, so they stay within the thread budget and only take a
+    worker that live requests leave idle.
+    """
+
+    def __init__(self, workers: int, queue_size: int, max_wait_ms: int):
+        """
+        Args:
+            workers: Number of worker threads
+            queue_size: Calls allowed to wait for a free worker
+            max_wait_ms: Queue wait after which droppable calls are discarded
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_wait_ms = max_wait_ms
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        # Signalled whenever a call finishes (background calls wait on it)
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._dropped_stale = 0
+
+    def _acquire(self) -> bool:
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_size:
+                self._rejected += 1
+                return False
+            self._in_flight += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+            self._idle.notify()
+
+    async def run(self, fn: Callable, *args, drop_stale: bool = False, **kwargs) -> Any:
+        """
+        Run ``fn(*args, **kwargs)`` on a worker thread.
+
+        Args:
+            fn: Blocking callable (typically an engine method)
+            drop_stale: Discard the call if it waited longer than
+                ``max_wait_ms`` before a worker picked it up
+            *args, **kwargs: Arguments for ``fn``
+
+        Returns:
+            The return value of ``fn``
+
+        Raises:
+            PoolSaturatedError: If the pool and its queue are full
+            StaleFrameError: If ``drop_stale`` is set and the call went stale
+        """
+        if not self._acquire():
+            raise PoolSaturatedError("Inference workers are saturated")
+
+        submitted = time.monotonic()
+
+        def task():
+            waited_ms = (time.monotonic() - submitted) * 1000
+            if drop_stale and self.max_wait_ms > 0 and waited_ms > self.max_wait_ms:
+                with self._lock:
+                    self._dropped_stale += 1
+                raise StaleFrameError(f"Frame dropped after waiting {waited_ms:.0f} ms")
+            return fn(*args, **kwargs)
+
+        try:
+            return await asyncio.wrap_future(self._executor.submit(task))
+        finally:
+            self._release()
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run ``fn(*args, **kwargs)`` on a worker thread from a background thread.
+
+        Blocks until a worker is idle instead of queueing, so background
+        work never fills the queue live requests depend on.
+
+        Args:
+            fn: Blocking callable (typically an engine method)
+            *args, **kwargs: Arguments for ``fn``
+
+        Returns:
+            The return value of ``fn``
+        """
+        with self._idle:
+            while self._in_flight >= self.workers:
+                self._idle.wait()
+            self._in_flight += 1
+        try:
+            return self._executor.submit(fn, *args, **kwargs).result()
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, int]:
+        """Current pool counters."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "dropped_stale": self._dropped_stale,
+            }
+
+    def shutdown(self):
+        """Stop accepting work and wait for running calls to finish."""
+        self._executor.shutdown(wait=True)
+
+
+# Global inference pool instance
+inference_pool: Optional[InferencePool] = None
+
+
+def get_inference_pool() -> InferencePool:
+    """Get the global inference pool instance."""
+    global inference_pool
+    if inference_pool is None:
+        workers, intra_op_threads = resolve_thread_budget(
+            Settings.INFERENCE_WORKERS, Settings.ORT_INTRA_OP_THREADS
+        )
+        inference_pool = InferencePool(
+            workers=workers,
+            queue_size=Settings.INFERENCE_QUEUE_SIZE,
+            max_wait_ms=Settings.INFERENCE_MAX_WAIT_MS,
+        )
+        logger.info(f"Inference pool: {workers} workers x {intra_op_threads} intra-op threads, "
+                    f"queue {Settings.INFERENCE_QUEUE_SIZE}")
+    return inference_pool
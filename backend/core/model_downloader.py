@@ -26,6 +26,28 @@ class ModelDownloader:
     ULFD_PATH = MODELS_DIR / "ulfd.onnx"
     ARCFACE_PATH = MODELS_DIR / "arcface.onnx"
 
+    # ArcFace engine profiles; quantized variants are generated locally by
+    # core.quantization from the float32 download
+    ARCFACE_PROFILES = ("fp32", "fp16", "int8-dynamic", "int8-static")
+
+    @classmethod
+    def arcface_profile_path(cls, profile: str) -> Path:
+        """
+        Get the local path of an ArcFace profile.
+
+        Args:
+            profile: One of ARCFACE_PROFILES
+
+        Returns:
+            Model path (the downloaded model for "fp32")
+        """
+        if profile not in cls.ARCFACE_PROFILES:
+            raise ValueError(f"Unknown ArcFace profile '{profile}', "
+                             f"expected one of {', '.join(cls.ARCFACE_PROFILES)}")
+        if profile == "fp32":
+            return cls.ARCFACE_PATH
+        return cls.MODELS_DIR / f"arcface.{profile}.onnx"
+
     @staticmethod
     async def download_file(url: str, dest_path: Path, description: str = "Downloading", max_retries: int = 3) -> bool:
         """
@@ -0,0 +1,136 @@
+"""
+Change detection between consecutive frames of a stream.
+
+A static scene (an empty corridor) produces nearly identical frames.
+``MotionGate`` compares a tiny grayscale thumbnail of each frame with the
+last frame that was fully recognized; when too few pixels changed, the
+stream reuses that frame's result instead of running detection.
+"""
+import io
+import time
+from typing import Dict, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+from core.preprocess import ImageLike
+from core.settings import Settings
+from utils.image_utils import FrameImage
+
+
+def thumbnail(image: ImageLike, width: int = 32) -> np.ndarray:
+    """
+    Tiny grayscale version of a frame.
+
+    JPEG frames are decoded in grayscale at 1/8 scale (luma only, no color
+    conversion), so this costs a fraction of a detection decode.
+
+    Args:
+        image: Frame to reduce
+        width: Thumbnail width; the height keeps the aspect ratio
+
+    Returns:
+        uint8 array of shape (height, width)
+    """
+    if isinstance(image, FrameImage):
+        source = Image.open(io.BytesIO(image.data))
+        if image.is_jpeg:
+            source.draft("L", (width, 1))
+    elif isinstance(image, np.ndarray):
+        source = Image.fromarray(image)
+    else:
+        source = image
+    height = max(1, round(width * source.height / source.width))
+    return np.asarray(source.convert("L").resize((width, height), Image.BILINEAR))
+
+
+class MotionGate:
+    """
+    Per-stream gate that skips recognition of unchanged frames.
+
+    A frame counts as changed when more than ``changed_fraction`` of its
+    thumbnail pixels differ by more than ``pixel_delta`` grey levels from the
+    reference, the last frame that was recognized. Comparing with the
+    reference rather than the previous frame keeps slow changes from
+    slipping through a frame at a time.
+    """
+
+    # Totals over all gates of this process, reported on /health
+    _total_frames = 0
+    _total_skipped = 0
+
+    def __init__(self, pixel_delta: int = 20, changed_fraction: float = 0.01,
+                 max_skip_seconds: float = 1.0, width: int = 32):
+        """
+        Args:
+            pixel_delta: Grey-level difference above which a pixel changed
+            changed_fraction: Fraction of changed pixels that makes a frame
+                changed
+            max_skip_seconds: Recognize at least this often, changed or not
+            width: Thumbnail width
+        """
+        self.pixel_delta = pixel_delta
+        self.changed_fraction = changed_fraction
+        self.max_skip_seconds = max_skip_seconds
+        self.width = width
+        self._reference: Optional[np.ndarray] = None
+        self._reference_time = 0.0
+        self.frames = 0
+        self.skipped = 0
+
+    @classmethod
+    def from_settings(cls) -> "MotionGate":
+        return cls(
+            pixel_delta=Settings.MOTION_PIXEL_DELTA,
+            changed_fraction=Settings.MOTION_CHANGED_FRACTION,
+            max_skip_seconds=Settings.MOTION_MAX_SKIP_SECONDS,
+            width=Settings.MOTION_THUMBNAIL_WIDTH,
+        )
+
+    def check(self, image: ImageLike) -> Tuple[bool, np.ndarray]:
+        """
+        Decide whether a frame needs recognition.
+
+        Args:
+            image: The new frame
+
+        Returns:
+            (changed, thumbnail); pass the thumbnail to ``accept`` once the
+            frame has been recognized
+        """
+        thumb = thumbnail(image, self.width)
+        self.frames += 1
+        MotionGate._total_frames += 1
+
+        reference = self._reference
+        changed = (
+            reference is None or reference.shape != thumb.shape
+            or time.monotonic() - self._reference_time >= self.max_skip_seconds
+            or np.count_nonzero(
+                np.abs(thumb.astype(np.int16) - reference) > self.pixel_delta
+            ) > self.changed_fraction * thumb.size
+        )
+        if not changed:
+            self.skipped += 1
+            MotionGate._total_skipped += 1
+        return changed, thumb
+
+    def accept(self, thumb: np.ndarray):
+        """Make a recognized frame the new reference."""
+        self._reference = thumb
+        self._reference_time = time.monotonic()
+
+    def stats(self) -> Dict:
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "skip_rate": round(self.skipped / self.frames, 3) if self.frames else 0.0,
+        }
+
+    @classmethod
+    def totals(cls) -> Dict:
+        """Skip counters over all streams of this process."""
+        return {
+            "frames": cls._total_frames,
+            "skipped": cls._total_skipped,
+            "skip_rate": round(cls._total_skipped / cls._total_frames, 3) if cls._total_frames else 0.0,
+        }
@@ -0,0 +1,191 @@
+"""
+Model input preprocessing on uint8 arrays.
+
+Images may be PIL Images, uint8 RGB arrays or encoded ``FrameImage`` frames
+(decoded at reduced resolution where possible); crops of an array frame are
+views rather than copies. Resizing runs in Pillow's C resampler, and the
+float conversion, normalization and HWC/CHW layout change are fused into a
+single write into a per-thread input buffer that is reused across calls, so
+a frame allocates no full-size float temporaries.
+"""
+import threading
+from typing import Dict, List, Sequence, Tuple, Union
+import numpy as np
+from PIL import Image
+
+from utils.image_utils import FrameImage, crop_face
+
+ImageLike = Union[Image.Image, np.ndarray, FrameImage]
+
+
+class InputSpec:
+    """Input size, normalization and layout of one model."""
+
+    def __init__(self, name: str, size: Tuple[int, int], mean: float, std: float, layout: str):
+        """
+        Args:
+            name: Buffer key
+            size: Model input (width, height)
+            mean: Value subtracted from every pixel
+            std: Value every pixel is divided by
+            layout: "CHW" or "HWC" (per image, after the batch axis)
+        """
+        self.name = name
+        self.size = size
+        self.mean = np.float32(mean)
+        self.scale = np.float32(1.0 / std)
+        self.layout = layout
+
+    def shape(self, batch: int) -> Tuple[int, ...]:
+        width, height = self.size
+        if self.layout == "CHW":
+            return (batch, 3, height, width)
+        return (batch, height, width, 3)
+
+
+# ULFD: (image - 127) / 128, NCHW 320x240
+ULFD_INPUT = InputSpec("ulfd", (320, 240), mean=127.0, std=128.0, layout="CHW")
+# ArcFace (garavv/arcface-onnx): (image - 127.5) / 127.5, NHWC 112x112
+ARCFACE_INPUT = InputSpec("arcface", (112, 112), mean=127.5, std=127.5, layout="HWC")
+
+
+def decode(image: ImageLike, size: Tuple[int, int]) -> None:
+    """
+    Decode an encoded frame at the scale :func:`resize` will use for ``size``.
+
+    Lets callers surface decode errors per frame before batching; a no-op
+    for decoded images.
+    """
+    if isinstance(image, FrameImage):
+        image.decode(size)
+
+
+def to_array(image: ImageLike) -> np.ndarray:
+    """
+    View an image as a uint8 RGB array of shape (H, W, 3).
+
+    Arrays that already are uint8 RGB are returned unchanged.
+    """
+    if isinstance(image, np.ndarray):
+        if image.dtype != np.uint8 or image.ndim != 3 or image.shape[2] != 3:
+            raise ValueError(f"Expected a uint8 (H, W, 3) array, got {image.dtype} {image.shape}")
+        return image
+    if isinstance(image, FrameImage):
+        image = image.to_image()
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return np.asarray(image)
+
+
+def image_size(image: ImageLike) -> Tuple[int, int]:
+    """(width, height) of an image; the full resolution for encoded frames."""
+    if isinstance(image, np.ndarray):
+        return image.shape[1], image.shape[0]
+    return image.size
+
+
+def crop(image: ImageLike, box: Sequence[float]) -> ImageLike:
+    """
+    Crop a face region; for arrays the crop is a view of the frame.
+
+    Args:
+        image: PIL Image, uint8 (H, W, 3) array or encoded frame
+        box: Bounding box [x, y, width, height]
+
+    Returns:
+        Cropped region (a PIL Image for encoded frames, else the type of ``image``)
+    """
+    if isinstance(image, FrameImage):
+        return image.crop(box, min_side=min(ARCFACE_INPUT.size))
+    if not isinstance(image, np.ndarray):
+        return crop_face(image, box)
+    x, y, w, h = box
+    height, width = image.shape[:2]
+    left = max(0, int(x))
+    top = max(0, int(y))
+    right = min(width, int(x + w))
+    bottom = min(height, int(y + h))
+    return image[top:bottom, left:right]
+
+
+def resize(image: ImageLike, size: Tuple[int, int]) -> np.ndarray:
+    """
+    Bilinear resize to (width, height), returning a uint8 array.
+
+    Images already at the target size are not copied; encoded frames are
+    decoded at the smallest scale covering ``size``.
+    """
+    if isinstance(image, FrameImage):
+        image = image.decode(size)
+    if image_size(image) == tuple(size):
+        return to_array(image)
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(np.ascontiguousarray(image))
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    return np.asarray(image.resize(size, Image.BILINEAR))
+
+
+class _Buffers(threading.local):
+    """Per-thread model input buffers, grown to the largest batch seen."""
+
+    def __init__(self):
+        self.arrays: Dict[str, np.ndarray] = {}
+
+
+_buffers = _Buffers()
+
+
+def input_buffer(spec: InputSpec, batch: int) -> np.ndarray:
+    """
+    Get this thread's reusable input tensor for ``batch`` images.
+
+    The returned array is overwritten by the next call on the same thread,
+    so it must not be kept after the session run that consumes it.
+    """
+    buffer = _buffers.arrays.get(spec.name)
+    if buffer is None or buffer.shape[0] < batch:
+        buffer = np.empty(spec.shape(batch), dtype=np.float32)
+        _buffers.arrays[spec.name] = buffer
+    return buffer[:batch]
+
+
+def fill(out: np.ndarray, image: ImageLike, spec: InputSpec):
+    """
+    Resize and normalize one image into a single-image slot of an input tensor.
+
+    Args:
+        out: Slot of shape ``spec.shape(1)[1:]``
+        image: PIL Image or uint8 (H, W, 3) array
+        spec: Model input specification
+    """
+    pixels = resize(image, spec.size)
+    # Reading through a transposed view does the uint8 -> float32 cast, the
+    # mean subtraction and the HWC -> CHW change in one pass (strided reads
+    # of the small uint8 image are cheaper than strided float32 writes)
+    if spec.layout == "CHW":
+        pixels = pixels.transpose(2, 0, 1)
+    np.subtract(pixels, spec.mean, out=out, dtype=np.float32)
+    np.multiply(out, spec.scale, out=out)
+
+
+def prepare_batch(images: List[ImageLike], spec: InputSpec, reuse: bool = True) -> np.ndarray:
+    """
+    Build a model input tensor for a list of images.
+
+    Args:
+        images: PIL Images or uint8 (H, W, 3) arrays
+        spec: Model input specification
+        reuse: Write into this thread's shared buffer (see
+            :func:`input_buffer`) instead of a new array
+
+    Returns:
+        float32 array of shape ``spec.shape(len(images))``
+    """
+    if reuse:
+        blob = input_buffer(spec, len(images))
+    else:
+        blob = np.empty(spec.shape(len(images)), dtype=np.float32)
+    for i, image in enumerate(images):
+        fill(blob[i], image, spec)
+    return blob
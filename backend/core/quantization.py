@@ -0,0 +1,221 @@
+"""
+Quantized ArcFace profiles and an offline accuracy harness.
+
+Usage (from the backend directory):
+
+    python -m core.quantization build --profile int8-dynamic
+    python -m core.quantization build --profile int8-static --calibration-limit 200
+    python -m core.quantization build --profile fp16
+    python -m core.quantization compare --profile int8-dynamic
+
+``compare`` embeds every enrolled avatar with the float32 model and with the
+selected profile, and reports cosine drift and rank-1 agreement, so a profile
+can be checked on the local gallery before ``FACEGUARD_ENGINE_PROFILE`` is
+switched in production.
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+
+try:
+    from onnxruntime.quantization import CalibrationDataReader
+except ImportError:  # onnxruntime.quantization needs the optional 'onnx' package
+    CalibrationDataReader = object
+
+from core.face_engine import FaceEngine
+from core.model_downloader import ModelDownloader
+from database import SessionLocal, User
+from utils.image_utils import crop_face, load_image
+from utils.logger import get_logger, setup_logger
+
+logger = get_logger(__name__)
+
+
+def load_avatar_faces(limit: Optional[int] = None) -> List[tuple]:
+    """
+    Detect and crop the largest face of every enrolled user's avatar.
+
+    Args:
+        limit: Maximum number of users to load
+
+    Returns:
+        List of (user_id, face PIL Image)
+    """
+    detector = FaceEngine(arcface_model_path="")
+    db = SessionLocal()
+    try:
+        query = db.query(User.id, User.avatar_path).order_by(User.id)
+        if limit:
+            query = query.limit(limit)
+        users = query.all()
+    finally:
+        db.close()
+
+    faces = []
+    for user_id, avatar_path in users:
+        try:
+            image = load_image(avatar_path)
+            boxes = detector.detect_faces(image)
+        except Exception as e:
+            logger.warning(f"Skipping avatar of user {user_id}: {e}")
+            continue
+        if boxes:
+            largest_box = max(boxes, key=lambda b: b[2] * b[3])
+            faces.append((user_id, crop_face(image, largest_box)))
+    return faces
+
+
+class AvatarCalibrationReader(CalibrationDataReader):
+    """
+    Calibration data reader for static INT8 quantization.
+
+    Feeds preprocessed avatar face crops one at a time, matching what the
+    engine sends to ArcFace at runtime.
+    """
+
+    def __init__(self, input_name: str, faces: List[tuple]):
+        super().__init__()
+        self.input_name = input_name
+        self._faces = faces
+        self._iter: Optional[Iterator] = None
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        if self._iter is None:
+            self._iter = iter(self._faces)
+        item = next(self._iter, None)
+        if item is None:
+            return None
+        return {self.input_name: FaceEngine.prepare_arcface_input([item[1]])}
+
+    def rewind(self):
+        self._iter = None
+
+
+def build_profile(profile: str, calibration_limit: int = 200) -> Path:
+    """
+    Generate a quantized ArcFace model from the float32 download.
+
+    Args:
+        profile: "fp16", "int8-dynamic" or "int8-static"
+        calibration_limit: Maximum avatars used to calibrate int8-static
+
+    Returns:
+        Path of the generated model
+    """
+    src = ModelDownloader.ARCFACE_PATH
+    dst = ModelDownloader.arcface_profile_path(profile)
+    if profile == "fp32":
+        return src
+    if not src.exists():
+        raise FileNotFoundError(f"Float32 ArcFace model not found at {src}")
+
+    if profile == "int8-dynamic":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(src), str(dst), weight_type=QuantType.QInt8)
+
+    elif profile == "int8-static":
+        import onnxruntime as ort
+        from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+        faces = load_avatar_faces(limit=calibration_limit)
+        if not faces:
+            raise RuntimeError("No enrolled avatars with a detectable face to calibrate with")
+        input_name = ort.InferenceSession(str(src)).get_inputs()[0].name
+        logger.info(f"Calibrating with {len(faces)} avatars")
+        quantize_static(str(src), str(dst), AvatarCalibrationReader(input_name, faces),
+                        quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8)
+
+    elif profile == "fp16":
+        try:
+            import onnx
+            from onnxconverter_common import float16
+        except ImportError:
+            raise RuntimeError("fp16 conversion needs the optional 'onnxconverter-common' package")
+
+        model = float16.convert_float_to_float16(onnx.load(str(src)), keep_io_types=True)
+        onnx.save(model, str(dst))
+
+    else:
+        raise ValueError(f"Unknown profile '{profile}'")
+
+    logger.info(f"Built {profile} ArcFace model at {dst} "
+                f"({dst.stat().st_size / 1e6:.1f} MB, float32 {src.stat().st_size / 1e6:.1f} MB)")
+    return dst
+
+
+def compare_profile(profile: str, limit: Optional[int] = None) -> Dict:
+    """
+    Compare a profile's embeddings with the float32 model on the local gallery.
+
+    Args:
+        profile: Profile to evaluate
+        limit: Maximum number of users to evaluate
+
+    Returns:
+        Report with cosine drift statistics and rank-1 agreement:
+        - cross_rank1: probes from the profile matched against a float32
+          gallery (the state right after switching) find their own user
+        - neighbour_agreement: each user's nearest other user is the same
+          under both models
+    """
+    faces = load_avatar_faces(limit=limit)
+    if len(faces) < 2:
+        raise RuntimeError("Need at least two enrolled avatars with a detectable face")
+
+    reference = FaceEngine(ulfd_model_path="", arcface_model_path=str(ModelDownloader.ARCFACE_PATH))
+    candidate = FaceEngine(ulfd_model_path="",
+                           arcface_model_path=str(ModelDownloader.arcface_profile_path(profile)))
+    crops = [face for _, face in faces]
+    ref = reference.extract_features_batch(crops)
+    cand = candidate.extract_features_batch(crops)
+
+    drift = np.sum(ref * cand, axis=1)
+    own = np.arange(len(faces))
+
+    cross_rank1 = np.argmax(cand @ ref.T, axis=1) == own
+
+    ref_sim = ref @ ref.T
+    cand_sim = cand @ cand.T
+    np.fill_diagonal(ref_sim, -np.inf)
+    np.fill_diagonal(cand_sim, -np.inf)
+    neighbour_agreement = np.argmax(ref_sim, axis=1) == np.argmax(cand_sim, axis=1)
+
+    return {
+        "profile": profile,
+        "faces": len(faces),
+        "cosine_mean": round(float(drift.mean()), 6),
+        "cosine_min": round(float(drift.min()), 6),
+        "cosine_p5": round(float(np.percentile(drift, 5)), 6),
+        "cross_rank1": round(float(cross_rank1.mean()), 6),
+        "neighbour_agreement": round(float(neighbour_agreement.mean()), 6),
+        "worst_users": [faces[i][0] for i in np.argsort(drift)[:5]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and evaluate quantized ArcFace profiles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Generate a quantized model")
+    build.add_argument("--profile", required=True, choices=ModelDownloader.ARCFACE_PROFILES[1:])
+    build.add_argument("--calibration-limit", type=int, default=200)
+
+    compare = subparsers.add_parser("compare", help="Compare a profile against float32")
+    compare.add_argument("--profile", required=True, choices=ModelDownloader.ARCFACE_PROFILES[1:])
+    compare.add_argument("--limit", type=int, default=None)
+
+    args = parser.parse_args()
+    setup_logger(log_file=None)
+    if args.command == "build":
+        build_profile(args.profile, calibration_limit=args.calibration_limit)
+    else:
+        print(json.dumps(compare_profile(args.profile, limit=args.limit), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Retention for access logs and recognition snapshots.
+
+A background job periodically deletes expired ``access_logs`` rows in small
+chunks, moves their snapshots into one zip archive per day, and returns the
+freed database pages to the file system with incremental vacuum. Statistics
+are kept in the hourly rollups, which are not purged.
+"""
+import os
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, or_, select, text
+from sqlalchemy.orm import Session
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single worker only
+    fcntl = None
+
+from core.settings import Settings
+from database import AccessLog, SessionLocal
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Pause between chunks so recognition requests can take the write lock
+CHUNK_PAUSE_SECONDS = 0.05
+
+
+@contextmanager
+def _try_lock(path: Path) -> Iterator[bool]:
+    """Non-blocking cross-process lock; yields whether it was acquired."""
+    if fcntl is None:
+        yield True
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class RetentionPolicy:
+    """Which access log rows and snapshots are expired."""
+
+    def __init__(self, max_age_days: int = 90, max_rows: int = 0, chunk_size: int = 1000,
+                 archive_snapshots: bool = True, archive_dir: str = "data/archive",
+                 vacuum_pages: int = 1000):
+        """
+        Args:
+            max_age_days: Rows older than this are removed (0 = no age limit)
+            max_rows: Only the newest rows are kept (0 = no count limit)
+            chunk_size: Rows deleted per transaction
+            archive_snapshots: Archive expired snapshots instead of deleting them
+            archive_dir: Directory of the per-day snapshot archives
+            vacuum_pages: Free pages released per incremental vacuum step
+        """
+        self.max_age_days = max_age_days
+        self.max_rows = max_rows
+        self.chunk_size = chunk_size
+        self.archive_snapshots = archive_snapshots
+        self.archive_dir = Path(archive_dir)
+        self.vacuum_pages = vacuum_pages
+
+    @classmethod
+    def from_settings(cls) -> "RetentionPolicy":
+        return cls(
+            max_age_days=Settings.RETENTION_MAX_AGE_DAYS,
+            max_rows=Settings.RETENTION_MAX_ROWS,
+            chunk_size=Settings.RETENTION_CHUNK_SIZE,
+            archive_snapshots=Settings.RETENTION_ARCHIVE_SNAPSHOTS,
+            archive_dir=Settings.RETENTION_ARCHIVE_DIR,
+            vacuum_pages=Settings.RETENTION_VACUUM_PAGES,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_days > 0 or self.max_rows > 0
+
+    def cutoff(self) -> Optional[datetime]:
+        """Rows and snapshots older than this are expired (None = no age limit)."""
+        if self.max_age_days <= 0:
+            return None
+        return datetime.utcnow() - timedelta(days=self.max_age_days)
+
+
+class RetentionJob:
+    """
+    Applies a retention policy periodically on a background thread.
+
+    With several workers only one runs the job at a time (file lock); the
+    others skip that round.
+    """
+
+    def __init__(self, policy: RetentionPolicy, session_factory: Callable[[], Session] = SessionLocal,
+                 snapshot_dir: str = "static/logs", interval_minutes: int = 60):
+        """
+        Args:
+            policy: Retention policy
+            session_factory: Creates the database sessions used by the job
+            snapshot_dir: Directory recognition snapshots are written to
+            interval_minutes: Time between runs
+        """
+        self.policy = policy
+        self.session_factory = session_factory
+        self.snapshot_dir = Path(snapshot_dir)
+        self.interval_minutes = interval_minutes
+        self.lock_path = Path("data/retention.lock")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._last_run: Optional[Dict] = None
+        self._runs = 0
+
+    def start(self):
+        """Start the background job (no-op if the policy keeps everything)."""
+        if not self.policy.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Retention run failed: {e}")
+            self._stop.wait(self.interval_minutes * 60)
+
+    def run_once(self) -> Optional[Dict]:
+        """
+        Apply the policy now.
+
+        Returns:
+            Run statistics, or None if another worker is running the job
+        """
+        with _try_lock(self.lock_path) as acquired:
+            if not acquired:
+                return None
+            started = time.monotonic()
+            result = {
+                "rows_deleted": self._purge_rows(),
+                "orphans_archived": self._sweep_orphans(),
+                "pages_vacuumed": self._vacuum(),
+            }
+            result["duration_s"] = round(time.monotonic() - started, 2)
+            result["finished_at"] = datetime.utcnow().isoformat()
+
+        with self._stats_lock:
+            self._last_run = result
+            self._runs += 1
+        if result["rows_deleted"] or result["orphans_archived"]:
+            logger.info(f"Retention: {result}")
+        return result
+
+    def _expired_filter(self, db: Session):
+        """SQL condition selecting expired rows, or None if nothing is expired."""
+        conditions = []
+        cutoff = self.policy.cutoff()
+        if cutoff is not None:
+            conditions.append(AccessLog.timestamp < cutoff)
+        if self.policy.max_rows > 0:
+            # Oldest ID still kept (walks the primary key, no table scan)
+            oldest_kept = db.scalar(
+                select(AccessLog.id).order_by(AccessLog.id.desc())
+                .offset(self.policy.max_rows - 1).limit(1)
+            )
+            if oldest_kept is not None:
+                conditions.append(AccessLog.id < oldest_kept)
+        return or_(*conditions) if conditions else None
+
+    def _purge_rows(self) -> int:
+        """Delete expired rows chunk by chunk, then archive their snapshots."""
+        deleted = 0
+        db = self.session_factory()
+        try:
+            expired = self._expired_filter(db)
+            if expired is None:
+                return 0
+            while not self._stop.is_set():
+                rows = db.execute(
+                    select(AccessLog.id, AccessLog.snapshot_path)
+                    .where(expired).order_by(AccessLog.id).limit(self.policy.chunk_size)
+                ).all()
+                if not rows:
+                    break
+                db.execute(delete(AccessLog).where(AccessLog.id.in_([row_id for row_id, _ in rows])))
+                db.commit()
+                # Only once the rows are gone: a failed commit must not leave
+                # log entries pointing at archived files. Files missed here
+                # (crash, archive error) are left to the age-based orphan sweep.
+                self._retire_snapshots({path for _, path in rows if path})
+                deleted += len(rows)
+                time.sleep(CHUNK_PAUSE_SECONDS)
+        finally:
+            db.close()
+        return deleted
+
+    def _sweep_orphans(self) -> int:
+        """Archive expired snapshot files no log row refers to any more."""
+        cutoff = self.policy.cutoff()
+        if cutoff is None or not self.snapshot_dir.is_dir():
+            return 0
+        cutoff_ts = (cutoff - datetime(1970, 1, 1)).total_seconds()
+        with os.scandir(self.snapshot_dir) as entries:
+            expired = [
+                entry.path for entry in entries
+                if entry.name.startswith("snapshot_") and entry.is_file()
+                and entry.stat().st_mtime < cutoff_ts
+            ]
+        self._retire_snapshots(expired)
+        return len(expired)
+
+    def _retire_snapshots(self, paths: Iterable[str]):
+        """Move snapshot files into their day's archive (or delete them)."""
+        by_day: Dict[str, List[Tuple[Path, str]]] = {}
+        for path in paths:
+            path = Path(path)
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue  # Already archived or removed
+            day = datetime.utcfromtimestamp(mtime).strftime("%Y-%m-%d")
+            by_day.setdefault(day, []).append((path, path.name))
+
+        for day, files in by_day.items():
+            if self.policy.archive_snapshots:
+                try:
+                    self.policy.archive_dir.mkdir(parents=True, exist_ok=True)
+                    archive_path = self.policy.archive_dir / f"snapshots_{day}.zip"
+                    # JPEGs do not compress further; stored entries keep this cheap
+                    with zipfile.ZipFile(archive_path, "a", compression=zipfile.ZIP_STORED) as archive:
+                        for path, name in files:
+                            archive.write(path, arcname=name)
+                except OSError as e:
+                    logger.warning(f"Failed to archive snapshots of {day}: {e}")
+                    continue
+            for path, _ in files:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def _vacuum(self) -> int:
+        """
+        Release free pages in small steps (needs ``auto_vacuum=INCREMENTAL``,
+        which databases created by this version use).
+        """
+        released = 0
+        db = self.session_factory()
+        try:
+            if db.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+                return 0
+            while not self._stop.is_set():
+                free = db.execute(text("PRAGMA freelist_count")).scalar()
+                if not free:
+                    break
+                # executescript steps the pragma to completion; a plain
+                # execute releases a single page
+                db.connection().connection.driver_connection.executescript(
+                    f"PRAGMA incremental_vacuum({int(self.policy.vacuum_pages)});"
+                )
+                db.commit()
+                remaining = db.execute(text("PRAGMA freelist_count")).scalar()
+                if remaining >= free:
+                    break
+                released += free - remaining
+                time.sleep(CHUNK_PAUSE_SECONDS)
+        finally:
+            db.close()
+        return released
+
+    def stats(self) -> Dict:
+        """Result of the last run."""
+        with self._stats_lock:
+            return {
+                "enabled": self.policy.enabled,
+                "runs": self._runs,
+                "last_run": self._last_run,
+            }
+
+    def close(self, timeout: float = 10.0):
+        """Stop the background job (a running chunk finishes first)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+# Global retention job instance
+retention_job: Optional[RetentionJob] = None
+
+
+def get_retention_job() -> RetentionJob:
+    """Get the global retention job instance."""
+    global retention_job
+    if retention_job is None:
+        retention_job = RetentionJob(
+            RetentionPolicy.from_settings(),
+            interval_minutes=Settings.RETENTION_INTERVAL_MINUTES,
+        )
+    return retention_job
@@ -0,0 +1,145 @@
+"""
+Process-level runtime settings read from environment variables.
+
+These are needed before the database is available (thread pools, model
+sessions), so they live outside the ``system_config`` table.
+"""
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+
+class Settings:
+    """Runtime settings, overridable through ``FACEGUARD_*`` environment variables."""
+
+    # Inference worker pool (0 = derive from CPU count)
+    INFERENCE_WORKERS = _env_int("FACEGUARD_INFERENCE_WORKERS", 0)
+    # Requests allowed to wait for a free worker before returning 503
+    INFERENCE_QUEUE_SIZE = _env_int("FACEGUARD_INFERENCE_QUEUE_SIZE", 8)
+    # Recognition frames that waited longer than this are dropped as stale
+    INFERENCE_MAX_WAIT_MS = _env_int("FACEGUARD_INFERENCE_MAX_WAIT_MS", 1000)
+
+    # onnxruntime intra-op threads per session (0 = CPU count / workers)
+    ORT_INTRA_OP_THREADS = _env_int("FACEGUARD_ORT_INTRA_OP_THREADS", 0)
+    # Threads for running independent graph branches (parallel mode only)
+    ORT_INTER_OP_THREADS = _env_int("FACEGUARD_ORT_INTER_OP_THREADS", 1)
+    # Graph optimization level: disabled, basic, extended or all
+    ORT_GRAPH_OPTIMIZATION = _env_str("FACEGUARD_ORT_GRAPH_OPTIMIZATION", "all")
+    # Execution mode: sequential or parallel
+    ORT_EXECUTION_MODE = _env_str("FACEGUARD_ORT_EXECUTION_MODE", "sequential")
+    # Comma-separated execution providers in priority order ("" = onnxruntime default)
+    ORT_PROVIDERS = _env_str("FACEGUARD_ORT_PROVIDERS", "")
+    # CPU memory arena (faster allocation, higher resident memory)
+    ORT_CPU_MEM_ARENA = _env_bool("FACEGUARD_ORT_CPU_MEM_ARENA", True)
+    # Directory for cached optimized models ("" = no caching)
+    # (read directly: unlike other strings, an empty value is meaningful)
+    ORT_OPTIMIZED_MODEL_DIR = os.environ.get("FACEGUARD_ORT_OPTIMIZED_MODEL_DIR", "models/optimized")
+
+    # Micro-batching of concurrent recognition requests
+    BATCH_WINDOW_MS = _env_float("FACEGUARD_BATCH_WINDOW_MS", 5.0)
+    BATCH_MAX_SIZE = _env_int("FACEGUARD_BATCH_MAX_SIZE", 16)
+
+    # ArcFace model profile: fp32, fp16, int8-dynamic or int8-static
+    ENGINE_PROFILE = _env_str("FACEGUARD_ENGINE_PROFILE", "fp32")
+
+    # Recognition snapshots: fraction of frames captured per result status
+    SNAPSHOT_SAMPLE_PASS = _env_float("FACEGUARD_SNAPSHOT_SAMPLE_PASS", 1.0)
+    SNAPSHOT_SAMPLE_REJECT = _env_float("FACEGUARD_SNAPSHOT_SAMPLE_REJECT", 1.0)
+    SNAPSHOT_SAMPLE_NO_FACE = _env_float("FACEGUARD_SNAPSHOT_SAMPLE_NO_FACE", 0.0)
+    # Store only the face region instead of the whole frame
+    SNAPSHOT_CROP_FACES = _env_bool("FACEGUARD_SNAPSHOT_CROP_FACES", False)
+    # JPEG quality and longest side (0 = unlimited) of encoded snapshots
+    SNAPSHOT_QUALITY = _env_int("FACEGUARD_SNAPSHOT_QUALITY", 85)
+    SNAPSHOT_MAX_SIDE = _env_int("FACEGUARD_SNAPSHOT_MAX_SIDE", 0)
+    # Write uploaded JPEGs as received when no crop or resize is needed
+    SNAPSHOT_REUSE_JPEG = _env_bool("FACEGUARD_SNAPSHOT_REUSE_JPEG", True)
+    # Snapshots waiting for the writer thread before new ones are dropped
+    SNAPSHOT_QUEUE_SIZE = _env_int("FACEGUARD_SNAPSHOT_QUEUE_SIZE", 64)
+
+    # Access log write-behind: flush after this many entries or milliseconds
+    LOG_FLUSH_SIZE = _env_int("FACEGUARD_LOG_FLUSH_SIZE", 100)
+    LOG_FLUSH_INTERVAL_MS = _env_int("FACEGUARD_LOG_FLUSH_INTERVAL_MS", 1000)
+    # Entries kept while the database is unavailable (oldest dropped beyond)
+    LOG_MAX_PENDING = _env_int("FACEGUARD_LOG_MAX_PENDING", 10000)
+    # Seconds a /api/logs total count is reused for the same filters
+    LOG_COUNT_CACHE_SECONDS = _env_float("FACEGUARD_LOG_COUNT_CACHE_SECONDS", 10.0)
+
+    # Per-stream face tracking (WebSocket streams): IoU to continue a track,
+    # seconds until an unseen track ends, and when a reused identity is
+    # recomputed (frames / seconds; matches within CONFIRM_MARGIN of the
+    # threshold are always recomputed)
+    TRACK_IOU_THRESHOLD = _env_float("FACEGUARD_TRACK_IOU_THRESHOLD", 0.3)
+    TRACK_MAX_AGE_S = _env_float("FACEGUARD_TRACK_MAX_AGE_S", 1.5)
+    TRACK_REFRESH_FRAMES = _env_int("FACEGUARD_TRACK_REFRESH_FRAMES", 10)
+    TRACK_REFRESH_SECONDS = _env_float("FACEGUARD_TRACK_REFRESH_SECONDS", 2.0)
+    TRACK_CONFIRM_MARGIN = _env_float("FACEGUARD_TRACK_CONFIRM_MARGIN", 0.05)
+
+    # Motion gate for streams: a frame whose thumbnail differs from the last
+    # recognized frame in at most CHANGED_FRACTION of its pixels (by more
+    # than PIXEL_DELTA grey levels) reuses that frame's result
+    MOTION_GATE_ENABLED = _env_bool("FACEGUARD_MOTION_GATE_ENABLED", True)
+    MOTION_PIXEL_DELTA = _env_int("FACEGUARD_MOTION_PIXEL_DELTA", 20)
+    MOTION_CHANGED_FRACTION = _env_float("FACEGUARD_MOTION_CHANGED_FRACTION", 0.01)
+    # Recognize at least this often even without change
+    MOTION_MAX_SKIP_SECONDS = _env_float("FACEGUARD_MOTION_MAX_SKIP_SECONDS", 1.0)
+    MOTION_THUMBNAIL_WIDTH = _env_int("FACEGUARD_MOTION_THUMBNAIL_WIDTH", 32)
+
+    # Also match each user with several templates against the running mean
+    # of their templates
+    GALLERY_CENTROIDS = _env_bool("FACEGUARD_GALLERY_CENTROIDS", False)
+
+    # Bulk enrolment: photo decode threads (0 = inference worker count) and
+    # images per ArcFace batch and per insert transaction
+    ENROL_WORKERS = _env_int("FACEGUARD_ENROL_WORKERS", 0)
+    ENROL_CHUNK_SIZE = _env_int("FACEGUARD_ENROL_CHUNK_SIZE", 64)
+    # Server-side import directories must lie under this directory
+    ENROL_IMPORT_DIR = _env_str("FACEGUARD_ENROL_IMPORT_DIR", "data/import")
+    # Job status files and uploaded archives
+    ENROL_JOB_DIR = _env_str("FACEGUARD_ENROL_JOB_DIR", "data/enrolment")
+    # Longest side of avatars written by bulk enrolment (0 = unlimited)
+    ENROL_AVATAR_MAX_SIDE = _env_int("FACEGUARD_ENROL_AVATAR_MAX_SIDE", 512)
+    # Archive uploads larger than this or holding more files are rejected
+    # before extraction (0 = unlimited)
+    ENROL_MAX_UPLOAD_MB = _env_int("FACEGUARD_ENROL_MAX_UPLOAD_MB", 1024)
+    ENROL_MAX_ARCHIVE_FILES = _env_int("FACEGUARD_ENROL_MAX_ARCHIVE_FILES", 20000)
+
+    # Access log retention: rows older than MAX_AGE_DAYS or beyond the newest
+    # MAX_ROWS are removed (0 disables a policy), their snapshots archived.
+    # Both are off by default, so logs are kept until a limit is configured
+    RETENTION_MAX_AGE_DAYS = _env_int("FACEGUARD_RETENTION_MAX_AGE_DAYS", 0)
+    RETENTION_MAX_ROWS = _env_int("FACEGUARD_RETENTION_MAX_ROWS", 0)
+    RETENTION_INTERVAL_MINUTES = _env_int("FACEGUARD_RETENTION_INTERVAL_MINUTES", 60)
+    # Rows deleted per transaction, so the writer lock is held only briefly
+    RETENTION_CHUNK_SIZE = _env_int("FACEGUARD_RETENTION_CHUNK_SIZE", 1000)
+    # Move expired snapshots into one zip per day (False = delete them)
+    RETENTION_ARCHIVE_SNAPSHOTS = _env_bool("FACEGUARD_RETENTION_ARCHIVE_SNAPSHOTS", True)
+    RETENTION_ARCHIVE_DIR = _env_str("FACEGUARD_RETENTION_ARCHIVE_DIR", "data/archive")
+    # Free pages returned to the file system per incremental vacuum step
+    RETENTION_VACUUM_PAGES = _env_int("FACEGUARD_RETENTION_VACUUM_PAGES", 1000)
+
+    # SQLite connection profile (applied to every pooled connection)
+    DB_POOL_SIZE = _env_int("FACEGUARD_DB_POOL_SIZE", 8)
+    DB_BUSY_TIMEOUT_MS = _env_int("FACEGUARD_DB_BUSY_TIMEOUT_MS", 5000)
+    DB_SYNCHRONOUS = _env_str("FACEGUARD_DB_SYNCHRONOUS", "NORMAL")
+    DB_CACHE_SIZE_KB = _env_int("FACEGUARD_DB_CACHE_SIZE_KB", 32768)
+    DB_MMAP_SIZE_MB = _env_int("FACEGUARD_DB_MMAP_SIZE_MB", 256)
@@ -0,0 +1,220 @@
+"""
+Background writer for recognition snapshots.
+"""
+import io
+import queue
+import random
+import threading
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+
+from core.settings import Settings
+from utils.file_utils import generate_unique_filename
+from utils.image_utils import FrameImage, crop_face
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Frame status priority when choosing which face a snapshot is taken for
+STATUS_PRIORITY = ("REJECT", "PASS", "NO_FACE")
+
+
+class SnapshotPolicy:
+    """Which frames are captured, and how they are stored."""
+
+    def __init__(self, sample_rates: Dict[str, float], crop_faces: bool = False,
+                 quality: int = 85, max_side: int = 0, reuse_jpeg: bool = True):
+        """
+        Args:
+            sample_rates: Fraction of frames captured per status
+                (PASS, REJECT, NO_FACE); 0 disables a status
+            crop_faces: Store only the face region instead of the whole frame
+            quality: JPEG quality when a snapshot is encoded
+            max_side: Longest side of a stored snapshot (0 = unlimited)
+            reuse_jpeg: Store uploaded JPEG bytes as received when no crop or
+                resize is needed
+        """
+        self.sample_rates = sample_rates
+        self.crop_faces = crop_faces
+        self.quality = quality
+        self.max_side = max_side
+        self.reuse_jpeg = reuse_jpeg
+
+    @classmethod
+    def from_settings(cls) -> "SnapshotPolicy":
+        return cls(
+            sample_rates={
+                "PASS": Settings.SNAPSHOT_SAMPLE_PASS,
+                "REJECT": Settings.SNAPSHOT_SAMPLE_REJECT,
+                "NO_FACE": Settings.SNAPSHOT_SAMPLE_NO_FACE,
+            },
+            crop_faces=Settings.SNAPSHOT_CROP_FACES,
+            quality=Settings.SNAPSHOT_QUALITY,
+            max_side=Settings.SNAPSHOT_MAX_SIDE,
+            reuse_jpeg=Settings.SNAPSHOT_REUSE_JPEG,
+        )
+
+    def select(self, results: List[Dict]) -> Optional[Dict]:
+        """
+        Decide whether a frame is captured.
+
+        Args:
+            results: Per-face recognition results of the frame
+
+        Returns:
+            The face result the snapshot is taken for, or None to skip
+        """
+        for status in STATUS_PRIORITY:
+            face = next((r for r in results if r["status"] == status), None)
+            if face is not None:
+                rate = self.sample_rates.get(status, 0.0)
+                return face if rate > 0 and random.random() < rate else None
+        return None
+
+
+class SnapshotWriter:
+    """
+    Encodes and writes snapshots on a background thread.
+
+    The queue is bounded; when the disk or encoder cannot keep up, new
+    snapshots are dropped rather than slowing down recognition.
+    """
+
+    def __init__(self, policy: SnapshotPolicy, directory: str = "static/logs", queue_size: int = 64):
+        """
+        Args:
+            policy: Capture policy
+            directory: Directory snapshots are written to
+            queue_size: Snapshots allowed to wait for the writer thread
+        """
+        self.policy = policy
+        self.directory = directory
+        self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._written = 0
+        self._skipped = 0
+        self._dropped = 0
+        self._failed = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, image, results: List[Dict]) -> Optional[str]:
+        """
+        Queue a snapshot of a recognized frame if the policy captures it.
+
+        Args:
+            image: ``FrameImage`` or PIL Image of the frame
+            results: Per-face recognition results of the frame
+
+        Returns:
+            Path the snapshot will be written to, or None if it was skipped
+            by the policy or dropped because the writer is saturated
+        """
+        face = self.policy.select(results)
+        if face is None:
+            with self._lock:
+                self._skipped += 1
+            return None
+
+        path = f"{self.directory}/{generate_unique_filename(prefix='snapshot', extension='jpg')}"
+        box = face.get("box") if self.policy.crop_faces else None
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((image, box, path))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return None
+        return path
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                image, box, path = item
+                try:
+                    self._write(image, box, path)
+                except Exception as e:
+                    with self._lock:
+                        self._failed += 1
+                    logger.warning(f"Failed to save snapshot {path}: {e}")
+                else:
+                    with self._lock:
+                        self._written += 1
+            finally:
+                self._queue.task_done()
+
+    def _write(self, image, box: Optional[List[float]], path: str):
+        """Store one snapshot according to the policy."""
+        policy = self.policy
+        if isinstance(image, FrameImage):
+            if (box is None and policy.reuse_jpeg and image.is_jpeg
+                    and (not policy.max_side or max(image.size) <= policy.max_side)):
+                # The uploaded JPEG as received: no decode, no encode
+                with open(path, "wb") as f:
+                    f.write(image.data)
+                return
+            if box is not None:
+                snapshot = image.crop(box, min_side=policy.max_side or 224)
+            elif policy.max_side:
+                # Decode no larger than needed (JPEG draft scaling)
+                scale = policy.max_side / max(image.size)
+                snapshot = image.decode((round(image.width * scale), round(image.height * scale)))
+            else:
+                snapshot = image.to_image()
+        else:
+            snapshot = crop_face(image, box) if box is not None else image
+
+        if policy.max_side and max(snapshot.size) > policy.max_side:
+            snapshot = snapshot.copy()
+            snapshot.thumbnail((policy.max_side, policy.max_side), Image.BILINEAR)
+
+        buffer = io.BytesIO()
+        snapshot.save(buffer, format="JPEG", quality=policy.quality)
+        with open(path, "wb") as f:
+            f.write(buffer.getvalue())
+
+    def stats(self) -> Dict[str, int]:
+        """Writer counters."""
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self._written,
+                "skipped": self._skipped,
+                "dropped": self._dropped,
+                "failed": self._failed,
+            }
+
+    def close(self, timeout: float = 5.0):
+        """Write the queued snapshots and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("Snapshot queue still full at shutdown; pending snapshots are lost")
+            return
+        thread.join(timeout)
+
+
+# Global snapshot writer instance
+snapshot_writer: Optional[SnapshotWriter] = None
+
+
+def get_snapshot_writer() -> SnapshotWriter:
+    """Get the global snapshot writer instance."""
+    global snapshot_writer
+    if snapshot_writer is None:
+        snapshot_writer = SnapshotWriter(
+            SnapshotPolicy.from_settings(),
+            queue_size=Settings.SNAPSHOT_QUEUE_SIZE,
+        )
+    return snapshot_writer
@@ -0,0 +1,180 @@
+"""
+Per-stream face tracking across frames.
+
+A person standing in front of a camera yields nearly the same box in
+consecutive frames. ``FaceTracker`` associates each frame's boxes with the
+tracks of the previous frames by IoU, so a confirmed identity can be reused
+instead of running ArcFace and the gallery match again, and so one visit is
+logged once instead of once per frame.
+"""
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from core import nms
+from core.settings import Settings
+
+
+class Track:
+    """One face followed across frames."""
+
+    def __init__(self, track_id: int, box: List[float], now: float):
+        self.track_id = track_id
+        self.box = box
+        self.last_seen = now
+        # Last recognition result and when it was computed
+        self.result: Optional[Dict] = None
+        self.recognized_at = 0.0
+        self.frames_since_recognition = 0
+        # (status, user_id) of the last logged decision for this visit
+        self.logged: Optional[Tuple[str, Optional[int]]] = None
+
+
+class FaceTracker:
+    """
+    IoU tracker for one camera stream.
+
+    Frames of a stream are recognized one after another, so a tracker is
+    only used by one thread at a time and needs no locking.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_age_s: float = 1.5,
+                 refresh_frames: int = 10, refresh_seconds: float = 2.0,
+                 confirm_margin: float = 0.05):
+        """
+        Args:
+            iou_threshold: Minimum IoU for a box to continue a track
+            max_age_s: Tracks not seen for this long end (the visit is over)
+            refresh_frames: Recompute a reused identity after this many frames
+            refresh_seconds: Recompute a reused identity after this long
+            confirm_margin: A match is reused only if its similarity exceeds
+                the threshold by this margin; others are recomputed every frame
+        """
+        self.iou_threshold = iou_threshold
+        self.max_age_s = max_age_s
+        self.refresh_frames = refresh_frames
+        self.refresh_seconds = refresh_seconds
+        self.confirm_margin = confirm_margin
+        self.tracks: List[Track] = []
+        self._ids = itertools.count(1)
+        # Whether the previous frame had no faces (NO_FACE is logged once per gap)
+        self._empty = False
+        self.reused = 0
+        self.recomputed = 0
+
+    @classmethod
+    def from_settings(cls) -> "FaceTracker":
+        return cls(
+            iou_threshold=Settings.TRACK_IOU_THRESHOLD,
+            max_age_s=Settings.TRACK_MAX_AGE_S,
+            refresh_frames=Settings.TRACK_REFRESH_FRAMES,
+            refresh_seconds=Settings.TRACK_REFRESH_SECONDS,
+            confirm_margin=Settings.TRACK_CONFIRM_MARGIN,
+        )
+
+    def associate(self, boxes: List[List[float]]) -> List[Track]:
+        """
+        Assign a frame's boxes to tracks, starting tracks for new faces.
+
+        Args:
+            boxes: Face boxes [x, y, w, h] of the frame
+
+        Returns:
+            The track of each box, in box order
+        """
+        now = time.monotonic()
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age_s]
+
+        assigned: List[Optional[Track]] = [None] * len(boxes)
+        if boxes and self.tracks:
+            iou = nms.box_iou(
+                self._corners(np.array(boxes, dtype=np.float32)),
+                self._corners(np.array([t.box for t in self.tracks], dtype=np.float32)),
+            )
+            # Greedy assignment, best overlap first
+            used = set()
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                b, t = divmod(int(flat), len(self.tracks))
+                if iou[b, t] < self.iou_threshold:
+                    break
+                if assigned[b] is None and t not in used:
+                    assigned[b] = self.tracks[t]
+                    used.add(t)
+
+        for b, box in enumerate(boxes):
+            track = assigned[b]
+            if track is None:
+                track = Track(next(self._ids), box, now)
+                self.tracks.append(track)
+                assigned[b] = track
+            track.box = box
+            track.last_seen = now
+        self._empty = self._empty and not boxes
+        return assigned
+
+    def keep_alive(self):
+        """Mark all tracks as seen, for frames skipped as unchanged."""
+        now = time.monotonic()
+        for track in self.tracks:
+            track.last_seen = now
+
+    @staticmethod
+    def _corners(boxes: np.ndarray) -> np.ndarray:
+        """[x, y, w, h] -> [x1, y1, x2, y2]."""
+        corners = boxes.copy()
+        corners[:, 2:] += boxes[:, :2]
+        return corners
+
+    def reusable(self, track: Track, threshold: float) -> Optional[Dict]:
+        """
+        The track's previous result, if it can stand in for recognition.
+
+        Args:
+            track: Track of a face in the current frame
+            threshold: Similarity threshold of the current frame
+
+        Returns:
+            Copy of the confirmed result, or None to recompute the embedding
+        """
+        result = track.result
+        if (result is None or result["user_id"] is None
+                or (result["confidence"] or 0.0) < threshold + self.confirm_margin
+                or track.frames_since_recognition >= self.refresh_frames
+                or time.monotonic() - track.recognized_at >= self.refresh_seconds):
+            self.recomputed += 1
+            return None
+        track.frames_since_recognition += 1
+        self.reused += 1
+        return dict(result, box=track.box, track_id=track.track_id, reused=True)
+
+    def update(self, track: Track, result: Dict):
+        """Store a freshly computed result on its track."""
+        track.result = result
+        track.recognized_at = time.monotonic()
+        track.frames_since_recognition = 0
+        result["track_id"] = track.track_id
+        result["reused"] = False
+
+    def should_log(self, track: Track, result: Dict) -> bool:
+        """
+        Whether a face result starts a new log row.
+
+        Only the first decision of a visit, and later changes of it (e.g. an
+        unknown face that becomes a PASS), are logged.
+        """
+        decision = (result["status"], result["user_id"])
+        if track.logged == decision:
+            return False
+        track.logged = decision
+        return True
+
+    def should_log_empty(self) -> bool:
+        """Whether a frame without faces is logged (once per gap)."""
+        if self._empty:
+            return False
+        self._empty = True
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracks": len(self.tracks), "reused": self.reused, "recomputed": self.recomputed}
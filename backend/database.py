@@ -1,27 +1,74 @@
 """
 Database models and connection management using SQLAlchemy.
 """
+import json
 from datetime import datetime
-from typing import Optional
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, ForeignKey
+from typing import AsyncIterator, Optional
+from sqlalchemy import (
+    create_engine, event, inspect, text, Boolean, Column, Integer, String, Float, DateTime,
+    ForeignKey, Index, LargeBinary
+)
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from core.settings import Settings
+from utils.feature_codec import FEATURE_DTYPE, FEATURE_MODEL_VERSION, encode_feature
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 # Database configuration
 DATABASE_URL = "sqlite:///./access_control.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./access_control.db"
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    """
+    Tune every new SQLite connection.
+
+    WAL lets readers run alongside the single writer; synchronous=NORMAL is
+    durable in WAL mode apart from the last transactions before a power cut.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={Settings.DB_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(Settings.DB_BUSY_TIMEOUT_MS)}")
+        # Negative cache_size is in KiB
+        cursor.execute(f"PRAGMA cache_size=-{int(Settings.DB_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA mmap_size={int(Settings.DB_MMAP_SIZE_MB) * 1024 * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
 
 # Create engine
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False},  # Needed for SQLite
+    connect_args={
+        "check_same_thread": False,  # Needed for SQLite
+        "timeout": Settings.DB_BUSY_TIMEOUT_MS / 1000,
+    },
+    pool_size=Settings.DB_POOL_SIZE,
+    max_overflow=Settings.DB_POOL_SIZE,
     echo=False  # Set to True for SQL debugging
 )
+event.listen(engine, "connect", _apply_pragmas)
+
+# Async engine (aiosqlite) for read-heavy route handlers, so queries do not
+# block the event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"timeout": Settings.DB_BUSY_TIMEOUT_MS / 1000},
+    pool_size=Settings.DB_POOL_SIZE,
+    max_overflow=Settings.DB_POOL_SIZE,
+    echo=False
+)
+event.listen(async_engine.sync_engine, "connect", _apply_pragmas)
 
-# Create session factory
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Base class for models
 Base = declarative_base()
@@ -33,8 +80,25 @@ class User(Base):
     
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     name = Column(String(100), nullable=False)
-    feature_vector = Column(Text, nullable=False)  # JSON string of 512-dim vector
+    feature_vector = Column(LargeBinary, nullable=False)  # Raw float32/float16 bytes
+    feature_dim = Column(Integer, nullable=True)
+    feature_dtype = Column(String(16), nullable=True)
+    model_version = Column(String(50), nullable=True)
     avatar_path = Column(String(255), nullable=False)
+    enabled = Column(Boolean, nullable=False, default=True)  # Disabled users are rejected
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UserTemplate(Base):
+    """Additional face template of a user (the enrolment photo's is on ``users``)."""
+    __tablename__ = "user_templates"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    feature_vector = Column(LargeBinary, nullable=False)  # Raw float32/float16 bytes
+    feature_dim = Column(Integer, nullable=True)
+    feature_dtype = Column(String(16), nullable=True)
+    model_version = Column(String(50), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
@@ -50,6 +114,41 @@ class AccessLog(Base):
     snapshot_path = Column(String(255), nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
 
+    # Keyset pagination runs newest first on (timestamp, id), optionally
+    # narrowed to one status or user
+    __table_args__ = (
+        Index("ix_access_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_access_logs_status_timestamp_id", "status", "timestamp", "id"),
+        Index("ix_access_logs_user_timestamp_id", "user_id", "timestamp", "id"),
+    )
+
+
+class AccessStatsHourly(Base):
+    """
+    Access counts per hour, user and status, maintained as logs are written.
+
+    Rows outlive the raw log entries they were counted from.
+    """
+    __tablename__ = "access_stats_hourly"
+
+    hour = Column(DateTime, primary_key=True)  # UTC, truncated to the hour
+    user_id = Column(Integer, primary_key=True)  # 0 for strangers / no face
+    status = Column(String(20), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+# Default system configuration (stored as strings)
+DEFAULT_CONFIG = {
+    "frame_interval_ms": "500",
+    "recognition_threshold": "0.5",
+    "index_backend": "exact",  # exact, ivf or hnsw
+    "index_nprobe": "8",
+    "index_rerank": "32",  # ANN candidates re-ranked exactly (0 = off)
+    "detection_confidence_threshold": "0.7",
+    "nms_iou_threshold": "0.3",
+    "nms_top_k": "200",  # anchors per frame kept before NMS
+}
+
 
 class SystemConfig(Base):
     """System configuration model - key-value pairs."""
@@ -59,25 +158,112 @@ class SystemConfig(Base):
     value = Column(String(255), nullable=False)
 
 
+# model_version of rows whose legacy JSON vector could not be migrated
+INVALID_MODEL_VERSION = "invalid"
+
+
+def _migrate_feature_vectors(batch_size: int = 500):
+    """
+    One-time migration of users.feature_vector from JSON text to raw bytes.
+
+    Adds the feature metadata columns to pre-existing tables and re-encodes
+    every row whose vector is still stored as JSON. SQLite keeps BLOB values
+    as-is in the original TEXT column, so no table rebuild is needed.
+    """
+    columns = {col["name"] for col in inspect(engine).get_columns("users")}
+    with engine.begin() as conn:
+        for name, ddl in (
+            ("feature_dim", "INTEGER"),
+            ("feature_dtype", "VARCHAR(16)"),
+            ("model_version", "VARCHAR(50)"),
+        ):
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE users ADD COLUMN {name} {ddl}"))
+
+    migrated = 0
+    skipped = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, feature_vector FROM users "
+                "WHERE typeof(feature_vector) = 'text' LIMIT :limit"
+            ), {"limit": batch_size}).fetchall()
+            if not rows:
+                break
+            for user_id, feature_json in rows:
+                try:
+                    vector = json.loads(feature_json)
+                    values = {
+                        "blob": encode_feature(vector, FEATURE_DTYPE),
+                        "dim": len(vector),
+                        "dtype": FEATURE_DTYPE,
+                        "version": FEATURE_MODEL_VERSION,
+                    }
+                except (ValueError, TypeError) as e:
+                    # Keep the original text as bytes so the row is not
+                    # selected again; the gallery skips its model version
+                    logger.warning(f"Skipping invalid feature vector of user {user_id}: {e}")
+                    values = {
+                        "blob": feature_json.encode("utf-8"),
+                        "dim": None,
+                        "dtype": None,
+                        "version": INVALID_MODEL_VERSION,
+                    }
+                    skipped += 1
+                conn.execute(text(
+                    "UPDATE users SET feature_vector = :blob, feature_dim = :dim, "
+                    "feature_dtype = :dtype, model_version = :version WHERE id = :id"
+                ), dict(values, id=user_id))
+            migrated += len(rows)
+
+    if migrated:
+        logger.info(f"Migrated {migrated - skipped} feature vectors from JSON to binary storage")
+    if skipped:
+        logger.warning(f"{skipped} invalid feature vectors marked as '{INVALID_MODEL_VERSION}'; "
+                       f"re-enrol these users")
+
+
+def _migrate_user_columns():
+    """Add user columns introduced after a database was created."""
+    columns = {col["name"] for col in inspect(engine).get_columns("users")}
+    if "enabled" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE users ADD COLUMN enabled BOOLEAN NOT NULL DEFAULT 1"))
+        logger.info("Added users.enabled column")
+
+
 def init_database():
     """Initialize database tables and default configuration."""
+    # New databases reclaim space from deleted rows incrementally (the mode
+    # can only be chosen before the first table is created)
+    if not inspect(engine).get_table_names():
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            # Switching to WAL on connect already wrote the header; VACUUM
+            # of the empty file applies the new mode
+            conn.exec_driver_sql("VACUUM")
+
     # Create all tables
     Base.metadata.create_all(bind=engine)
+    _migrate_feature_vectors()
+    _migrate_user_columns()
+    # create_all skips indexes of tables that already exist
+    for index in AccessLog.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
     
-    # Initialize default config if not exists
+    # Initialize default config for any missing keys
     db = SessionLocal()
     try:
-        # Check if config exists
-        existing_config = db.query(SystemConfig).first()
-        if not existing_config:
-            # Add default configuration
-            default_configs = [
-                SystemConfig(key="frame_interval_ms", value="500"),
-                SystemConfig(key="recognition_threshold", value="0.5"),
-            ]
-            db.add_all(default_configs)
+        existing_keys = {row.key for row in db.query(SystemConfig.key).all()}
+        missing = [
+            SystemConfig(key=key, value=value)
+            for key, value in DEFAULT_CONFIG.items()
+            if key not in existing_keys
+        ]
+        if missing:
+            db.add_all(missing)
             db.commit()
-            logger.info("Default configuration initialized")
+            logger.info(f"Default configuration initialized: {[c.key for c in missing]}")
     finally:
         db.close()
 
@@ -89,3 +275,9 @@ def get_db() -> Session:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Dependency to get an async (aiosqlite) database session."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -7,6 +7,7 @@ from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from database import get_db
+from core.ann_index import INDEX_BACKENDS
 from core.config_manager import ConfigManager
 
 router = APIRouter()
@@ -16,12 +17,24 @@ class ConfigResponse(BaseModel):
     """Response model for configuration."""
     frame_interval_ms: int
     recognition_threshold: float
+    index_backend: str
+    index_nprobe: int
+    index_rerank: int
+    detection_confidence_threshold: float
+    nms_iou_threshold: float
+    nms_top_k: int
 
 
 class ConfigUpdateRequest(BaseModel):
     """Request model for updating configuration."""
     frame_interval_ms: int | None = None
     recognition_threshold: float | None = None
+    index_backend: str | None = None
+    index_nprobe: int | None = None
+    index_rerank: int | None = None
+    detection_confidence_threshold: float | None = None
+    nms_iou_threshold: float | None = None
+    nms_top_k: int | None = None
 
 
 @router.get("/api/config", response_model=ConfigResponse)
@@ -33,7 +46,13 @@ async def get_config(db: Session = Depends(get_db)):
     
     return ConfigResponse(
         frame_interval_ms=config.get("frame_interval_ms", 500),
-        recognition_threshold=config.get("recognition_threshold", 0.5)
+        recognition_threshold=config.get("recognition_threshold", 0.5),
+        index_backend=config.get("index_backend", "exact"),
+        index_nprobe=config.get("index_nprobe", 8),
+        index_rerank=config.get("index_rerank", 32),
+        detection_confidence_threshold=config.get("detection_confidence_threshold", 0.7),
+        nms_iou_threshold=config.get("nms_iou_threshold", 0.3),
+        nms_top_k=config.get("nms_top_k", 200)
     )
 
 
@@ -67,10 +86,59 @@ async def update_config(
             )
         updates["recognition_threshold"] = request.recognition_threshold
     
+    if request.index_backend is not None:
+        if request.index_backend not in INDEX_BACKENDS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"index_backend must be one of {', '.join(INDEX_BACKENDS)}"
+            )
+        updates["index_backend"] = request.index_backend
+    
+    if request.index_nprobe is not None:
+        if request.index_nprobe < 1:
+            raise HTTPException(
+                status_code=400,
+                detail="index_nprobe must be at least 1"
+            )
+        updates["index_nprobe"] = request.index_nprobe
+    
+    if request.index_rerank is not None:
+        if request.index_rerank < 0:
+            raise HTTPException(
+                status_code=400,
+                detail="index_rerank must not be negative"
+            )
+        updates["index_rerank"] = request.index_rerank
+    
+    if request.detection_confidence_threshold is not None:
+        if not (0.0 <= request.detection_confidence_threshold < 1.0):
+            raise HTTPException(
+                status_code=400,
+                detail="detection_confidence_threshold must be between 0.0 and 1.0"
+            )
+        updates["detection_confidence_threshold"] = request.detection_confidence_threshold
+    
+    if request.nms_iou_threshold is not None:
+        if not (0.0 < request.nms_iou_threshold <= 1.0):
+            raise HTTPException(
+                status_code=400,
+                detail="nms_iou_threshold must be between 0.0 and 1.0"
+            )
+        updates["nms_iou_threshold"] = request.nms_iou_threshold
+    
+    if request.nms_top_k is not None:
+        if request.nms_top_k < 1:
+            raise HTTPException(
+                status_code=400,
+                detail="nms_top_k must be at least 1"
+            )
+        updates["nms_top_k"] = request.nms_top_k
+    
     if not updates:
         raise HTTPException(status_code=400, detail="No valid updates provided")
     
-    # Update configuration
+    # Update configuration; listeners (e.g. the face engine) apply the
+    # changed keys in every worker
     ConfigManager.update_config(db, updates)
     
     return {"detail": "Configuration updated"}
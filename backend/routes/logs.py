@@ -1,16 +1,25 @@
 """
 Access logs API endpoint.
 """
-from typing import List
-from fastapi import APIRouter, Depends, Query
+import base64
+import time
+from typing import Dict, List, Literal, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from datetime import datetime
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
 
-from database import get_db, AccessLog
+from database import get_async_db, AccessLog, AccessStatsHourly, User
+from core.settings import Settings
 
 router = APIRouter()
 
+# Filter values -> (expiry, total); counts are reused for a few seconds
+# instead of counting the whole table on every page
+_count_cache: Dict[Tuple, Tuple[float, int]] = {}
+_COUNT_CACHE_MAX_ENTRIES = 256
+
 
 class LogItem(BaseModel):
     """Response model for a single log entry."""
@@ -21,7 +30,7 @@ class LogItem(BaseModel):
     confidence: float | None
     snapshot_path: str | None
     timestamp: datetime
-    
+
     class Config:
         from_attributes = True
 
@@ -32,34 +41,126 @@ class LogsResponse(BaseModel):
     page: int
     size: int
     items: List[LogItem]
+    next_cursor: str | None = None  # Pass as ``cursor`` to get the next page
+
+
+class StatsBucket(BaseModel):
+    """Access counts of one hour, day or user."""
+    key: str  # ISO hour, ISO date or user ID
+    user_name: str | None = None  # group_by=user only
+    counts: Dict[str, int]  # Per status
+    total: int
+
+
+class StatsResponse(BaseModel):
+    """Response model for access statistics."""
+    group_by: str
+    buckets: List[StatsBucket]
+
+
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    """Opaque cursor for the position after a log entry."""
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{log_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Parse a cursor produced by ``encode_cursor``.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(timestamp), int(log_id)
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC datetime, as stored in the access log."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def _cached_count(db: AsyncSession, conditions: list, key: Tuple) -> int:
+    """Row count for the filters, cached for ``LOG_COUNT_CACHE_SECONDS``."""
+    now = time.monotonic()
+    cached = _count_cache.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    total = await db.scalar(select(func.count()).select_from(AccessLog).where(*conditions))
+    if len(_count_cache) >= _COUNT_CACHE_MAX_ENTRIES:
+        _count_cache.clear()
+    _count_cache[key] = (now + Settings.LOG_COUNT_CACHE_SECONDS, total)
+    return total
 
 
 @router.get("/api/logs", response_model=LogsResponse)
 async def get_logs(
     page: int = Query(1, ge=1),
     size: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    status: Optional[str] = Query(None, description="PASS, REJECT or NO_FACE"),
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, description="Earliest timestamp (inclusive)"),
+    end: Optional[datetime] = Query(None, description="Latest timestamp (exclusive)"),
+    min_confidence: Optional[float] = None,
+    max_confidence: Optional[float] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get paginated access logs.
-    
+    Get access logs, newest first.
+
+    With ``cursor`` the page starts right after the entry the cursor points
+    to (keyset pagination on ``(timestamp, id)``), which costs the same at
+    any depth; ``page`` is then ignored. Without it ``page`` selects the page
+    by offset.
+
     Args:
-        page: Page number (1-indexed)
+        page: Page number (1-indexed), used when no cursor is given
         size: Number of items per page
+        cursor: Position to continue from
+        status: Only entries with this status
+        user_id: Only entries of this user
+        start: Only entries at or after this time
+        end: Only entries before this time
+        min_confidence: Only entries with at least this confidence
+        max_confidence: Only entries with at most this confidence
     """
-    # Calculate offset
-    offset = (page - 1) * size
-    
-    # Get total count
-    total = db.query(AccessLog).count()
-    
-    # Get paginated logs (ordered by timestamp descending)
-    logs = db.query(AccessLog)\
-        .order_by(AccessLog.timestamp.desc())\
-        .offset(offset)\
-        .limit(size)\
-        .all()
-    
+    # Filters (status/user_id/time range use the composite indexes)
+    start, end = _utc(start), _utc(end)
+    conditions = []
+    if status is not None:
+        conditions.append(AccessLog.status == status)
+    if user_id is not None:
+        conditions.append(AccessLog.user_id == user_id)
+    if start is not None:
+        conditions.append(AccessLog.timestamp >= start)
+    if end is not None:
+        conditions.append(AccessLog.timestamp < end)
+    if min_confidence is not None:
+        conditions.append(AccessLog.confidence >= min_confidence)
+    if max_confidence is not None:
+        conditions.append(AccessLog.confidence <= max_confidence)
+
+    # Get total count (cached per filter combination)
+    total = await _cached_count(
+        db, conditions, (status, user_id, start, end, min_confidence, max_confidence)
+    )
+
+    query = select(AccessLog).order_by(AccessLog.timestamp.desc(), AccessLog.id.desc())
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(tuple_(AccessLog.timestamp, AccessLog.id) < tuple_(*after))
+    else:
+        # Calculate offset
+        query = query.offset((page - 1) * size)
+
+    logs = (await db.scalars(query.where(*conditions).limit(size))).all()
+
     # Convert to response model
     items = [
         LogItem(
@@ -73,10 +174,65 @@ async def get_logs(
         )
         for log in logs
     ]
-    
+
     return LogsResponse(
         total=total,
         page=page,
         size=size,
-        items=items
+        items=items,
+        next_cursor=encode_cursor(logs[-1].timestamp, logs[-1].id) if len(logs) == size else None
     )
+
+
+@router.get("/api/logs/stats", response_model=StatsResponse)
+async def get_log_stats(
+    group_by: Literal["hour", "day", "user"] = "day",
+    start: Optional[datetime] = Query(None, description="Earliest hour (inclusive, rounded down)"),
+    end: Optional[datetime] = Query(None, description="Latest hour (exclusive, rounded down)"),
+    user_id: Optional[int] = Query(None, description="Only this user (0 = strangers)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get PASS/REJECT/NO_FACE counts per hour, day or user.
+
+    Answered from the hourly rollups, not from the access log, so counts
+    cover whole hours: ``start`` and ``end`` are rounded down to the hour.
+
+    Args:
+        group_by: Bucket by "hour", "day" or "user"
+        start: Only hours at or after this hour
+        end: Only hours before this hour
+        user_id: Only counts of this user
+    """
+    start, end = _utc(start), _utc(end)
+    if group_by == "hour":
+        bucket = AccessStatsHourly.hour
+    elif group_by == "day":
+        bucket = func.date(AccessStatsHourly.hour)
+    else:
+        bucket = AccessStatsHourly.user_id
+
+    query = select(bucket, AccessStatsHourly.status, func.sum(AccessStatsHourly.count)) \
+        .group_by(bucket, AccessStatsHourly.status).order_by(bucket)
+    if start is not None:
+        query = query.where(AccessStatsHourly.hour >= start.replace(minute=0, second=0, microsecond=0))
+    if end is not None:
+        query = query.where(AccessStatsHourly.hour < end.replace(minute=0, second=0, microsecond=0))
+    if user_id is not None:
+        query = query.where(AccessStatsHourly.user_id == user_id)
+
+    buckets: Dict[str, StatsBucket] = {}
+    for key, status, count in (await db.execute(query)).all():
+        key = key.isoformat() if isinstance(key, datetime) else str(key)
+        item = buckets.setdefault(key, StatsBucket(key=key, counts={}, total=0))
+        item.counts[status] = count
+        item.total += count
+
+    if group_by == "user" and buckets:
+        names = dict((await db.execute(
+            select(User.id, User.name).where(User.id.in_([int(key) for key in buckets]))
+        )).all())
+        for key, item in buckets.items():
+            item.user_name = names.get(int(key), "Unknown")
+
+    return StatsResponse(group_by=group_by, buckets=list(buckets.values()))
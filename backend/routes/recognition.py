@@ -1,19 +1,29 @@
 """
 Recognition API endpoint.
 """
+import asyncio
 import os
 import json
-from typing import Optional
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from typing import Dict, List, Optional
+from fastapi import (
+    APIRouter, UploadFile, File, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from database import get_db, User, AccessLog
-from core.face_engine import get_face_engine
+from database import get_db, SessionLocal, User
+from core.access_log_sink import get_access_log_sink
 from core.config_manager import ConfigManager
-from utils.image_utils import decode_base64_image, load_image, save_image
-from utils.file_utils import generate_unique_filename
+from core.batcher import get_recognition_batcher
+from core.inference_pool import PoolSaturatedError
+from core.motion import MotionGate
+from core.settings import Settings
+from core.snapshot_writer import get_snapshot_writer
+from core.tracker import FaceTracker
+from utils.image_utils import FrameImage
 from utils.logger import get_logger
 
 router = APIRouter()
@@ -25,6 +35,15 @@ class RecognizeBase64Request(BaseModel):
     image_base64: str
 
 
+class FaceResult(BaseModel):
+    """Recognition result for a single face."""
+    status: str
+    name: Optional[str] = None
+    box: Optional[list] = None
+    confidence: Optional[float] = None
+    track_id: Optional[int] = None  # Streams only
+
+
 class RecognizeResponse(BaseModel):
     """Response model for recognition."""
     status: str
@@ -32,12 +51,15 @@ class RecognizeResponse(BaseModel):
     box: Optional[list] = None
     confidence: Optional[float] = None
     snapshot_path: Optional[str] = None
+    track_id: Optional[int] = None  # Streams only
+    faces: Optional[List[FaceResult]] = None  # Multi-face mode only, largest first
 
 
 @router.post("/api/recognize", response_model=RecognizeResponse)
 async def recognize_face(
     file: Optional[UploadFile] = File(None),
     request: Optional[RecognizeBase64Request] = None,
+    multi: bool = Query(False, description="Recognize every face in the frame"),
     db: Session = Depends(get_db)
 ):
     """
@@ -46,85 +68,238 @@ async def recognize_face(
     Accepts either:
     - Multipart form-data with 'file' field
     - JSON with 'image_base64' field
+
+    With ``multi=true`` every detected face is recognized in one batch and
+    returned in ``faces``; the top-level fields describe the largest face.
     """
     logger.info("🔍 Recognition request received")
 
-    # Get face engine and config
-    engine = get_face_engine()
+    # Get config
     threshold = ConfigManager.get_value(db, "recognition_threshold", 0.5)
     logger.info(f"Using recognition threshold: {threshold}")
 
-    # Load image from file or base64
+    # Read the encoded image from file or base64; it is decoded on the
+    # inference workers, at reduced resolution for JPEG frames
     try:
         if file:
-            # Load from uploaded file
-            from PIL import Image
-            import io
             logger.info(f"Loading image from file upload: {file.filename}")
-            contents = await file.read()
-            image = Image.open(io.BytesIO(contents)).convert("RGB")
-            logger.info(f"Image loaded: size={image.size}, mode={image.mode}")
+            image = FrameImage(await file.read())
         elif request and request.image_base64:
-            # Load from base64
             logger.info("Loading image from base64")
-            image = decode_base64_image(request.image_base64)
-            logger.info(f"Image loaded: size={image.size}, mode={image.mode}")
+            image = FrameImage.from_base64(request.image_base64)
         else:
             logger.warning("No image provided in request")
             raise HTTPException(status_code=400, detail="No image provided")
+        logger.info(f"Image loaded: size={image.size}, format={image.format}")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to load image: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
 
     # Perform recognition
     logger.info("Starting face recognition...")
-    result = engine.recognize(image, threshold=threshold)
-    logger.info(f"Recognition completed: status={result['status']}, confidence={result.get('confidence')}")
+    try:
+        # Batched together with frames from concurrent requests
+        results = await get_recognition_batcher().submit(image, threshold, multi=multi)
+    except PoolSaturatedError as e:
+        logger.warning(f"Recognition rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    result = results[0]
+    logger.info(f"Recognition completed: {len(results)} face(s), status={result['status']}, "
+                f"confidence={result.get('confidence')}")
     
-    # Save snapshot
-    snapshot_path = None
+    return record_recognition(image, results, multi, db)
+
+
+@router.websocket("/ws/recognize")
+async def recognize_stream(websocket: WebSocket, multi: bool = False):
+    """
+    Recognize a live camera stream over one WebSocket connection.
+
+    The client sends JPEG frames as binary messages; each result is pushed
+    back as a JSON ``RecognizeResponse`` plus ``frame`` (sequence number of
+    the recognized frame) and ``dropped`` (frames skipped so far). Only the
+    newest frame is kept: frames arriving while one is being recognized
+    replace each other, so a slow server never builds up a backlog.
+
+    Faces are tracked across the stream's frames: a confirmed identity is
+    reused for a few frames without re-extraction, and each visit is logged
+    once rather than once per frame. Frames that barely differ from the last
+    recognized one skip detection and repeat its result (``skipped``).
+    """
+    await websocket.accept()
+    logger.info("📹 Recognition stream opened")
+    stream = {"frame": None, "seq": 0, "dropped": 0, "closed": False}
+    tracker = FaceTracker.from_settings()
+    gate = MotionGate.from_settings() if Settings.MOTION_GATE_ENABLED else None
+    previous: Optional[Dict] = None
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is None:
+                    continue  # Text messages are not frames
+                if stream["frame"] is not None:
+                    stream["dropped"] += 1
+                stream["frame"] = message["bytes"]
+                stream["seq"] += 1
+                frame_ready.set()
+        finally:
+            stream["closed"] = True
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if stream["closed"]:
+                break
+            data, seq = stream["frame"], stream["seq"]
+            stream["frame"] = None
+            if data is None:
+                continue
+            payload = await _recognize_frame(data, multi, tracker, gate, previous)
+            if stream["closed"]:
+                break
+            if "error" not in payload:
+                previous = payload
+            payload.update(frame=seq, dropped=stream["dropped"])
+            try:
+                await websocket.send_json(payload)
+            except RuntimeError:
+                # Closed while the frame was being recognized
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        logger.info(f"📹 Recognition stream closed ({stream['seq']} frames, "
+                    f"{stream['dropped']} dropped, tracking {tracker.stats()}, "
+                    f"motion {gate.stats() if gate else 'off'})")
+
+
+async def _recognize_frame(data: bytes, multi: bool, tracker: FaceTracker,
+                           gate: Optional[MotionGate], previous: Optional[Dict]) -> Dict:
+    """Recognize one streamed frame; errors are returned in the payload."""
     try:
-        snapshot_filename = generate_unique_filename(prefix="snapshot", extension="jpg")
-        snapshot_path = f"static/logs/{snapshot_filename}"
-        save_image(image, snapshot_path)
-        logger.info(f"Snapshot saved: {snapshot_path}")
+        image = FrameImage(data)
+        if gate is not None:
+            # Decodes a thumbnail; keep it off the event loop
+            changed, thumb = await run_in_threadpool(gate.check, image)
     except Exception as e:
-        logger.warning(f"Failed to save snapshot: {e}")
+        return {"status": "NO_FACE", "error": f"Invalid image: {e}"}
+
+    if gate is not None and not changed and previous is not None:
+        # Static scene: repeat the last result (already logged) and keep
+        # its tracks alive
+        tracker.keep_alive()
+        return dict(previous, skipped=True)
+
+    db = SessionLocal()
+    try:
+        # Served from the config cache, normally without touching the database
+        threshold = ConfigManager.get_value(db, "recognition_threshold", 0.5)
+    finally:
+        db.close()
+
+    try:
+        results = await get_recognition_batcher().submit(image, threshold, multi=multi, tracker=tracker)
+        response = record_recognition(image, results, multi)
+    except PoolSaturatedError as e:
+        return {"status": "NO_FACE", "error": str(e)}
+    except Exception as e:
+        # One bad frame must not end the stream
+        logger.exception("Stream frame recognition failed")
+        return {"status": "NO_FACE", "error": f"Recognition failed: {e}"}
+    if gate is not None:
+        gate.accept(thumb)
+    return dict(jsonable_encoder(response), skipped=False)
+
+
+def record_recognition(image: FrameImage, results: List[Dict], multi: bool,
+                       db: Optional[Session] = None) -> RecognizeResponse:
+    """
+    Snapshot, log and build the response for a recognized frame.
+
+    Args:
+        image: The recognized frame
+        results: Per-face results from the engine, largest face first
+        multi: Whether every face is reported
+        db: Session for the rare name lookup (a new one is opened if None)
+    """
+    # Results of tracked streams that repeat an already logged decision are
+    # returned but neither logged nor captured
+    logged = [r for r in results if r.get("log", True)]
+
+    # Queue a snapshot per the capture policy (written in the background)
+    snapshot_path = get_snapshot_writer().submit(image, logged) if logged else None
+
+    # Names come from the engine's identity metadata; only a match on an
+    # identity missing from it (mid-update) falls back to the database
+    missing_ids = {r["user_id"] for r in results if r["user_id"] and r.get("name") is None}
+    user_names = {}
+    if missing_ids:
+        lookup = db if db is not None else SessionLocal()
+        try:
+            user_names = dict(lookup.query(User.id, User.name).filter(User.id.in_(missing_ids)).all())
+        finally:
+            if db is None:
+                lookup.close()
 
-    # Get user name if recognized
-    user_name = "Unknown"
-    user_id = None
+    # Create one access log entry per face (written in bulk by the log sink)
+    faces = []
+    entries = []
+    now = datetime.utcnow()
+    for face in results:
+        user_name = "Unknown"
+        user_id = face["user_id"]
 
-    if result["status"] == "PASS" and result["user_id"]:
-        user = db.query(User).filter(User.id == result["user_id"]).first()
-        if user:
-            user_name = user.name
-            user_id = user.id
+        if user_id is not None:
+            user_name = face["name"] or user_names.get(user_id, "Unknown")
+        if face["status"] == "PASS":
             logger.info(f"✓ User recognized: {user_name} (ID: {user_id})")
-    elif result["status"] == "REJECT":
-        logger.info("✗ Unknown person rejected")
-    elif result["status"] == "NO_FACE":
-        logger.info("⚠ No face detected in image")
-
-    # Create access log
-    log_entry = AccessLog(
-        user_id=user_id,
-        user_name=user_name,
-        status=result["status"],
-        confidence=result.get("confidence"),
-        snapshot_path=snapshot_path,
-        timestamp=datetime.utcnow()
-    )
-    db.add(log_entry)
-    db.commit()
-    logger.info(f"Access log created: {result['status']}")
+        elif face["status"] == "REJECT" and user_id is not None:
+            logger.info(f"✗ Disabled user rejected: {user_name} (ID: {user_id})")
+        elif face["status"] == "REJECT":
+            logger.info("✗ Unknown person rejected")
+        elif face["status"] == "NO_FACE":
+            logger.info("⚠ No face detected in image")
+
+        faces.append(FaceResult(
+            status=face["status"],
+            name=user_name if face["status"] == "PASS" else None,
+            box=face.get("box"),
+            confidence=face.get("confidence"),
+            track_id=face.get("track_id")
+        ))
+        if not face.get("log", True):
+            continue
+        entries.append({
+            "user_id": user_id,
+            "user_name": user_name,
+            "status": face["status"],
+            "confidence": face.get("confidence"),
+            "snapshot_path": snapshot_path,
+            "timestamp": now
+        })
+    get_access_log_sink().add(entries)
+    logger.info(f"Access log queued: {len(entries)} entr{'y' if len(entries) == 1 else 'ies'}")
 
     # Return response
-    logger.info(f"Recognition complete. Returning response: {result['status']}")
+    logger.info(f"Recognition complete. Returning response: {faces[0].status}")
+    primary = faces[0]
     return RecognizeResponse(
-        status=result["status"],
-        name=user_name if result["status"] == "PASS" else None,
-        box=result.get("box"),
-        confidence=result.get("confidence"),
-        snapshot_path=snapshot_path
+        status=primary.status,
+        name=primary.name,
+        box=primary.box,
+        confidence=primary.confidence,
+        snapshot_path=snapshot_path,
+        track_id=primary.track_id,
+        faces=faces if multi else None
     )
@@ -2,19 +2,27 @@
 User management API endpoints.
 """
 import os
-import json
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
 from PIL import Image
 import io
 import numpy as np
 
-from database import get_db, User
+from database import get_async_db, get_db, User, UserTemplate
+from core.enrolment import (
+    DEFAULT_NAMES_FILE, DirectorySource, get_bulk_enroller, parse_names
+)
 from core.face_engine import get_face_engine
-from utils.image_utils import save_image
+from core.inference_pool import PoolSaturatedError, get_inference_pool
+from core.settings import Settings
+from utils.image_utils import crop_face, save_image
+from utils.feature_codec import feature_columns
 from utils.file_utils import generate_unique_filename
 
 router = APIRouter()
@@ -25,11 +33,65 @@ class UserResponse(BaseModel):
     id: int
     name: str
     avatar_path: str
+    enabled: bool = True
     
     class Config:
         from_attributes = True
 
 
+class UserUpdateRequest(BaseModel):
+    """Request model for updating a user."""
+    name: str | None = None
+    enabled: bool | None = None
+
+
+class TemplateResponse(BaseModel):
+    """Response model for an extra face template."""
+    id: int
+    user_id: int
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class EnrolmentItemError(BaseModel):
+    """A photo that a bulk enrolment could not enrol."""
+    filename: str
+    name: str
+    error: str
+
+
+class EnrolmentJobResponse(BaseModel):
+    """Status of a bulk enrolment job."""
+    job_id: str
+    state: str
+    source: str
+    total: int
+    processed: int
+    enrolled: int
+    failed: int
+    errors: List[EnrolmentItemError]
+    error: Optional[str] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+
+def _extract_enrolment_feature(engine, image: Image.Image) -> Optional[np.ndarray]:
+    """
+    Detect the largest face in an enrolment photo and extract its features.
+
+    Returns:
+        Feature vector, or None if no face was detected
+    """
+    boxes = engine.detect_faces(image)
+    if not boxes:
+        return None
+    largest_box = max(boxes, key=lambda b: b[2] * b[3])
+    return engine.extract_features(crop_face(image, largest_box))
+
+
 @router.post("/api/users", response_model=UserResponse)
 async def create_user(
     name: str = Form(...),
@@ -53,27 +115,20 @@ async def create_user(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
     
-    # Extract face features
+    # Extract face features (on the inference pool, off the event loop)
     try:
-        # Detect face
-        boxes = engine.detect_faces(image)
-        if not boxes:
-            raise HTTPException(status_code=400, detail="No face detected in photo")
-        
-        # Use largest face
-        from utils.image_utils import crop_face
-        largest_box = max(boxes, key=lambda b: b[2] * b[3])
-        face_img = crop_face(image, largest_box)
-        
-        # Extract features
-        feature_vector = engine.extract_features(face_img)
-        
+        feature_vector = await get_inference_pool().run(_extract_enrolment_feature, engine, image)
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except RuntimeError as e:
         # Model not loaded
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Feature extraction failed: {str(e)}")
     
+    if feature_vector is None:
+        raise HTTPException(status_code=400, detail="No face detected in photo")
+    
     # Save avatar
     try:
         avatar_filename = generate_unique_filename(prefix=f"user_{name}", extension="jpg")
@@ -84,12 +139,9 @@ async def create_user(
     
     # Create user in database
     try:
-        # Serialize feature vector to JSON
-        feature_json = json.dumps(feature_vector.tolist())
-        
         new_user = User(
             name=name,
-            feature_vector=feature_json,
+            **feature_columns(feature_vector),
             avatar_path=avatar_path,
             created_at=datetime.utcnow()
         )
@@ -98,13 +150,18 @@ async def create_user(
         db.commit()
         db.refresh(new_user)
         
-        # Add to in-memory database
-        engine.add_user_to_database(new_user.id, feature_vector)
+        # Add to in-memory database; the snapshot publish and index save
+        # touch the disk, so they run off the event loop
+        await run_in_threadpool(
+            engine.add_user_to_database, new_user.id, feature_vector,
+            name=new_user.name, avatar_path=new_user.avatar_path, enabled=new_user.enabled
+        )
         
         return UserResponse(
             id=new_user.id,
             name=new_user.name,
-            avatar_path=new_user.avatar_path
+            avatar_path=new_user.avatar_path,
+            enabled=new_user.enabled
         )
     except Exception as e:
         db.rollback()
@@ -114,13 +171,107 @@ async def create_user(
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
+@router.post("/api/users/bulk", response_model=EnrolmentJobResponse, status_code=202)
+async def bulk_enrol_users(
+    archive: Optional[UploadFile] = File(None),
+    directory: Optional[str] = Form(None),
+    names: Optional[UploadFile] = File(None),
+):
+    """
+    Start a bulk enrolment job; poll its status with GET /api/users/bulk/{job_id}.
+    
+    Args:
+        archive: Zip archive of photos
+        directory: Server-side photo directory, relative to FACEGUARD_ENROL_IMPORT_DIR
+        names: CSV with ``filename`` and ``name`` columns (default: names.csv
+            in the archive or directory)
+    """
+    if (archive is None) == (not directory):
+        raise HTTPException(status_code=400, detail="Provide either an archive or a directory")
+    
+    enroller = get_bulk_enroller()
+    try:
+        if archive is not None:
+            source = await run_in_threadpool(enroller.save_upload, archive.file)
+        else:
+            source = DirectorySource(Settings.ENROL_IMPORT_DIR, directory)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        if names is not None:
+            rows = parse_names(await names.read())
+        else:
+            rows = parse_names(await run_in_threadpool(source.read, DEFAULT_NAMES_FILE))
+    except (KeyError, OSError):
+        source.close()
+        raise HTTPException(status_code=400, detail=f"No names CSV uploaded and no {DEFAULT_NAMES_FILE} found")
+    except ValueError as e:
+        source.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return enroller.submit(source, rows).status()
+
+
+@router.get("/api/users/bulk/{job_id}", response_model=EnrolmentJobResponse)
+async def get_bulk_enrolment(job_id: str):
+    """
+    Get the progress and per-photo errors of a bulk enrolment job.
+    
+    Args:
+        job_id: ID returned when the job was started
+    """
+    status = get_bulk_enroller().status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Enrolment job not found")
+    return status
+
+
 @router.get("/api/users", response_model=List[UserResponse])
-async def list_users(db: Session = Depends(get_db)):
+async def list_users(db: AsyncSession = Depends(get_async_db)):
     """
     Get list of all registered users.
     """
-    users = db.query(User).all()
-    return [UserResponse(id=u.id, name=u.name, avatar_path=u.avatar_path) for u in users]
+    # Only the listed columns; feature vectors are not needed here
+    users = (await db.execute(select(User.id, User.name, User.avatar_path, User.enabled))).all()
+    return [
+        UserResponse(id=u.id, name=u.name, avatar_path=u.avatar_path, enabled=u.enabled)
+        for u in users
+    ]
+
+
+@router.patch("/api/users/{user_id}", response_model=UserResponse)
+async def update_user(user_id: int, request: UserUpdateRequest, db: Session = Depends(get_db)):
+    """
+    Rename a user or enable/disable their access.
+    
+    Args:
+        user_id: ID of user to update
+        request: Fields to change
+    """
+    user = db.query(User).filter(User.id == user_id).first()
+    
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    if request.name is not None:
+        if not request.name.strip():
+            raise HTTPException(status_code=400, detail="name must not be empty")
+        user.name = request.name
+    if request.enabled is not None:
+        user.enabled = request.enabled
+    db.commit()
+    
+    # Publish the new identity metadata to every worker's gallery
+    await run_in_threadpool(get_face_engine().update_identity, user_id,
+                            name=user.name, enabled=user.enabled)
+    
+    return UserResponse(
+        id=user.id,
+        name=user.name,
+        avatar_path=user.avatar_path,
+        enabled=user.enabled
+    )
 
 
 @router.delete("/api/users/{user_id}")
@@ -145,11 +296,90 @@ async def delete_user(user_id: int, db: Session = Depends(get_db)):
         print(f"⚠ Failed to delete avatar: {e}")
     
     # Delete from database
+    db.query(UserTemplate).filter(UserTemplate.user_id == user_id).delete(synchronize_session=False)
     db.delete(user)
     db.commit()
     
     # Remove from in-memory database
     engine = get_face_engine()
-    engine.remove_user_from_database(user_id)
+    await run_in_threadpool(engine.remove_user_from_database, user_id)
     
     return {"detail": "User deleted successfully"}
+
+
+@router.get("/api/users/{user_id}/templates", response_model=List[TemplateResponse])
+async def list_templates(user_id: int, db: Session = Depends(get_db)):
+    """
+    List a user's extra face templates.
+    
+    Args:
+        user_id: ID of the user
+    """
+    if db.query(User.id).filter(User.id == user_id).first() is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db.query(UserTemplate.id, UserTemplate.user_id, UserTemplate.created_at) \
+        .filter(UserTemplate.user_id == user_id).order_by(UserTemplate.id).all()
+
+
+@router.post("/api/users/{user_id}/templates", response_model=TemplateResponse)
+async def add_template(user_id: int, photo: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    Add a face template to a user from another photo (e.g. with glasses).
+    
+    Args:
+        user_id: ID of the user
+        photo: Facial photo of the user
+    """
+    if db.query(User.id).filter(User.id == user_id).first() is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    engine = get_face_engine()
+    try:
+        image = Image.open(io.BytesIO(await photo.read())).convert("RGB")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+    
+    try:
+        feature_vector = await get_inference_pool().run(_extract_enrolment_feature, engine, image)
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Feature extraction failed: {str(e)}")
+    
+    if feature_vector is None:
+        raise HTTPException(status_code=400, detail="No face detected in photo")
+    
+    template = UserTemplate(user_id=user_id, **feature_columns(feature_vector), created_at=datetime.utcnow())
+    db.add(template)
+    db.commit()
+    db.refresh(template)
+    
+    await run_in_threadpool(engine.add_template, user_id, template.id, feature_vector)
+    
+    return template
+
+
+@router.delete("/api/users/{user_id}/templates/{template_id}")
+async def delete_template(user_id: int, template_id: int, db: Session = Depends(get_db)):
+    """
+    Delete one of a user's extra face templates.
+    
+    Args:
+        user_id: ID of the user
+        template_id: ID of the template
+    """
+    template = db.query(UserTemplate).filter(
+        UserTemplate.id == template_id, UserTemplate.user_id == user_id
+    ).first()
+    
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    db.delete(template)
+    db.commit()
+    
+    await run_in_threadpool(get_face_engine().remove_template, template_id)
+    
+    return {"detail": "Template deleted successfully"}
@@ -0,0 +1,82 @@
+"""
+Access log sink behaviour when the database rejects or cannot take a batch.
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from core.access_log_sink import AccessLogSink
+from database import AccessLog
+
+
+class FakeSession:
+    """Session stand-in recording inserted entries, failing on demand."""
+
+    def __init__(self, database: "FakeDatabase"):
+        self.database = database
+        self.rows = []
+
+    def execute(self, statement, params=None):
+        if self.database.unavailable:
+            self.database.attempts += 1
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        if getattr(getattr(statement, "table", None), "name", None) == AccessLog.__tablename__:
+            if any(entry["status"] is None for entry in params):
+                raise IntegrityError("INSERT", {}, Exception("NOT NULL constraint failed"))
+            self.rows.extend(params)
+
+    def commit(self):
+        self.database.rows.extend(self.rows)
+
+    def rollback(self):
+        self.rows = []
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.unavailable = False
+        self.attempts = 0
+        self.rows = []
+
+    def session(self) -> FakeSession:
+        return FakeSession(self)
+
+
+def _entry(name: str, status: str = "PASS") -> dict:
+    return {"user_id": None, "user_name": name, "status": status, "confidence": 0.9,
+            "snapshot_path": None, "timestamp": datetime.utcnow()}
+
+
+def test_invalid_entries_are_dropped_and_the_rest_written():
+    database = FakeDatabase()
+    sink = AccessLogSink(session_factory=database.session, flush_size=1000)
+    sink.add([_entry("a"), _entry("b", status=None), _entry("c"), _entry("d", status=None)])
+
+    assert sink.flush() == 2
+    assert [row["user_name"] for row in database.rows] == ["a", "c"]
+    assert sink.stats()["rejected"] == 2
+    assert sink.stats()["pending"] == 0
+
+
+def test_unavailable_database_backs_off_and_keeps_entries():
+    database = FakeDatabase()
+    database.unavailable = True
+    sink = AccessLogSink(session_factory=database.session, flush_size=1, flush_interval_ms=20)
+    sink.add([_entry("a"), _entry("b")])
+
+    time.sleep(0.5)
+    # Waits of 20, 40, 80, 160 ms... allow a handful of attempts, not a spin
+    assert 2 <= database.attempts <= 8
+    assert sink.stats()["pending"] == 2
+
+    database.unavailable = False
+    deadline = time.monotonic() + 5
+    while database.rows == [] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    sink.close()
+    assert [row["user_name"] for row in database.rows] == ["a", "b"]
+    assert sink.stats()["pending"] == 0
@@ -0,0 +1,72 @@
+"""
+HNSW index with gallery template keys (user IDs and negated template IDs).
+"""
+import numpy as np
+import pytest
+
+from core.gallery import FaceGallery
+
+pytest.importorskip("hnswlib")
+from core.ann_index import HNSWIndex  # noqa: E402
+
+DIM = 16
+
+
+def _vectors(n: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def gallery() -> FaceGallery:
+    # Users 1..3 with extra templates 7 and 8 (keys -7, -8) of user 2
+    gallery = FaceGallery(dim=DIM)
+    gallery.load([1, 2, 3, -7, -8], _vectors(5), owners=[1, 2, 3, 2, 2])
+    return gallery
+
+
+def test_search_returns_template_keys(gallery):
+    index = HNSWIndex(dim=DIM)
+    index.build(gallery.ids.copy(), gallery.matrix)
+
+    for key, vector in zip(gallery.ids, gallery.matrix):
+        best, similarity = index.search(vector, 1)[0]
+        assert best == key
+        assert similarity == pytest.approx(1.0, abs=1e-5)
+
+
+def test_add_and_remove_negative_keys(gallery):
+    index = HNSWIndex(dim=DIM)
+    index.build(gallery.ids.copy(), gallery.matrix)
+    vector = _vectors(1, seed=1)[0]
+
+    index.add(-9, vector)
+    assert index.search(vector, 1)[0][0] == -9
+    # Replacing a key keeps a single entry for it
+    index.add(-9, vector)
+    assert len(index) == 6
+
+    index.remove(-7)
+    index.remove(-9)
+    keys = {key for key, _ in index.search(vector, len(index))}
+    assert keys == {1, 2, 3, -8}
+
+
+def test_save_and_load(gallery, tmp_path):
+    index = HNSWIndex(dim=DIM)
+    index.build(gallery.ids.copy(), gallery.matrix)
+    index.remove(-7)
+    index.add(-7, gallery.get(-7))
+    path = tmp_path / "gallery_hnsw.idx"
+    index.save(path)
+
+    loaded = HNSWIndex(dim=DIM)
+    assert loaded.load(path, gallery)
+    for key, vector in zip(gallery.ids, gallery.matrix):
+        assert loaded.search(vector, 1)[0][0] == key
+
+    # New keys after a reload must not reuse a stored label
+    vector = _vectors(1, seed=2)[0]
+    loaded.add(-10, vector)
+    assert loaded.search(vector, 1)[0][0] == -10
+    assert len(loaded) == 6
@@ -0,0 +1,130 @@
+"""
+FaceGallery against a brute-force reference, with and without centroids.
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pytest
+
+from core.gallery import FaceGallery
+
+DIM = 8
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    return vector / np.linalg.norm(vector)
+
+
+def _reference(templates: Dict[int, Tuple[int, np.ndarray]], query: np.ndarray, k: int,
+               use_centroids: bool) -> List[Tuple[int, float]]:
+    """Best template (or centroid of several) per identity, top ``k`` first."""
+    query = _normalize(query)
+    by_owner: Dict[int, List[np.ndarray]] = {}
+    for owner, vector in templates.values():
+        by_owner.setdefault(owner, []).append(_normalize(vector))
+    scores = {}
+    for owner, vectors in by_owner.items():
+        score = max(float(v @ query) for v in vectors)
+        if use_centroids and len(vectors) > 1:
+            score = max(score, float(_normalize(np.mean(vectors, axis=0)) @ query))
+        scores[owner] = score
+    return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+def _assert_matches(actual: List[Tuple[int, float]], expected: List[Tuple[int, float]]):
+    assert [uid for uid, _ in actual] == [uid for uid, _ in expected]
+    assert [score for _, score in actual] == pytest.approx([score for _, score in expected], abs=1e-5)
+
+
+@pytest.mark.parametrize("use_centroids", [False, True])
+def test_random_updates_match_brute_force(use_centroids):
+    # Non-negative vectors keep similarities inside (0, 1], where no clipping happens
+    rng = np.random.default_rng(7)
+    gallery = FaceGallery(dim=DIM, initial_capacity=4, use_centroids=use_centroids)
+    templates: Dict[int, Tuple[int, np.ndarray]] = {}
+    next_template = 1
+
+    for step in range(400):
+        action = rng.random()
+        owners = sorted({owner for owner, _ in templates.values()})
+        if action < 0.35 or not templates:
+            # New user, keyed by their ID
+            user_id = int(rng.integers(1, 60))
+            if user_id not in templates and user_id not in owners:
+                vector = rng.random(DIM)
+                gallery.add(user_id, vector)
+                templates[user_id] = (user_id, vector)
+        elif action < 0.65:
+            # Extra template of an existing user, keyed by a negative ID
+            owner = int(rng.choice(owners))
+            vector = rng.random(DIM)
+            gallery.add(-next_template, vector, owner=owner)
+            templates[-next_template] = (owner, vector)
+            next_template += 1
+        elif action < 0.75:
+            # Replace a template's vector
+            key = int(rng.choice(list(templates)))
+            vector = rng.random(DIM)
+            gallery.add(key, vector, owner=templates[key][0])
+            templates[key] = (templates[key][0], vector)
+        elif action < 0.92:
+            key = int(rng.choice(list(templates)))
+            assert gallery.remove(key)
+            del templates[key]
+        else:
+            owner = int(rng.choice(owners))
+            removed = gallery.remove_owner(owner)
+            assert sorted(removed) == sorted(k for k, (o, _) in templates.items() if o == owner)
+            templates = {k: t for k, t in templates.items() if t[0] != owner}
+
+        assert len(gallery) == len(templates)
+        assert sorted(gallery.ids.tolist()) == sorted(templates)
+        if not templates:
+            assert gallery.search(rng.random(DIM), 3) == []
+            continue
+
+        queries = rng.random((3, DIM))
+        batch = gallery.search_batch(queries, 3)
+        for query, batch_result in zip(queries, batch):
+            expected = _reference(templates, query, 3, use_centroids)
+            _assert_matches(gallery.search(query, 3), expected)
+            _assert_matches(batch_result, expected)
+            # Re-ranking every template is the same as an exact search
+            _assert_matches(gallery.rerank(list(templates), query, 3), expected)
+
+
+@pytest.mark.parametrize("use_centroids", [False, True])
+def test_rerank_scores_only_candidates(use_centroids):
+    rng = np.random.default_rng(3)
+    gallery = FaceGallery(dim=DIM, use_centroids=use_centroids)
+    templates = {1: (1, rng.random(DIM)), 2: (2, rng.random(DIM)),
+                 -1: (1, rng.random(DIM)), -2: (1, rng.random(DIM)), -3: (2, rng.random(DIM))}
+    for key, (owner, vector) in templates.items():
+        gallery.add(key, vector, owner=owner)
+
+    query = rng.random(DIM)
+    candidates = [1, -3, 99]  # 99 is unknown and ignored
+    result = gallery.rerank(candidates, query, 2)
+
+    expected = {}
+    for key in (1, -3):
+        owner, vector = templates[key]
+        expected[owner] = max(expected.get(owner, -1.0), float(_normalize(vector) @ _normalize(query)))
+    if use_centroids:
+        # Candidate identities with several templates also score their centroid
+        for owner in list(expected):
+            vectors = [_normalize(v) for o, v in templates.values() if o == owner]
+            centroid = _normalize(np.mean(vectors, axis=0))
+            expected[owner] = max(expected[owner], float(centroid @ _normalize(query)))
+    _assert_matches(result, sorted(expected.items(), key=lambda item: -item[1]))
+
+
+def test_identity_matches_reduces_templates_to_users():
+    gallery = FaceGallery(dim=DIM)
+    rng = np.random.default_rng(5)
+    gallery.add(1, rng.random(DIM))
+    gallery.add(-4, rng.random(DIM), owner=1)
+    gallery.add(2, rng.random(DIM))
+
+    matches = gallery.identity_matches([(-4, 0.9), (2, 0.8), (1, 0.7), (42, 0.99)], k=2)
+    assert matches == [(1, pytest.approx(0.9)), (2, pytest.approx(0.8))]
@@ -0,0 +1,76 @@
+"""
+Keyset pagination of /api/logs when entries share a timestamp.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from database import AccessLog, Base, get_async_db
+from routes import logs
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "logs.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+
+    # Timestamps repeat, so the id has to break ties at page boundaries
+    base = datetime(2024, 5, 1, 12, 0, 0)
+    timestamps = [base] * 5 + [base + timedelta(seconds=1)] * 4 + [base - timedelta(seconds=1)] * 3
+    with Session(engine) as db:
+        db.add_all([
+            AccessLog(user_name=f"user{i}", status="PASS", confidence=0.9, timestamp=timestamp)
+            for i, timestamp in enumerate(timestamps)
+        ])
+        db.commit()
+    engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def override():
+        async with sessions() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(logs.router)
+    app.dependency_overrides[get_async_db] = override
+    with TestClient(app) as client:
+        yield client
+
+
+def _expected_order(client) -> list:
+    items = client.get("/api/logs", params={"size": 100}).json()["items"]
+    rows = [(item["timestamp"], item["id"]) for item in items]
+    assert rows == sorted(rows, reverse=True)
+    return [item["id"] for item in items]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5])
+def test_cursor_pages_cover_every_entry_once(client, size):
+    expected = _expected_order(client)
+    assert len(expected) == 12
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"size": size}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get("/api/logs", params=params).json()
+        seen.extend(item["id"] for item in response["items"])
+        cursor = response["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == expected
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/api/logs", params={"cursor": "not-a-cursor"}).status_code == 400
@@ -0,0 +1,72 @@
+"""
+Retention purge: snapshot files follow their log rows, never precede them.
+"""
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+
+from core.retention import RetentionJob, RetentionPolicy
+from database import AccessLog, Base
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setattr("core.retention.CHUNK_PAUSE_SECONDS", 0)
+    engine = create_engine(f"sqlite:///{tmp_path / 'logs.db'}")
+    Base.metadata.create_all(engine)
+    snapshot_dir = tmp_path / "snapshots"
+    snapshot_dir.mkdir()
+
+    old = datetime.utcnow() - timedelta(days=30)
+    with Session(engine) as db:
+        for i in range(5):
+            path = snapshot_dir / f"snapshot_{i}.jpg"
+            path.write_bytes(b"jpeg")
+            db.add(AccessLog(user_name=f"user{i}", status="PASS", confidence=0.9,
+                             timestamp=old, snapshot_path=str(path)))
+        db.commit()
+
+    policy = RetentionPolicy(max_age_days=7, chunk_size=2, archive_dir=str(tmp_path / "archive"))
+    yield engine, sessionmaker(engine), policy, snapshot_dir
+    engine.dispose()
+
+
+def _count(engine) -> int:
+    with Session(engine) as db:
+        return db.scalar(select(func.count()).select_from(AccessLog))
+
+
+def test_purge_archives_deleted_rows(setup):
+    engine, sessions, policy, snapshot_dir = setup
+    job = RetentionJob(policy, session_factory=sessions, snapshot_dir=str(snapshot_dir))
+
+    assert job._purge_rows() == 5
+    assert _count(engine) == 0
+    assert list(snapshot_dir.iterdir()) == []
+    archived = set()
+    for archive in policy.archive_dir.iterdir():
+        with zipfile.ZipFile(archive) as zf:
+            archived.update(zf.namelist())
+    assert archived == {f"snapshot_{i}.jpg" for i in range(5)}
+
+
+def test_failed_commit_keeps_snapshots(setup):
+    engine, sessions, policy, snapshot_dir = setup
+
+    class FailingSession(Session):
+        def commit(self):
+            raise OperationalError("COMMIT", {}, Exception("database is locked"))
+
+    job = RetentionJob(policy, session_factory=sessionmaker(engine, class_=FailingSession),
+                       snapshot_dir=str(snapshot_dir))
+    with pytest.raises(OperationalError):
+        job._purge_rows()
+
+    # Rows survive the rollback, and so do the files they point at
+    assert _count(engine) == 5
+    assert len(list(snapshot_dir.iterdir())) == 5
+    assert not policy.archive_dir.exists()
@@ -0,0 +1,85 @@
+"""
+FaceTracker IoU association across frames.
+"""
+import pytest
+
+from core import tracker as tracker_module
+from core.tracker import FaceTracker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the tracker module."""
+    now = [100.0]
+    monkeypatch.setattr(tracker_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_moving_face_keeps_its_track(clock):
+    tracker = FaceTracker(iou_threshold=0.3)
+    first = tracker.associate([[100, 100, 50, 50]])[0]
+
+    clock[0] += 0.1
+    second = tracker.associate([[105, 102, 50, 50]])[0]
+
+    assert second is first
+    assert second.box == [105, 102, 50, 50]
+
+
+def test_distant_face_starts_new_track(clock):
+    tracker = FaceTracker(iou_threshold=0.3)
+    first = tracker.associate([[100, 100, 50, 50]])[0]
+
+    clock[0] += 0.1
+    # Overlaps the old box, but with IoU below the threshold
+    second = tracker.associate([[140, 100, 50, 50]])[0]
+
+    assert second is not first
+    assert second.track_id != first.track_id
+    assert len(tracker.tracks) == 2
+
+
+def test_boxes_follow_their_tracks_regardless_of_order(clock):
+    tracker = FaceTracker(iou_threshold=0.3)
+    left, right = tracker.associate([[0, 0, 40, 40], [200, 0, 40, 40]])
+
+    clock[0] += 0.1
+    swapped = tracker.associate([[202, 1, 40, 40], [2, 1, 40, 40]])
+
+    assert swapped == [right, left]
+
+
+def test_each_track_takes_at_most_one_box(clock):
+    tracker = FaceTracker(iou_threshold=0.3)
+    track = tracker.associate([[100, 100, 50, 50]])[0]
+
+    clock[0] += 0.1
+    # Both overlap the track; the better overlap keeps it
+    near, nearer = tracker.associate([[110, 100, 50, 50], [102, 100, 50, 50]])
+
+    assert nearer is track
+    assert near is not track
+
+
+def test_unseen_track_expires(clock):
+    tracker = FaceTracker(iou_threshold=0.3, max_age_s=1.0)
+    first = tracker.associate([[100, 100, 50, 50]])[0]
+
+    clock[0] += 1.5
+    second = tracker.associate([[100, 100, 50, 50]])[0]
+
+    assert second is not first
+    assert tracker.tracks == [second]
+
+
+def test_keep_alive_extends_tracks(clock):
+    tracker = FaceTracker(iou_threshold=0.3, max_age_s=1.0)
+    first = tracker.associate([[100, 100, 50, 50]])[0]
+
+    # Skipped (unchanged) frames keep the visit going
+    for _ in range(3):
+        clock[0] += 0.8
+        tracker.keep_alive()
+    clock[0] += 0.8
+
+    assert tracker.associate([[100, 100, 50, 50]])[0] is first
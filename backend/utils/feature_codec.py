@@ -0,0 +1,68 @@
+"""
+Binary encoding of face feature vectors for database storage.
+"""
+from typing import Any, Dict, List
+import numpy as np
+
+# Embedding layout written for new rows
+FEATURE_DIM = 512
+FEATURE_DTYPE = "float32"  # "float32" or "float16"
+
+# Identifies the model that produced an embedding; vectors from different
+# models are not comparable and are skipped when loading the gallery
+FEATURE_MODEL_VERSION = "arcface-r100"
+
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def encode_feature(vector: np.ndarray, dtype: str = FEATURE_DTYPE) -> bytes:
+    """
+    Encode a feature vector as raw little-endian bytes.
+
+    Args:
+        vector: 1-D feature vector
+        dtype: Storage dtype ("float32" or "float16")
+
+    Returns:
+        Raw bytes of length dim * itemsize
+    """
+    return np.asarray(vector, dtype=np.dtype(dtype).newbyteorder("<")).tobytes()
+
+
+def feature_columns(vector: np.ndarray, dtype: str = FEATURE_DTYPE) -> Dict[str, Any]:
+    """
+    Build the feature-related column values for a User row.
+
+    Args:
+        vector: 1-D feature vector
+        dtype: Storage dtype
+
+    Returns:
+        Dictionary with feature_vector, feature_dim, feature_dtype and
+        model_version
+    """
+    return {
+        "feature_vector": encode_feature(vector, dtype),
+        "feature_dim": int(np.asarray(vector).shape[-1]),
+        "feature_dtype": dtype,
+        "model_version": FEATURE_MODEL_VERSION,
+    }
+
+
+def decode_features(blobs: List[bytes], dim: int, dtype: str = FEATURE_DTYPE) -> np.ndarray:
+    """
+    Decode many feature blobs in a single ``np.frombuffer`` pass.
+
+    Args:
+        blobs: Raw feature bytes, all with the same dim and dtype
+        dim: Feature dimension
+        dtype: Storage dtype of the blobs
+
+    Returns:
+        float32 array of shape (len(blobs), dim)
+    """
+    if not blobs:
+        return np.zeros((0, dim), dtype=np.float32)
+    buffer = b"".join(blobs)
+    matrix = np.frombuffer(buffer, dtype=np.dtype(dtype).newbyteorder("<"))
+    return matrix.reshape(len(blobs), dim).astype(np.float32)
@@ -12,7 +12,8 @@ def ensure_directories():
     directories = [
         "static/avatars",
         "static/logs",
-        "models"
+        "models",
+        "data"
     ]
     
     for directory in directories:
@@ -3,7 +3,8 @@ Image processing utilities for face recognition system.
 """
 import base64
 import io
-from typing import Tuple, List
+import math
+from typing import Dict, Tuple, List, Optional
 from PIL import Image
 import numpy as np
 
@@ -18,13 +19,25 @@ def decode_base64_image(base64_string: str) -> Image.Image:
     Returns:
         PIL Image object
     """
+    image = Image.open(io.BytesIO(decode_base64_bytes(base64_string)))
+    return image.convert("RGB")
+
+
+def decode_base64_bytes(base64_string: str) -> bytes:
+    """
+    Decode a base64 string (optionally a data URL) to raw file bytes.
+    
+    Args:
+        base64_string: Base64 encoded image string
+        
+    Returns:
+        Encoded image bytes
+    """
     # Remove data URL prefix if present
     if "," in base64_string:
         base64_string = base64_string.split(",")[1]
     
-    image_data = base64.b64decode(base64_string)
-    image = Image.open(io.BytesIO(image_data))
-    return image.convert("RGB")
+    return base64.b64decode(base64_string)
 
 
 def save_image(image: Image.Image, filepath: str) -> None:
@@ -103,3 +116,96 @@ def numpy_to_pil(array: np.ndarray) -> Image.Image:
         PIL Image object
     """
     return Image.fromarray(array.astype('uint8'), 'RGB')
+
+
+class FrameImage:
+    """
+    An encoded camera frame, decoded lazily at the resolution each stage needs.
+
+    JPEG frames are decoded with DCT-domain scaling (PIL draft mode) at the
+    smallest of the 1/1, 1/2, 1/4 and 1/8 scales that still covers the
+    requested size, so detection on a 1080p or 4K snapshot decodes a few
+    hundred pixels across instead of the full frame. Face crops are taken
+    from a decode just large enough for the recognizer. Other formats are
+    decoded once at full resolution.
+
+    Boxes are always in full-resolution coordinates.
+    """
+
+    def __init__(self, data: bytes):
+        """
+        Read the image header.
+
+        Args:
+            data: Encoded image bytes
+
+        Raises:
+            OSError: If the data is not a readable image
+        """
+        self.data = data
+        with Image.open(io.BytesIO(data)) as probe:
+            self.format = probe.format
+            self.size: Tuple[int, int] = probe.size
+        # Decoded RGB images by their decoded size
+        self._decoded: Dict[Tuple[int, int], Image.Image] = {}
+
+    @classmethod
+    def from_base64(cls, base64_string: str) -> "FrameImage":
+        """Create a frame from a base64 string (optionally a data URL)."""
+        return cls(decode_base64_bytes(base64_string))
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    @property
+    def is_jpeg(self) -> bool:
+        return self.format == "JPEG"
+
+    def decode(self, min_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+        """
+        Decode the frame to RGB, reduced as far as the format allows.
+
+        Args:
+            min_size: Smallest acceptable (width, height); None for full
+                resolution
+
+        Returns:
+            PIL Image at least ``min_size`` (or the full size)
+        """
+        image = Image.open(io.BytesIO(self.data))
+        if min_size is not None and self.is_jpeg:
+            image.draft("RGB", tuple(min_size))
+        decoded = self._decoded.get(image.size)
+        if decoded is None:
+            decoded = image.convert("RGB")
+            self._decoded[decoded.size] = decoded
+        return decoded
+
+    def to_image(self) -> Image.Image:
+        """Full-resolution RGB image."""
+        return self.decode()
+
+    def crop(self, box: List[float], min_side: int = 112) -> Image.Image:
+        """
+        Crop a face region from a decode in which it spans at least ``min_side`` pixels.
+
+        Args:
+            box: Bounding box [x, y, width, height] in full-resolution coordinates
+            min_side: Smallest acceptable crop width and height (clipped to
+                the full resolution)
+
+        Returns:
+            Cropped PIL Image
+        """
+        x, y, w, h = box
+        scale = min(1.0, min_side / max(1.0, min(w, h)))
+        full_w, full_h = self.size
+        image = self.decode((math.ceil(full_w * scale), math.ceil(full_h * scale)))
+        sx = image.width / full_w
+        sy = image.height / full_h
+        return crop_face(image, [x * sx, y * sy, w * sx, h * sy])
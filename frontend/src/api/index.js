@@ -33,6 +33,19 @@ export const recognizeFace = (formData) => api.post('/recognize', formData);
 export const getUsers = () => api.get('/users');
 export const addUser = (formData) => api.post('/users', formData);
 export const deleteUser = (id) => api.delete(`/users/${id}`);
+export const updateUser = (id, updates) => api.patch(`/users/${id}`, updates);
+export const getUserTemplates = (id) => api.get(`/users/${id}/templates`);
+export const addUserTemplate = (id, formData) => api.post(`/users/${id}/templates`, formData);
+export const deleteUserTemplate = (id, templateId) => api.delete(`/users/${id}/templates/${templateId}`);
+// Bulk enrolment: zip archive (or server directory) plus names CSV; returns a job to poll
+export const bulkEnrolUsers = (formData) => api.post('/users/bulk', formData, { timeout: 0 });
+export const getEnrolmentJob = (jobId) => api.get(`/users/bulk/${jobId}`);
 export const getLogs = (params) => api.get('/logs', { params });
 export const getConfig = () => api.get('/config');
 export const updateConfig = (config) => api.put('/config', config);
+
+// Live camera stream: send JPEG blobs, receive recognition results as JSON
+export const openRecognitionStream = () => {
+  const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+  return new WebSocket(`${protocol}://${window.location.host}/ws/recognize`);
+};